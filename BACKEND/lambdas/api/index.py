@@ -1,30 +1,137 @@
-import json
+import base64
+import binascii
+import hashlib
 import os
+import sys
 
 import boto3
 
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from shared import lunch_pages  # noqa: E402
+from shared import ttl_cache  # noqa: E402
 
 ddb = boto3.resource("dynamodb")
+DEFAULT_PAGE_LIMIT = 100
+# Seconds a cached response stays valid. Only /lunch is routed to this Lambda
+# in the stack; the /restaurants routes are DynamoDB integrations in API
+# Gateway. Week-scoped routes are also keyed on the week version written by
+# import_to_ddb, so new menus show up as soon as the version stamp is re-read
+# (VERSION_TTL).
+ROUTE_TTLS = {
+    "/lunch/{city}/{week}/{day}": 600,
+}
+VERSION_TTL = 30
+_CACHE = ttl_cache.TTLCache(int(os.environ.get("API_CACHE_MAX_ENTRIES", "256")))
+_VERSIONS = ttl_cache.TTLCache(64)
 
 
-def response(status_code: int, body):
-    return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps(body),
+def response(status_code: int, body, headers: dict | None = None, event: dict | None = None):
+    """Build an API Gateway proxy response.
+
+    200 responses get an ETag (a hash of the body unless one is passed in).
+    When event carries a matching If-None-Match, a 304 is returned instead.
+    """
+    body_text = lunch_pages.dumps(body) if body is not None else ""
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+        **(headers or {}),
     }
+    if status_code == 200 and "ETag" not in headers:
+        headers["ETag"] = f'"{hashlib.sha256(body_text.encode("utf-8")).hexdigest()[:32]}"'
+    return not_modified({"statusCode": status_code, "headers": headers, "body": body_text}, event)
 
 
-def list_restaurants(table):
-    result = table.scan(
-        FilterExpression="#sk = :info",
-        ExpressionAttributeNames={"#sk": "sk"},
-        ExpressionAttributeValues={":info": "INFO"},
+def not_modified(result: dict, event: dict | None):
+    etag = result["headers"].get("ETag")
+    if not event or not etag or result["statusCode"] != 200:
+        return result
+    candidates = (request_header(event, "If-None-Match") or "").split(",")
+    if etag in {candidate.strip().removeprefix("W/") for candidate in candidates}:
+        return {**result, "statusCode": 304, "body": ""}
+    return result
+
+
+def request_header(event, name: str):
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def get_week_version(table, week: str):
+    """Version stamp bumped by import_to_ddb whenever menus of the week change."""
+    version = _VERSIONS.get(week)
+    if version is None:
+        item = table.get_item(Key={"restaurant_id": "VERSION", "sk": f"WEEK#{week}"}).get("Item") or {}
+        version = int(item.get("version", 0))
+        _VERSIONS.put(week, version, VERSION_TTL)
+    return version
+
+
+def build_cache_key(event, table):
+    params = event.get("pathParameters") or {}
+    query = event.get("queryStringParameters") or {}
+    version = get_week_version(table, params["week"]) if params.get("week") else None
+    return (
+        event.get("resource"),
+        tuple(sorted(params.items())),
+        tuple(sorted(query.items())),
+        version,
     )
-    return result.get("Items", [])
+
+
+def serve_lunch_page(city: str, week: str, day: str, area: str | None):
+    """Serve the precomputed lunch page, or None when it has not been published."""
+    bucket = os.environ.get("LUNCH_PAGES_BUCKET")
+    if not bucket:
+        return None
+    page = lunch_pages.get_lunch_page(bucket, city, week, day, None if area == "all" else area)
+    if not page:
+        return None
+    document, etag = page
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    return response(200, {"items": document["items"], "next_token": None}, headers)
+
+
+def encode_next_token(last_key: dict | None):
+    if not last_key:
+        return None
+    return base64.b64encode(last_key["restaurant_id"].encode("utf-8")).decode("ascii")
+
+
+def decode_next_token(token: str | None):
+    if not token:
+        return None
+    try:
+        restaurant_id = base64.b64decode(token, validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError("next_token is invalid") from exc
+    return {"directory": "INFO", "sk": "INFO", "restaurant_id": restaurant_id}
+
+
+def parse_limit(raw: str | None) -> int:
+    # Same rule as the API Gateway template: anything outside 1..100 means 100.
+    if not raw or not raw.isdigit() or not 1 <= int(raw) <= DEFAULT_PAGE_LIMIT:
+        return DEFAULT_PAGE_LIMIT
+    return int(raw)
+
+
+def list_restaurants(table, index_name: str, limit: int = DEFAULT_PAGE_LIMIT, next_token: str | None = None):
+    """Return one page of INFO items from the sparse directory index and the next token."""
+    query_args = {
+        "IndexName": index_name,
+        "KeyConditionExpression": "#directory = :info",
+        "ExpressionAttributeNames": {"#directory": "directory"},
+        "ExpressionAttributeValues": {":info": "INFO"},
+        "Limit": limit,
+    }
+    start_key = decode_next_token(next_token)
+    if start_key:
+        query_args["ExclusiveStartKey"] = start_key
+    result = table.query(**query_args)
+    return result.get("Items", []), encode_next_token(result.get("LastEvaluatedKey"))
 
 
 def get_restaurant_info(table, restaurant_id: str):
@@ -42,40 +149,62 @@ def get_restaurant_week(table, restaurant_id: str, week: str):
     return result.get("Items", [])
 
 
-def get_lunch_by_location(table, gsi_name: str, city: str, area: str | None, week: str, day: str):
-    if area:
-        result = table.query(
-            IndexName=gsi_name,
-            KeyConditionExpression="#city = :city AND #area = :area AND #week = :week AND #day = :day",
-            ExpressionAttributeNames={
-                "#city": "city",
-                "#area": "area",
-                "#week": "week",
-                "#day": "day",
-            },
-            ExpressionAttributeValues={
-                ":city": city,
-                ":area": area,
-                ":week": week,
-                ":day": day,
-            },
-        )
-        return result.get("Items", [])
-
-    result = table.scan(
-        FilterExpression="#city = :city AND #week = :week AND #day = :day",
-        ExpressionAttributeNames={
-            "#city": "city",
-            "#week": "week",
-            "#day": "day",
-        },
-        ExpressionAttributeValues={
-            ":city": city,
-            ":week": week,
-            ":day": day,
-        },
-    )
-    return result.get("Items", [])
+def encode_lunch_token(last_key: dict | None):
+    if not last_key:
+        return None
+    return base64.b64encode(last_key["area_restaurant"].encode("utf-8")).decode("ascii")
+
+
+def decode_lunch_token(token: str | None, city_week_day: str):
+    if not token:
+        return None
+    try:
+        area_restaurant = base64.b64decode(token, validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError("next_token is invalid") from exc
+    _area, _sep, restaurant_id = area_restaurant.partition("#")
+    _city, week, day = city_week_day.split("#")
+    return {
+        "city_week_day": city_week_day,
+        "area_restaurant": area_restaurant,
+        "restaurant_id": restaurant_id,
+        "sk": f"MENU#{week}#{day}",
+    }
+
+
+def get_lunch_by_location(
+    table,
+    index_name: str,
+    city: str,
+    area: str | None,
+    week: str,
+    day: str,
+    limit: int | None = None,
+    next_token: str | None = None,
+):
+    """Query the by_city_week_day GSI; area narrows the sort key by prefix."""
+    city_week_day = f"{city}#{week}#{day}"
+    key_condition = "#cwd = :cwd"
+    names = {"#cwd": "city_week_day"}
+    values = {":cwd": city_week_day}
+    if area and area != "all":
+        key_condition += " AND begins_with(#ar, :area)"
+        names["#ar"] = "area_restaurant"
+        values[":area"] = f"{area}#"
+
+    query_args = {
+        "IndexName": index_name,
+        "KeyConditionExpression": key_condition,
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+    if limit:
+        query_args["Limit"] = limit
+    start_key = decode_lunch_token(next_token, city_week_day)
+    if start_key:
+        query_args["ExclusiveStartKey"] = start_key
+    result = table.query(**query_args)
+    return result.get("Items", []), encode_lunch_token(result.get("LastEvaluatedKey"))
 
 
 def handler(event, _context):
@@ -83,13 +212,40 @@ def handler(event, _context):
         return response(405, {"message": "Method not allowed"})
 
     table = ddb.Table(os.environ["TABLE_NAME"])
-    gsi_name = os.environ["GSI_NAME"]
+    ttl = ROUTE_TTLS.get(event.get("resource"))
+    if not ttl:
+        return route(event, table)
+
+    cache_key = build_cache_key(event, table)
+    cached = _CACHE.get(cache_key)
+    if cached is not None:
+        return not_modified({**cached, "headers": {**cached["headers"], "X-Cache": "hit"}}, event)
+
+    result = route(event, table)
+    if result["statusCode"] == 200:
+        _CACHE.put(cache_key, result, ttl)
+    print("api cache miss", {"resource": event.get("resource"), "entries": len(_CACHE), **_CACHE.stats})
+    return not_modified({**result, "headers": {**result["headers"], "X-Cache": "miss"}}, event)
+
+
+def route(event, table):
+    gsi_name = os.environ.get("CITY_DAY_INDEX_NAME", "by_city_week_day")
 
     resource = event.get("resource")
     params = event.get("pathParameters") or {}
 
     if resource == "/restaurants":
-        return response(200, {"items": list_restaurants(table)})
+        query = event.get("queryStringParameters") or {}
+        try:
+            items, next_token = list_restaurants(
+                table,
+                os.environ.get("DIRECTORY_INDEX_NAME", "restaurant_directory"),
+                parse_limit(query.get("limit")),
+                query.get("next_token"),
+            )
+        except ValueError as exc:
+            return response(400, {"message": str(exc)})
+        return response(200, {"items": items, "next_token": next_token})
 
     if resource == "/restaurants/{restaurant_id}":
         restaurant_id = params.get("restaurant_id")
@@ -108,12 +264,31 @@ def handler(event, _context):
         city = params.get("city")
         week = params.get("week")
         day = params.get("day")
-        area = (event.get("queryStringParameters") or {}).get("area")
+        query = event.get("queryStringParameters") or {}
 
         if not city or not week or not day:
             return response(400, {"message": "city, week, and day are required"})
 
-        items = get_lunch_by_location(table, gsi_name, city, area, week, day)
-        return response(200, {"items": items})
+        if not query.get("limit") and not query.get("next_token"):
+            page = serve_lunch_page(city, week, day, query.get("area"))
+            if page:
+                return page
+
+        try:
+            items, next_token = get_lunch_by_location(
+                table,
+                gsi_name,
+                city,
+                query.get("area"),
+                week,
+                day,
+                parse_limit(query.get("limit")) if query.get("limit") else None,
+                query.get("next_token"),
+            )
+        except ValueError as exc:
+            return response(400, {"message": str(exc)})
+        # Same item shape as the published page.
+        items = lunch_pages.page_entries(table, city, week, day, items)
+        return response(200, {"items": items, "next_token": next_token})
 
     return response(404, {"message": "Not found"})
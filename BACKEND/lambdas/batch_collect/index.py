@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from shared import concurrency  # noqa: E402
+from shared import openai_batch  # noqa: E402
+from shared import openai_client  # noqa: E402
+from shared import parse_cache  # noqa: E402
+from shared import storage  # noqa: E402
+from enqueue_restaurants import index as enqueue_restaurants  # noqa: E402
+from parse_html import index as parse_html  # noqa: E402
+from parse_html import rule_parsers  # noqa: E402
+
+
+def prepare_parse(blocks: list[str], restaurant: dict, restaurant_url: str) -> dict:
+    """Parse one section/parser of a page: {"csv": ...} when done locally, else the OpenAI request."""
+    restaurant_id = restaurant["restaurant_id"]
+    # Restaurants sharing a page only send their own section, as in parse_html.
+    blocks = parse_html.select_section(blocks, restaurant["section"])
+
+    if restaurant["parser"]:
+        csv_text = rule_parsers.parse_with_rules(restaurant["parser"], blocks, restaurant_id)
+        if csv_text:
+            return {"csv": csv_text}
+
+    markdown = parse_html.prepare_markdown(blocks, restaurant_id)
+    digest = parse_cache.content_digest(markdown)
+    model = openai_client.resolve_model()
+    prompt_version = openai_client.resolve_prompt_version("html")
+    cached = parse_cache.get_cached_csv("html", digest, model, prompt_version)
+    if cached:
+        return {"csv": cached}
+
+    context = {
+        "restaurant_id": restaurant_id,
+        "restaurant_url": restaurant_url,
+        "city": restaurant["city"],
+        "area": restaurant["area"],
+    }
+    request = openai_client.build_openai_request(
+        "html",
+        context,
+        {"html": markdown},
+        model,
+        openai_client.resolve_max_tokens(restaurant_id),
+    )
+    return {
+        "request": request,
+        "digest": digest,
+        "model": model,
+        "prompt_version": prompt_version,
+        "csv_format": openai_client.resolve_csv_format(),
+    }
+
+
+def prepare_restaurant(message: dict):
+    """Fetch and sanitize one page, shared by every restaurant in the message.
+
+    Returns None when the page is unchanged, else {"fetch", "parses",
+    "failed"}. Each parse covers the restaurants with the same section and
+    parser (like parse_html.handle_payload) and holds either the finished
+    "csv" or the OpenAI request to add to the batch.
+    """
+    restaurant_url = message["restaurant_url"]
+    fetched = parse_html.fetch_changed_page(message["restaurant_id"], restaurant_url)
+    if not fetched:
+        return None
+    page, weekly_key = fetched
+    fetch = {
+        "etag": page["etag"],
+        "last_modified": page["last_modified"],
+        "body_hash": page["body_hash"],
+        "weekly_key": weekly_key,
+    }
+    blocks = parse_html.sanitize_html_blocks(page["html"])
+
+    parses = {}
+    failed = []
+    for restaurant in parse_html.payload_restaurants(message):
+        parse_key = json.dumps([restaurant["section"], restaurant["parser"]], sort_keys=True)
+        try:
+            if parse_key not in parses:
+                parses[parse_key] = {**prepare_parse(blocks, restaurant, restaurant_url), "restaurants": []}
+        except Exception as exc:
+            print("batch_collect restaurant failed", {"restaurant_id": restaurant["restaurant_id"], "error": str(exc)})
+            failed.append(restaurant["restaurant_id"])
+            continue
+        parses[parse_key]["restaurants"].append(
+            {name: restaurant[name] for name in ("restaurant_id", "city", "area")}
+        )
+    return {"fetch": fetch, "parses": list(parses.values()), "failed": failed}
+
+
+def handler(_event, _context):
+    messages = enqueue_restaurants.group_by_url(
+        list(
+            enqueue_restaurants.iter_restaurant_messages(
+                os.environ["TABLE_NAME"], enqueue_restaurants.resolve_segments()
+            )
+        )
+    )
+    outcomes = concurrency.run_concurrently(
+        messages, prepare_restaurant, concurrency.resolve_concurrency(8)
+    )
+
+    lines = []
+    entries = {}
+    saved = 0
+    failed = []
+    for message, prepared, error in outcomes:
+        if error is not None:
+            print("batch_collect page failed", {"restaurant_id": message["restaurant_id"], "error": str(error)})
+            failed.extend(enqueue_restaurants.message_restaurant_ids(message))
+            continue
+        if prepared is None:
+            continue
+        failed.extend(prepared["failed"])
+        # The fetch state is saved once every restaurant on the page has its CSV,
+        # here or in batch_poll; after a failure the next run fetches the page again.
+        fetch = None if prepared["failed"] else prepared["fetch"]
+        pending = [parse for parse in prepared["parses"] if "csv" not in parse]
+        for parse in prepared["parses"]:
+            if "csv" not in parse:
+                continue
+            for restaurant in parse["restaurants"]:
+                storage.save_weekly_csv(
+                    parse["csv"],
+                    restaurant["restaurant_id"],
+                    city=restaurant["city"],
+                    area=restaurant["area"],
+                )
+                saved += 1
+        if fetch and not pending:
+            parse_html.save_fetch_state(message["restaurant_id"], message["restaurant_url"], fetch, fetch["weekly_key"])
+
+        for parse in pending:
+            custom_id = parse["restaurants"][0]["restaurant_id"]
+            lines.append(openai_batch.build_batch_line(custom_id, parse["request"]))
+            entries[custom_id] = {
+                "message": message,
+                "restaurants": parse["restaurants"],
+                "fetch": fetch,
+                "digest": parse["digest"],
+                "model": parse["model"],
+                "prompt_version": parse["prompt_version"],
+                "csv_format": parse["csv_format"],
+            }
+
+    batch_id = None
+    if lines:
+        file_id = openai_batch.upload_batch_file(lines)
+        batch = openai_batch.create_batch(file_id, {"source": "padev-lunch"})
+        batch_id = batch["id"]
+        storage.save_batch_manifest(
+            {
+                "batch_id": batch_id,
+                "input_file_id": file_id,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "entries": entries,
+            }
+        )
+
+    print(
+        "batch_collect done",
+        {"batch_id": batch_id, "submitted": len(lines), "saved": saved, "failed": failed},
+    )
+    return {"ok": not failed, "batch_id": batch_id, "submitted": len(lines), "saved": saved, "failed": failed}
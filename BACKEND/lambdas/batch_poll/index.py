@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+import time
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from shared import openai_batch  # noqa: E402
+from shared import openai_client  # noqa: E402
+from shared import parse_cache  # noqa: E402
+from shared import storage  # noqa: E402
+from parse_html import index as parse_html  # noqa: E402
+
+sqs = boto3.client("sqs")
+
+
+def requeue(messages: list[dict]):
+    queue_url = os.environ.get("QUEUE_URL")
+    if not queue_url or not messages:
+        return
+    for message in messages:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
+    print("batch_poll requeued", {"restaurant_ids": [m["restaurant_id"] for m in messages]})
+
+
+def collect_results(batch: dict) -> dict:
+    results = {}
+    for file_key in ("error_file_id", "output_file_id"):
+        file_id = batch.get(file_key)
+        if file_id:
+            results.update(openai_batch.parse_batch_output(openai_batch.download_file(file_id)))
+    return results
+
+
+def handle_manifest(manifest: dict):
+    batch_id = manifest["batch_id"]
+    batch = openai_batch.get_batch(batch_id)
+    status = batch.get("status")
+    if status not in openai_batch.TERMINAL_STATUSES:
+        print("batch_poll pending", {"batch_id": batch_id, "status": status, "counts": batch.get("request_counts")})
+        return {"batch_id": batch_id, "status": status}
+
+    results = collect_results(batch)
+    saved = 0
+    retry = {}
+    pages = {}
+    for custom_id, entry in manifest["entries"].items():
+        message = entry["message"]
+        # A shared page is retried as a whole, once, and only saves its fetch
+        # state when every parse from it succeeded.
+        page_id = message["restaurant_id"]
+        pages[page_id] = (message, entry["fetch"])
+        result = results.get(custom_id) or {"error": "missing_result"}
+        if "error" in result:
+            print("batch_poll result failed", {"restaurant_id": custom_id, "error": result["error"]})
+            retry[page_id] = message
+            continue
+        context = {"restaurant_id": custom_id, "restaurant_url": message["restaurant_url"]}
+        try:
+            csv_text = openai_client.finish_csv_response(result["text"], context, entry.get("csv_format", "rows"))
+        except ValueError:
+            retry[page_id] = message
+            continue
+        parse_cache.put_cached_csv(
+            "html",
+            entry["digest"],
+            entry["model"],
+            entry["prompt_version"],
+            csv_text,
+            custom_id,
+        )
+        for restaurant in entry.get("restaurants") or [message]:
+            storage.save_weekly_csv(
+                csv_text,
+                restaurant["restaurant_id"],
+                city=restaurant.get("city", ""),
+                area=restaurant.get("area", ""),
+            )
+            saved += 1
+
+    for page_id, (message, fetch) in pages.items():
+        if fetch and page_id not in retry:
+            parse_html.save_fetch_state(page_id, message["restaurant_url"], fetch, fetch["weekly_key"])
+    retry = list(retry.values())
+    requeue(retry)
+    manifest["status"] = status
+    manifest["completed_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    storage.move_batch_manifest(manifest, "pending", "done")
+    print("batch_poll done", {"batch_id": batch_id, "status": status, "saved": saved, "requeued": len(retry)})
+    return {"batch_id": batch_id, "status": status, "saved": saved, "requeued": len(retry)}
+
+
+def handler(_event, _context):
+    summaries = [handle_manifest(manifest) for manifest in storage.list_batch_manifests("pending")]
+    return {"ok": True, "batches": summaries}
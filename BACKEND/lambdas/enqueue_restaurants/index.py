@@ -1,51 +1,241 @@
 import json
 import os
+import sys
+import urllib.parse
 
 import boto3
 
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from shared import concurrency  # noqa: E402
+from shared import date_utils  # noqa: E402
+
 
 ddb = boto3.client("dynamodb")
 sqs = boto3.client("sqs")
 
+SQS_BATCH_SIZE = 10
+# Sort key of the per-restaurant publish history and poll state. Kept apart
+# from INFO, which import_restaurant_sources.py overwrites on every run.
+SCHEDULE_SK = "SCHEDULE"
 
-def handler(_event, _context):
-    table_name = os.environ["TABLE_NAME"]
-    queue_url = os.environ["QUEUE_URL"]
-    last_key = None
-    total = 0
 
-    while True:
-        scan_args = {
-            "TableName": table_name,
-            "FilterExpression": "#sk = :info",
-            "ExpressionAttributeNames": {"#sk": "sk"},
-            "ExpressionAttributeValues": {":info": {"S": "INFO"}},
-        }
-        if last_key:
-            scan_args["ExclusiveStartKey"] = last_key
-
-        result = ddb.scan(**scan_args)
-        for item in result.get("Items", []):
-            url = item.get("url", {}).get("S")
-            restaurant_id = item.get("restaurant_id", {}).get("S")
-            scan = (item.get("scan", {}).get("S") or "yes").strip().lower()
-            if not url or not restaurant_id:
-                continue
-            if scan == "no":
-                continue
-
-            message = {
-                "restaurant_url": url,
-                "restaurant_id": restaurant_id,
-                "city": item.get("city", {}).get("S", ""),
-                "area": item.get("area", {}).get("S", ""),
-            }
+def resolve_segments() -> int:
+    return max(1, int(os.environ.get("ENQUEUE_SEGMENTS", "1")))
+
 
-            sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
-            total += 1
+def resolve_skip_parsed() -> bool:
+    return os.environ.get("SKIP_PARSED", "false").strip().lower() in {"1", "true", "yes"}
 
+
+def _paginate(operation, args: dict):
+    last_key = None
+    while True:
+        if last_key:
+            args["ExclusiveStartKey"] = last_key
+        result = operation(**args)
+        yield from result.get("Items", [])
         last_key = result.get("LastEvaluatedKey")
         if not last_key:
             break
 
+
+def iter_info_items(table_name: str, segments: int = 1):
+    """Yield every INFO item from the sparse restaurant_directory index.
+
+    One segment is a single paginated Query. With more segments the index is
+    read with a parallel Scan, one thread per segment; the index only holds
+    INFO items, so neither reads menu items.
+    """
+    index_name = os.environ.get("DIRECTORY_INDEX_NAME", "restaurant_directory")
+    if segments <= 1:
+        yield from _paginate(
+            ddb.query,
+            {
+                "TableName": table_name,
+                "IndexName": index_name,
+                "KeyConditionExpression": "#directory = :info",
+                "ExpressionAttributeNames": {"#directory": "directory"},
+                "ExpressionAttributeValues": {":info": {"S": "INFO"}},
+            },
+        )
+        return
+
+    def scan_segment(segment: int):
+        return list(
+            _paginate(
+                ddb.scan,
+                {
+                    "TableName": table_name,
+                    "IndexName": index_name,
+                    "Segment": segment,
+                    "TotalSegments": segments,
+                },
+            )
+        )
+
+    for segment, items, error in concurrency.run_concurrently(range(segments), scan_segment, segments):
+        if error is not None:
+            raise RuntimeError(f"Scan segment {segment} of {segments} failed") from error
+        yield from items
+
+
+def build_message(item: dict) -> dict | None:
+    """Parse message for one INFO item, or None when it should not be scanned."""
+    url = item.get("url", {}).get("S")
+    restaurant_id = item.get("restaurant_id", {}).get("S")
+    scan = (item.get("scan", {}).get("S") or "yes").strip().lower()
+    if not url or not restaurant_id:
+        return None
+    if scan == "no":
+        return None
+
+    message = {
+        "restaurant_url": url,
+        "restaurant_id": restaurant_id,
+        "city": item.get("city", {}).get("S", ""),
+        "area": item.get("area", {}).get("S", ""),
+    }
+    parser = item.get("parser", {}).get("S")
+    if parser:
+        message["parser"] = parser
+    section = item.get("section", {})
+    if section.get("S"):
+        message["section"] = section["S"]
+    elif section.get("M"):
+        message["section"] = {name: value.get("S", "") for name, value in section["M"].items()}
+    return message
+
+
+def normalize_url(url: str) -> str:
+    # The fragment is never sent to the server, so "/#lunch" and "/" are one fetch.
+    parts = urllib.parse.urlsplit(url.strip())
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+
+def group_by_url(messages: list[dict]) -> list[dict]:
+    """Merge messages for the same page into one listing every restaurant on it.
+
+    parse_html fetches a shared page once and fans the parsed menu out to
+    each restaurant (see `restaurants` and `section`).
+    """
+    groups = {}
+    for message in messages:
+        groups.setdefault(normalize_url(message["restaurant_url"]), []).append(message)
+    grouped = []
+    for members in groups.values():
+        if len(members) == 1:
+            grouped.append(members[0])
+            continue
+        members.sort(key=lambda member: member["restaurant_id"])
+        grouped.append(
+            {
+                "restaurant_url": members[0]["restaurant_url"],
+                "restaurant_id": members[0]["restaurant_id"],
+                "restaurants": [
+                    {name: value for name, value in member.items() if name != "restaurant_url"}
+                    for member in members
+                ],
+            }
+        )
+    return grouped
+
+
+def message_restaurant_ids(message: dict) -> list[str]:
+    return [member["restaurant_id"] for member in message.get("restaurants") or [message]]
+
+
+def get_schedule_items(table_name: str, restaurant_ids: list[str]) -> dict:
+    """Return {restaurant_id: SCHEDULE item} for the restaurants that have one."""
+    restaurant_ids = sorted(set(restaurant_ids))
+    schedules = {}
+    for start in range(0, len(restaurant_ids), 100):
+        keys = [
+            {"restaurant_id": {"S": restaurant_id}, "sk": {"S": SCHEDULE_SK}}
+            for restaurant_id in restaurant_ids[start : start + 100]
+        ]
+        request = {table_name: {"Keys": keys}}
+        while request:
+            result = ddb.batch_get_item(RequestItems=request)
+            for item in result.get("Responses", {}).get(table_name, []):
+                schedules[item["restaurant_id"]["S"]] = item
+            request = result.get("UnprocessedKeys") or None
+    return schedules
+
+
+def iter_restaurant_messages(table_name: str, segments: int = 1, skip_week: str | None = None):
+    """Yield one parse message per scannable restaurant.
+
+    With skip_week, restaurants whose SCHEDULE item says that week was
+    already imported (`last_parsed_week`, set by import_to_ddb) are left out.
+    """
+    items = iter_info_items(table_name, segments)
+    schedules = {}
+    if skip_week:
+        items = list(items)
+        schedules = get_schedule_items(table_name, [item["restaurant_id"]["S"] for item in items])
+    for item in items:
+        schedule = schedules.get(item["restaurant_id"]["S"], {})
+        if skip_week and schedule.get("last_parsed_week", {}).get("S") == skip_week:
+            continue
+        message = build_message(item)
+        if message:
+            yield message
+
+
+def chunked(items: list, size: int = SQS_BATCH_SIZE) -> list[list]:
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+def send_batch(queue_url: str, messages: list[dict]) -> list[dict]:
+    """Send up to ten messages in one request; returns the messages SQS rejected."""
+    entries = [
+        {"Id": str(index), "MessageBody": json.dumps(message)}
+        for index, message in enumerate(messages)
+    ]
+    result = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    failed = result.get("Failed", [])
+    if failed:
+        print("enqueue_restaurants batch entries failed", {"failed": failed})
+    return [messages[int(entry["Id"])] for entry in failed]
+
+
+def send_messages(queue_url: str, messages: list[dict]) -> list[dict]:
+    """Send messages in concurrent batches of ten; returns the ones that could not be sent."""
+    outcomes = concurrency.run_concurrently(
+        chunked(messages), lambda batch: send_batch(queue_url, batch), concurrency.resolve_concurrency(8)
+    )
+    failed = []
+    for batch, rejected, error in outcomes:
+        failed.extend(batch if error is not None else rejected)
+    # Rejected entries are usually throttling; retry them once, one batch at a time.
+    retried = []
+    for batch in chunked(failed):
+        retried.extend(send_batch(queue_url, batch))
+    return retried
+
+
+def handler(event, _context):
+    table_name = os.environ["TABLE_NAME"]
+    queue_url = os.environ["QUEUE_URL"]
+    event = event if isinstance(event, dict) else {}
+    skip_parsed = bool(event.get("skip_parsed", resolve_skip_parsed())) and not event.get("force")
+    skip_week = date_utils.build_week() if skip_parsed else None
+
+    messages = group_by_url(list(iter_restaurant_messages(table_name, resolve_segments(), skip_week)))
+    failed = send_messages(queue_url, messages)
+
+    total = len(messages) - len(failed)
+    print(
+        "enqueue_restaurants done",
+        {
+            "total": total,
+            "restaurants": sum(len(message_restaurant_ids(message)) for message in messages),
+            "batches": len(chunked(messages)),
+            "skip_week": skip_week,
+            "failed": [restaurant_id for message in failed for restaurant_id in message_restaurant_ids(message)],
+        },
+    )
+    if failed:
+        raise RuntimeError(f"enqueue_restaurants failed to send {len(failed)} of {len(messages)} messages")
     return {"ok": True, "total": total}
@@ -1,24 +1,36 @@
 import csv
+import hashlib
 import io
+import json
 import os
 import sys
+import time
 import urllib.parse
+from decimal import Decimal
 
 import boto3
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+from boto3.dynamodb.conditions import Key  # noqa: E402
+
+from shared import concurrency  # noqa: E402
+from shared import csv_repair  # noqa: E402
 from shared import date_utils  # noqa: E402
+from shared import lunch_pages  # noqa: E402
+from shared import metrics  # noqa: E402
 
 s3 = boto3.client("s3")
 ddb = boto3.resource("dynamodb")
+# Sort key of the publish history; see enqueue_restaurants.SCHEDULE_SK.
+SCHEDULE_SK = "SCHEDULE"
+# schedule_restaurants only uses the last PUBLISH_HISTORY_WEEKS of these.
+MAX_PUBLISH_OFFSETS = 16
 
 
 def normalize_price(raw: str):
-    if not raw:
-        return None
-    digits = "".join(ch for ch in raw if ch.isdigit())
-    return int(digits) if digits else None
+    value = csv_repair.normalize_price(raw or "")
+    return int(value) if value else None
 
 
 def parse_csv(content: str):
@@ -40,63 +52,253 @@ def parse_csv(content: str):
     return rows
 
 
+def city_day_keys(city: str, area: str | None, week: str, day: str, restaurant_id: str):
+    """Keys for the by_city_week_day GSI: one partition per city/week/day, sorted by area."""
+    return {
+        "city_week_day": f"{city}#{week}#{day}",
+        "area_restaurant": f"{area or ''}#{restaurant_id}",
+    }
+
+
 def get_restaurant_info(table, restaurant_id: str):
     result = table.get_item(Key={"restaurant_id": restaurant_id, "sk": "INFO"})
     return result.get("Item")
 
 
-def handler(event, _context):
-    table = ddb.Table(os.environ["TABLE_NAME"])
+def refresh_lunch_pages(table, touched: dict):
+    """Rebuild the pages of every (city, week, day) in touched.
 
-    for record in event.get("Records", []):
-        bucket = record["s3"]["bucket"]["name"]
-        key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
-        weekly_info = date_utils.parse_weekly_key(key)
+    touched maps each of them to {restaurant_id: item or None} for the menu
+    items this invocation wrote or removed.
+    """
+    bucket = os.environ.get("LUNCH_PAGES_BUCKET")
+    if not bucket:
+        return
+    index_name = os.environ.get("CITY_DAY_INDEX_NAME", "by_city_week_day")
+    for (city, week, day), written in sorted(touched.items()):
+        pages = lunch_pages.build_lunch_pages(table, index_name, city, week, day, written)
+        lunch_pages.publish_lunch_pages(bucket, city, week, day, pages)
 
-        if not weekly_info:
-            continue
 
-        restaurant_id = weekly_info["restaurant_id"]
-        week = f"{weekly_info['year']}_{weekly_info['week']}"
+def bump_week_versions(table, weeks: set):
+    """Bump the per-week version stamp the api Lambda keys its response cache on."""
+    for week in sorted(weeks):
+        table.update_item(
+            Key={"restaurant_id": "VERSION", "sk": f"WEEK#{week}"},
+            UpdateExpression="ADD #version :one SET updated_at = :now",
+            ExpressionAttributeNames={"#version": "version"},
+            ExpressionAttributeValues={
+                ":one": 1,
+                ":now": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+        )
 
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = obj.get("Body")
-        content = body.read().decode("utf-8") if body else ""
-        metadata = obj.get("Metadata") or {}
 
-        rows = parse_csv(content)
-        if not rows:
-            continue
+def menu_hash(items: dict) -> str:
+    parts = [f"{items[sk]['day']}:{items[sk]['dishes_hash']}" for sk in sorted(items)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def mark_parsed(table, restaurant_id: str, week: str, new_menu_hash: str) -> bool:
+    """Record the first import of a new menu for week on the SCHEDULE item.
+
+    Sets last_parsed_week and appends the time it was seen (hours into the
+    week) to publish_offsets, the history schedule_restaurants learns
+    publish times from, keeping the last MAX_PUBLISH_OFFSETS. A menu
+    identical to the last imported one is last week's menu still on the
+    page and does not count.
+    """
+    key = {"restaurant_id": restaurant_id, "sk": SCHEDULE_SK}
+    try:
+        result = table.update_item(
+            Key=key,
+            UpdateExpression=(
+                "SET last_parsed_week = :week, last_menu_hash = :hash, "
+                "publish_offsets = list_append(if_not_exists(publish_offsets, :empty), :offset)"
+            ),
+            ConditionExpression=(
+                "(attribute_not_exists(last_parsed_week) OR last_parsed_week <> :week) "
+                "AND (attribute_not_exists(last_menu_hash) OR last_menu_hash <> :hash)"
+            ),
+            ExpressionAttributeValues={
+                ":week": week,
+                ":hash": new_menu_hash,
+                ":empty": [],
+                ":offset": [Decimal(str(round(date_utils.week_offset_hours(), 2)))],
+            },
+            ReturnValues="UPDATED_NEW",
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    excess = len(result.get("Attributes", {}).get("publish_offsets", [])) - MAX_PUBLISH_OFFSETS
+    if excess > 0:
+        table.update_item(
+            Key=key,
+            UpdateExpression="REMOVE " + ", ".join(f"publish_offsets[{index}]" for index in range(excess)),
+        )
+    print("import_to_ddb new week published", {"restaurant_id": restaurant_id, "week": week})
+    return True
+
+
+def dishes_hash(dishes: list[dict]) -> str:
+    canonical = json.dumps(dishes, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def build_menu_items(rows: list[dict], restaurant_id: str, week: str, city: str | None, area: str | None):
+    grouped = {}
+    for row in rows:
+        dish = {
+            "name": row["name"],
+            "tags": [tag for tag in (t.strip() for t in row["tags"].split("|")) if tag],
+        }
+        price_value = normalize_price(row["price"])
+        if price_value is not None:
+            dish["price"] = price_value
+        grouped.setdefault(row["day"], []).append({
+            **dish
+        })
+
+    items = {}
+    for day, dishes in grouped.items():
+        item = {
+            "restaurant_id": restaurant_id,
+            "sk": f"MENU#{week}#{day}",
+            "week": week,
+            "day": day,
+            "dishes": dishes,
+            "dishes_hash": dishes_hash(dishes),
+        }
+        if city:
+            item["city"] = city
+            item.update(city_day_keys(city, area, week, day, restaurant_id))
+        if area:
+            item["area"] = area
+        items[item["sk"]] = item
+    return items
+
+
+def get_existing_menu_items(table, restaurant_id: str, week: str) -> dict:
+    query_args = {
+        "KeyConditionExpression": Key("restaurant_id").eq(restaurant_id) & Key("sk").begins_with(f"MENU#{week}#"),
+        "ProjectionExpression": "sk, #day, city, area, dishes_hash, city_week_day, area_restaurant",
+        "ExpressionAttributeNames": {"#day": "day"},
+    }
+    existing = {}
+    while True:
+        result = table.query(**query_args)
+        for item in result.get("Items", []):
+            existing[item["sk"]] = item
+        last_key = result.get("LastEvaluatedKey")
+        if not last_key:
+            return existing
+        query_args["ExclusiveStartKey"] = last_key
+
 
+_COMPARED_FIELDS = ("dishes_hash", "city", "area", "city_week_day", "area_restaurant")
+
+
+def is_unchanged(existing: dict | None, item: dict) -> bool:
+    return existing is not None and all(existing.get(field) == item.get(field) for field in _COMPARED_FIELDS)
+
+
+def import_record(record) -> dict:
+    """Import one weekly CSV. Returns counters plus the touched pages and weeks."""
+    table = concurrency.thread_table(os.environ["TABLE_NAME"])
+    result = {"written": 0, "unchanged": 0, "deleted": 0, "touched": {}, "weeks": set()}
+    bucket = record["s3"]["bucket"]["name"]
+    key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+    weekly_info = date_utils.parse_weekly_key(key)
+
+    if not weekly_info:
+        return result
+
+    restaurant_id = weekly_info["restaurant_id"]
+    week = f"{weekly_info['year']}_{weekly_info['week']}"
+    with metrics.scope("import", restaurant_id):
+        import_weekly_csv(table, bucket, key, restaurant_id, week, result)
+        for name in ("written", "unchanged", "deleted"):
+            metrics.put(f"items_{name}", result[name])
+    return result
+
+
+def import_weekly_csv(table, bucket: str, key: str, restaurant_id: str, week: str, result: dict):
+    """Diff and write the menu items of one weekly CSV, updating result in place."""
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    body = obj.get("Body")
+    content = body.read().decode("utf-8") if body else ""
+    metadata = obj.get("Metadata") or {}
+
+    rows = parse_csv(content)
+    if not rows:
+        return
+
+    city = metadata.get("city")
+    area = metadata.get("area")
+    if not city:
+        # Only older objects and parse_image uploads without metadata need the INFO lookup.
         info = get_restaurant_info(table, restaurant_id) or {}
-        city = metadata.get("city") or info.get("city")
-        area = metadata.get("area") or info.get("area")
-
-        grouped = {}
-        for row in rows:
-            dish = {
-                "name": row["name"],
-                "tags": [tag for tag in (t.strip() for t in row["tags"].split("|")) if tag],
-            }
-            price_value = normalize_price(row["price"])
-            if price_value is not None:
-                dish["price"] = price_value
-            grouped.setdefault(row["day"], []).append({
-                **dish
-            })
-
-        for day, dishes in grouped.items():
-            item = {
-                "restaurant_id": restaurant_id,
-                "sk": f"MENU#{week}#{day}",
-                "week": week,
-                "day": day,
-                "dishes": dishes,
-            }
+        city = info.get("city")
+        area = area or info.get("area")
+
+    items = build_menu_items(rows, restaurant_id, week, city, area)
+    existing = get_existing_menu_items(table, restaurant_id, week)
+
+    with metrics.stage_timer("ddb_write"), table.batch_writer() as batch:
+        for sk, item in items.items():
+            if is_unchanged(existing.get(sk), item):
+                result["unchanged"] += 1
+                continue
+            batch.put_item(Item=item)
+            result["written"] += 1
+            result["weeks"].add(week)
             if city:
-                item["city"] = city
-            if area:
-                item["area"] = area
-            table.put_item(Item=item)
+                result["touched"].setdefault((city, week, item["day"]), {})[restaurant_id] = item
+            previous = existing.get(sk) or {}
+            if previous.get("city") and previous.get("city_week_day") != item.get("city_week_day"):
+                # Moved to another city; drop it from the old city's page.
+                result["touched"].setdefault((previous["city"], week, item["day"]), {})[restaurant_id] = None
+
+        for sk, stale in existing.items():
+            if sk in items:
+                continue
+            # Day dropped from a re-parsed menu.
+            batch.delete_item(Key={"restaurant_id": restaurant_id, "sk": sk})
+            result["deleted"] += 1
+            result["weeks"].add(week)
+            if stale.get("city"):
+                result["touched"].setdefault((stale["city"], week, stale["day"]), {})[restaurant_id] = None
+    if mark_parsed(table, restaurant_id, week, menu_hash(items)):
+        metrics.put("new_week_published")
+
+
+def handler(event, _context):
+    table = ddb.Table(os.environ["TABLE_NAME"])
+    records = event.get("Records", [])
+    outcomes = concurrency.run_concurrently(records, import_record, concurrency.resolve_concurrency())
+
+    touched = {}
+    weeks = set()
+    stats = {"written": 0, "unchanged": 0, "deleted": 0}
+    for _record, result, error in outcomes:
+        if error is not None:
+            continue
+        for name in stats:
+            stats[name] += result[name]
+        for page, written in result["touched"].items():
+            touched.setdefault(page, {}).update(written)
+        weeks |= result["weeks"]
 
-    return {"ok": True}
+    failures = concurrency.collect_failures(
+        outcomes, lambda record: {"key": record["s3"]["object"]["key"]}
+    )
+    print("import_to_ddb done", {**stats, "records": len(records), "failed": failures})
+    # Publish what did succeed before failing the event so S3 retries it.
+    with metrics.scope("publish"):
+        with metrics.stage_timer("lunch_pages"):
+            refresh_lunch_pages(table, touched)
+        metrics.put("lunch_pages_days", len(touched))
+        bump_week_versions(table, weeks)
+    if failures:
+        raise RuntimeError(f"import_to_ddb failed for {len(failures)} of {len(records)} records")
+    return {"ok": True, **stats}
@@ -1,5 +1,4 @@
 import json
-import re
 from html.parser import HTMLParser
 #from bs4 import BeautifulSoup
 import os
@@ -10,11 +9,17 @@ from markdownify import markdownify as md
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+from shared import concurrency  # noqa: E402
+from shared import date_utils  # noqa: E402
+from shared import fetch_state  # noqa: E402
+from shared import metrics  # noqa: E402
 from shared import openai_client  # noqa: E402
 from shared import storage  # noqa: E402
+from parse_html import menu_region  # noqa: E402
+from parse_html import rule_parsers  # noqa: E402
 
 
-def fetch_html(url: str) -> str:
+def fetch_page(url: str, previous: dict | None = None) -> dict:
     print("Fetch HTML", {"url": url})
     timeout_seconds = int(os.environ.get("FETCH_TIMEOUT_SECONDS", "10"))
     headers = {
@@ -26,60 +31,193 @@ def fetch_html(url: str) -> str:
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         "Accept-Language": "sv-SE,sv;q=0.9,en;q=0.8",
     }
+    if previous:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
     start = time.monotonic()
     try:
-        print("fetch_html request start", {"url": url})
+        print("fetch_html request start", {"url": url, "conditional": bool(previous)})
         response = requests.get(url, headers=headers, timeout=(timeout_seconds, timeout_seconds))
         print("fetch_html response received", {"url": url, "status": response.status_code})
+        if response.status_code == 304 and previous:
+            return {
+                "not_modified": True,
+                "html": "",
+                "etag": previous.get("etag"),
+                "last_modified": previous.get("last_modified"),
+                "body_hash": previous.get("body_hash"),
+            }
         response.raise_for_status()
         print("fetch_html response ok", {"url": url, "length": len(response.text)})
-        return response.text
+        return {
+            "not_modified": False,
+            "html": response.text,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body_hash": fetch_state.body_digest(response.content),
+        }
     except Exception as exc:
         elapsed = round(time.monotonic() - start, 2)
         print("fetch_html failed", {"url": url, "seconds": elapsed, "error": str(exc)})
         raise
 
 
+def fetch_html(url: str) -> str:
+    return fetch_page(url)["html"]
+
+
+# Elements whose whole body is skipped by switching the parser into CDATA
+# mode, so nested markup is never tokenized (same reach as the old
+# non-greedy regexes: up to the first matching close tag).
+_CDATA_SKIP_TAGS = frozenset(
+    {
+        "head",
+        "script",
+        "style",
+        "nav",
+        "footer",
+        "aside",
+        "noscript",
+        "svg",
+    }
+)
+# Elements skipped with nesting-aware depth tracking (a page <header> often
+# wraps other headers, which broke the regex approach for O'Learys).
+_NESTED_SKIP_TAGS = frozenset({"header"})
+# Elements that start a new text block for menu-region extraction.
+_BLOCK_TAGS = frozenset(
+    {
+        "address",
+        "article",
+        "blockquote",
+        "br",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "figcaption",
+        "figure",
+        "form",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "hr",
+        "li",
+        "main",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "table",
+        "td",
+        "th",
+        "tr",
+        "ul",
+    }
+)
+_FEED_CHUNK_SIZE = 64 * 1024
+
+
 class _TextExtractor(HTMLParser):
+    """Single-pass sanitizer: drops skipped elements and collects visible text.
+
+    Attributes (inline styles, long data-* payloads) are never copied to the
+    output. Text is buffered until the next markup event so that text nodes
+    split across feed() chunks are joined back together. Visible text is
+    grouped into blocks at block-level tags.
+    """
+
     def __init__(self):
-        super().__init__()
-        self._chunks = []
-        self._skip_depth = 0
-
-    def handle_starttag(self, tag, _attrs):
-        if tag in {
-            "head",
-            "script",
-            "style",
-            "nav",
-            "footer",
-            "header",
-            "aside",
-            "noscript",
-            "svg",
-        }:
-            self._skip_depth += 1
+        super().__init__(convert_charrefs=True)
+        self._blocks = []
+        self._words = []
+        self._pending = []
+        self._skip_stack = []
+
+    def _flush(self):
+        if self._pending:
+            self._words.extend("".join(self._pending).split())
+            self._pending = []
+
+    def _end_block(self):
+        self._flush()
+        if self._words:
+            self._blocks.append(" ".join(self._words))
+            self._words = []
+
+    @staticmethod
+    def _is_json_block(attrs) -> bool:
+        for name, value in attrs:
+            if name == "type" and value and value.strip().lower() == "application/json":
+                return True
+        return False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self._end_block()
+        else:
+            self._flush()
+        if tag in _CDATA_SKIP_TAGS or self._is_json_block(attrs):
+            self._skip_stack.append([tag, 1])
+            self.set_cdata_mode(tag)
+        elif self._skip_stack and self._skip_stack[-1][0] == tag:
+            self._skip_stack[-1][1] += 1
+        elif tag in _NESTED_SKIP_TAGS:
+            self._skip_stack.append([tag, 1])
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self._end_block()
+        else:
+            self._flush()
 
     def handle_endtag(self, tag):
-        if tag in {
-            "head",
-            "script",
-            "style",
-            "nav",
-            "footer",
-            "header",
-            "aside",
-            "noscript",
-            "svg",
-        }:
-            self._skip_depth = max(0, self._skip_depth - 1)
+        if tag in _BLOCK_TAGS:
+            self._end_block()
+        else:
+            self._flush()
+        if not self._skip_stack:
+            return
+        if self._skip_stack[-1][0] == tag:
+            self._skip_stack[-1][1] -= 1
+            if self._skip_stack[-1][1] == 0:
+                self._skip_stack.pop()
+            return
+        if tag in _NESTED_SKIP_TAGS:
+            while self._skip_stack:
+                if self._skip_stack.pop()[0] == tag:
+                    break
 
     def handle_data(self, data):
-        if self._skip_depth == 0 and data:
-            self._chunks.append(data)
+        if not self._skip_stack and data:
+            self._pending.append(data)
+
+    def handle_comment(self, _data):
+        self._flush()
+
+    def handle_decl(self, _decl):
+        self._flush()
+
+    def handle_pi(self, _data):
+        self._flush()
+
+    def unknown_decl(self, _data):
+        self._flush()
+
+    def close(self):
+        super().close()
+        self._end_block()
+
+    def blocks(self) -> list[str]:
+        return self._blocks
 
     def text(self) -> str:
-        return " ".join(self._chunks)
+        return " ".join(self._blocks)
 
 
 # def extract_relevant_content(html_content):
@@ -105,90 +243,221 @@ class _TextExtractor(HTMLParser):
 
 
 
-def sanitize_html(html: str) -> str:
-    html = re.sub(r"<head\b[^>]*>[\s\S]*?</head>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<script\b[^>]*>[\s\S]*?</script>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<style\b[^>]*>[\s\S]*?</style>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<nav\b[^>]*>[\s\S]*?</nav>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<footer\b[^>]*>[\s\S]*?</footer>", "", html, flags=re.IGNORECASE)
-    #html = re.sub(r"<header\b[^>]*>[\s\S]*?</header>", "", html, flags=re.IGNORECASE) #Removed for problems w Olearys
-    html = re.sub(r"<aside\b[^>]*>[\s\S]*?</aside>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<noscript\b[^>]*>[\s\S]*?</noscript>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<svg\b[^>]*>[\s\S]*?</svg>", "", html, flags=re.IGNORECASE)
-    html = re.sub(r"<img\b[^>]*>", "", html, flags=re.IGNORECASE)
-    html = re.sub(
-        r"<[^>]+\btype\s*=\s*(['\"])application/json\1[^>]*>[\s\S]*?</[^>]+>",
-        "",
-        html,
-        flags=re.IGNORECASE,
+def sanitize_html_stream(chunks) -> list[str]:
+    extractor = _TextExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return extractor.blocks()
+
+
+def sanitize_html_blocks(html: str) -> list[str]:
+    return sanitize_html_stream(
+        html[start:start + _FEED_CHUNK_SIZE] for start in range(0, len(html), _FEED_CHUNK_SIZE)
     )
-    html = re.sub(
-        r"\sdata-[\w:-]+\s*=\s*(['\"]).{200,}?\1",
-        "",
-        html,
-        flags=re.IGNORECASE,
+
+
+def sanitize_html(html: str) -> str:
+    return " ".join(sanitize_html_blocks(html))
+
+
+def fetch_changed_page(restaurant_id: str, restaurant_url: str, force: bool = False):
+    """Fetch a page, or return None when it is unchanged since the last saved parse this week."""
+    weekly_key = date_utils.build_weekly_key(restaurant_id)
+    previous = None if force else fetch_state.get_state(restaurant_id, restaurant_url)
+    if previous and previous.get("weekly_key") != weekly_key:
+        previous = None
+
+    print("parse_html fetch start", {"restaurant_id": restaurant_id, "url": restaurant_url})
+    page = fetch_page(restaurant_url, previous)
+    if page["not_modified"] or (previous and page["body_hash"] == previous.get("body_hash")):
+        print(
+            "parse_html unchanged, skipping",
+            {
+                "restaurant_id": restaurant_id,
+                "not_modified": page["not_modified"],
+                "weekly_key": weekly_key,
+            },
+        )
+        return None
+    return page, weekly_key
+
+
+def save_fetch_state(restaurant_id: str, restaurant_url: str, page: dict, weekly_key: str):
+    fetch_state.save_state(
+        restaurant_id,
+        restaurant_url,
+        {
+            "etag": page["etag"],
+            "last_modified": page["last_modified"],
+            "body_hash": page["body_hash"],
+            "weekly_key": weekly_key,
+        },
     )
-    html = re.sub(r"\sstyle\s*=\s*(['\"]).*?\1", "", html, flags=re.IGNORECASE)
-    extractor = _TextExtractor()
-    extractor.feed(html)
-    cleaned_content = " ".join(extractor.text().split())
-    return cleaned_content
-    #return cleaned_content[:200000]
+
+
+def prepare_markdown(blocks: list[str], restaurant_id: str) -> str:
+    with metrics.stage_timer("region"):
+        region = menu_region.extract_menu_region(blocks)
+    print("parse_html menu region", {"restaurant_id": restaurant_id, **region["report"]})
+    print("parse_html markdownify start", {"restaurant_id": restaurant_id})
+    with metrics.stage_timer("markdownify"):
+        markdown = md(region["text"])
+    metrics.put("markdown_bytes", len(markdown.encode("utf-8")))
+    print("parse_html markdownify done", {"restaurant_id": restaurant_id, "md_len": len(markdown)})
+    return markdown
+
+
+def parse_blocks_to_csv(blocks: list[str], context: dict, parser_name: str | None = None) -> str:
+    restaurant_id = context.get("restaurant_id")
+    if parser_name:
+        with metrics.stage_timer("rules"):
+            csv_content = rule_parsers.parse_with_rules(parser_name, blocks, restaurant_id)
+        if csv_content:
+            metrics.put("rule_parser_hits")
+            print("parse_html rule parser used", {"restaurant_id": restaurant_id, "parser": parser_name})
+            return csv_content
+        print("parse_html rule parser fallback", {"restaurant_id": restaurant_id, "parser": parser_name})
+
+    markdown = prepare_markdown(blocks, restaurant_id)
+    print("parse_html openai start", {"restaurant_id": restaurant_id})
+    with metrics.stage_timer("openai"):
+        return openai_client.parse_html_to_csv(markdown, context)
+
+
+def select_section(blocks: list[str], section) -> list[str]:
+    """Blocks of one restaurant on a page shared with others.
+
+    section is the text of the block where the restaurant's menu starts, or
+    {"start": ..., "end": ...} to also stop before the block containing end.
+    Matching is a case-insensitive substring match.
+    """
+    if not section:
+        return blocks
+    if isinstance(section, str):
+        section = {"start": section}
+    start_text = (section.get("start") or "").lower()
+    end_text = (section.get("end") or "").lower()
+    start = next((index for index, block in enumerate(blocks) if start_text in block.lower()), None)
+    if start is None:
+        raise ValueError(f"Section start {section.get('start')!r} not found on page")
+    end = len(blocks)
+    if end_text:
+        end = next(
+            (index for index in range(start + 1, len(blocks)) if end_text in blocks[index].lower()),
+            len(blocks),
+        )
+    return blocks[start:end]
+
+
+def payload_restaurants(body: dict) -> list[dict]:
+    """Restaurants covered by a message: its `restaurants` (a shared page) or the message itself."""
+    return [
+        {
+            "restaurant_id": member["restaurant_id"],
+            "city": member.get("city", ""),
+            "area": member.get("area", ""),
+            "parser": member.get("parser"),
+            "section": member.get("section"),
+        }
+        for member in body.get("restaurants") or [body]
+    ]
 
 
 def handle_payload(payload, source: str):
-    print("parse_html payload", {"source": source, "payload": payload})
+    metrics.log_debug("parse_html payload", {"source": source, "payload": payload})
     body = payload
     restaurant_url = body.get("restaurant_url")
     restaurant_id = body.get("restaurant_id")
-    city = body.get("city", "")
-    area = body.get("area", "")
 
     if not restaurant_url or not restaurant_id:
         raise ValueError("restaurant_url and restaurant_id are required")
 
-    print("parse_html fetch start", {"restaurant_id": restaurant_id, "url": restaurant_url})
-    html = fetch_html(restaurant_url)
-    print("parse_html fetch done", {"restaurant_id": restaurant_id, "html_len": len(html)})
-    html = sanitize_html(html)
-    print("parse_html markdownify start", {"restaurant_id": restaurant_id})
-    html = md(html)
-    print("parse_html markdownify done", {"restaurant_id": restaurant_id, "md_len": len(html)})
-    #html = extract_relevant_content(html)
-    #html = sanitize_html(html)
-    print("parse_html openai start", {"restaurant_id": restaurant_id})
-    csv_content = openai_client.parse_html_to_csv(
-        html,
-        {
-            "restaurant_id": restaurant_id,
-            "restaurant_url": restaurant_url,
-            "city": city,
-            "area": area,
-        },
-    )
+    restaurants = payload_restaurants(body)
+    with metrics.scope("html", restaurant_id):
+        with metrics.stage_timer("fetch"):
+            fetched = fetch_changed_page(restaurant_id, restaurant_url, force=bool(body.get("force")))
+        if not fetched:
+            metrics.put("fetch_unchanged")
+            return
+        page, weekly_key = fetched
+        html = page["html"]
+        print("parse_html fetch done", {"restaurant_id": restaurant_id, "html_len": len(html)})
+        metrics.put("html_bytes", len(html.encode("utf-8")))
+        with metrics.stage_timer("sanitize"):
+            blocks = sanitize_html_blocks(html)
 
-    print("parse_html save to s3", {"restaurant_id": restaurant_id})
-    storage.save_weekly_csv(csv_content, restaurant_id, city=city, area=area)
-    print(
-        "parse_html done",
-        {
-            "restaurant_id": restaurant_id,
-            "city": city,
-            "area": area,
-            "timestamp_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        },
-    )
+        # Restaurants on a shared page with the same section and parser share one parse.
+        parsed = {}
+        failures = []
+        for restaurant in restaurants:
+            member_id = restaurant["restaurant_id"]
+            try:
+                parse_key = json.dumps([restaurant["section"], restaurant["parser"]], sort_keys=True)
+                if parse_key not in parsed:
+                    parsed[parse_key] = parse_blocks_to_csv(
+                        select_section(blocks, restaurant["section"]),
+                        {
+                            "restaurant_id": member_id,
+                            "restaurant_url": restaurant_url,
+                            "city": restaurant["city"],
+                            "area": restaurant["area"],
+                        },
+                        restaurant["parser"],
+                    )
+                print("parse_html save to s3", {"restaurant_id": member_id})
+                with metrics.stage_timer("save"):
+                    storage.save_weekly_csv(
+                        parsed[parse_key], member_id, city=restaurant["city"], area=restaurant["area"]
+                    )
+            except Exception as exc:
+                print("parse_html restaurant failed", {"restaurant_id": member_id, "error": str(exc)})
+                failures.append(member_id)
+                continue
+            print(
+                "parse_html done",
+                {
+                    "restaurant_id": member_id,
+                    "city": restaurant["city"],
+                    "area": restaurant["area"],
+                    "timestamp_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                },
+            )
+        if len(restaurants) > 1:
+            metrics.put("shared_url_restaurants", len(restaurants))
+            metrics.put("shared_url_parses", len(parsed))
+        if failures:
+            # No fetch state, so the retry fetches and parses the page again.
+            raise RuntimeError(f"parse_html failed for {', '.join(failures)}")
+        save_fetch_state(restaurant_id, restaurant_url, page, weekly_key)
 
 
-def handler(event, _context):
-    print("parse_html event", {"event": event})
+def handle_record(record):
+    metrics.log_debug("parse_html record", {"record": record})
+    body = json.loads(record.get("body", "{}"))
+    handle_payload(body, "sqs")
+
+
+def handler(event, context):
+    metrics.log_debug("parse_html event", {"event": event})
+    openai_client.reset_request_stats()
+    openai_client.set_deadline(context)
     records = event.get("Records")
     if records:
-        for record in records:
-            print("parse_html record", {"record": record})
-            body = json.loads(record.get("body", "{}"))
-            handle_payload(body, "sqs")
-        return {"ok": True}
+        failures = []
+        outcomes = concurrency.run_concurrently(
+            records, handle_record, concurrency.resolve_concurrency()
+        )
+        print("parse_html openai stats", openai_client.get_request_stats())
+        for record, _result, error in outcomes:
+            if error is None:
+                continue
+            print(
+                "parse_html record failed",
+                {"message_id": record.get("messageId"), "error": str(error)},
+            )
+            failures.append({"itemIdentifier": record.get("messageId")})
+        return {"ok": not failures, "batchItemFailures": failures}
 
     if isinstance(event, dict):
         handle_payload(event, "direct")
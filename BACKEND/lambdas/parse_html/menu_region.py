@@ -0,0 +1,105 @@
+import os
+import re
+
+from shared import openai_client
+
+_WEEKDAY_RE = re.compile(r"\b(måndag|tisdag|onsdag|torsdag|fredag)(?:en|ar)?\b", re.IGNORECASE)
+_WEEK_RE = re.compile(r"\b(hela veckan|veckans|vecka \d{1,2}|dagens lunch)\b", re.IGNORECASE)
+_PRICE_RE = re.compile(r"\b\d{2,3}\s*(?:kr\b|sek\b|:-)|\b\d{2,3}:-", re.IGNORECASE)
+_NOISE_RE = re.compile(r"https?://|www\.|@|©|cookie", re.IGNORECASE)
+
+# Each block "costs" this much, so a region only grows across low-scoring
+# blocks when menu signals follow shortly after.
+_BLOCK_COST = 1.0
+_MIN_REGION_SCORE = 8.0
+_MIN_WEEKDAYS = 2
+_MAX_REGION_SHARE = 0.85
+
+
+def resolve_enabled() -> bool:
+    return os.environ.get("MENU_REGION_EXTRACTION", "on").strip().lower() not in {"off", "false", "0"}
+
+
+def resolve_context_blocks() -> int:
+    return int(os.environ.get("MENU_REGION_CONTEXT_BLOCKS", "2"))
+
+
+def _is_dish_like(block: str) -> bool:
+    words = block.split()
+    return 3 <= len(words) <= 60 and not _NOISE_RE.search(block)
+
+
+def score_block(block: str) -> float:
+    score = 3.0 * len(_WEEKDAY_RE.findall(block))
+    score += 1.5 * len(_WEEK_RE.findall(block))
+    score += 2.0 * len(_PRICE_RE.findall(block))
+    if _is_dish_like(block):
+        score += 0.5
+    return score
+
+
+def _best_window(scores: list[float]):
+    best_start, best_end, best_gain = 0, -1, 0.0
+    start, gain = 0, 0.0
+    for index, score in enumerate(scores):
+        if gain <= 0:
+            start, gain = index, 0.0
+        gain += score - _BLOCK_COST
+        if gain > best_gain:
+            best_start, best_end, best_gain = start, index, gain
+    return best_start, best_end
+
+
+def _report(full_text: str, text: str, used_region: bool, reason: str, region_score: float) -> dict:
+    full_tokens = openai_client.estimate_tokens(full_text)
+    tokens = openai_client.estimate_tokens(text)
+    return {
+        "used_region": used_region,
+        "reason": reason,
+        "region_score": round(region_score, 1),
+        "full_chars": len(full_text),
+        "region_chars": len(text),
+        "full_tokens_est": full_tokens,
+        "region_tokens_est": tokens,
+        "token_reduction_pct": round(100 * (1 - tokens / full_tokens), 1) if full_tokens else 0.0,
+    }
+
+
+def extract_menu_region(blocks: list[str]) -> dict:
+    """Keep the highest-scoring run of blocks (plus context) from a sanitized page.
+
+    Blocks are scored on Swedish weekday names, prices and dish-like lines.
+    Falls back to the full text when the best region is weak, covers too few
+    weekdays or would not shrink the payload meaningfully.
+    """
+    full_text = " ".join(blocks)
+    if not resolve_enabled():
+        return {"text": full_text, "report": _report(full_text, full_text, False, "disabled", 0.0)}
+    if not blocks:
+        return {"text": full_text, "report": _report(full_text, full_text, False, "empty", 0.0)}
+
+    scores = [score_block(block) for block in blocks]
+    start, end = _best_window(scores)
+    if end < start:
+        return {"text": full_text, "report": _report(full_text, full_text, False, "no_signal", 0.0)}
+
+    region_score = sum(scores[start:end + 1])
+    weekdays = {
+        match.lower()
+        for block in blocks[start:end + 1]
+        for match in _WEEKDAY_RE.findall(block)
+    }
+    if region_score < _MIN_REGION_SCORE or len(weekdays) < _MIN_WEEKDAYS:
+        return {
+            "text": full_text,
+            "report": _report(full_text, full_text, False, "low_confidence", region_score),
+        }
+
+    context = resolve_context_blocks()
+    text = " ".join(blocks[max(0, start - context):end + 1 + context])
+    if len(text) > _MAX_REGION_SHARE * len(full_text):
+        return {
+            "text": full_text,
+            "report": _report(full_text, full_text, False, "region_too_large", region_score),
+        }
+    return {"text": text, "report": _report(full_text, text, True, "region", region_score)}
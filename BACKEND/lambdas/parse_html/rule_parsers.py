@@ -0,0 +1,129 @@
+import re
+
+from shared import csv_repair
+from shared import metrics
+from shared import openai_client
+
+DAYS = ["mon", "tue", "wed", "thu", "fri"]
+_DAY_NAMES = {
+    "måndag": "mon",
+    "tisdag": "tue",
+    "onsdag": "wed",
+    "torsdag": "thu",
+    "fredag": "fri",
+}
+_DAY_PREFIX_RE = re.compile(
+    r"^(måndag|tisdag|onsdag|torsdag|fredag)(?:en)?\b[\s\d./-]*(?:[:–—-]\s*(.*))?$",
+    re.IGNORECASE,
+)
+_WEEK_HEADING_RE = re.compile(
+    r"^(hela veckan|veckans \w+|veckan|måndag\s*[–—-]\s*fredag)\b\s*:?\s*(.*)$",
+    re.IGNORECASE,
+)
+_PRICE_RE = re.compile(r"(\d{2,3})(?:[.,]\d{2})?\s*(?:kr\b|sek\b|:-)", re.IGNORECASE)
+_STOP_RE = re.compile(
+    r"^(öppettider|kontakt|boka( bord)?|à la carte|a la carte|adress|hitta hit|följ oss)\b",
+    re.IGNORECASE,
+)
+_TIME_RE = re.compile(r"\b\d{1,2}[.:]\d{2}\s*[–—-]\s*\d{1,2}[.:]\d{2}\b")
+
+_PARSERS = {}
+
+
+def register(name: str):
+    def decorator(func):
+        _PARSERS[name] = func
+        return func
+
+    return decorator
+
+
+def get_parser(name: str):
+    return _PARSERS.get(name)
+
+
+def _split_price(text: str):
+    matches = list(_PRICE_RE.finditer(text))
+    if not matches:
+        return text.strip(), ""
+    match = matches[-1]
+    name = (text[:match.start()] + text[match.end():]).strip(" \t-–—|,.")
+    return name, match.group(1)
+
+
+def _dish_rows(days: list[str], text: str) -> list[dict]:
+    name, price = _split_price(text)
+    if len(name.split()) < 2:
+        return []
+    return [{"day": day, "lunch": name, "price": price, "tags": ""} for day in days]
+
+
+@register("day_headings")
+def parse_day_headings(blocks: list[str]) -> list[dict]:
+    """Day headings (Måndag, Tisdag, ...) each followed by one block per dish.
+
+    Dishes under "Hela veckan"/"Veckans ..." are copied to every weekday.
+    A day name followed by ":" or a dash on the same line is treated as a
+    heading plus its first dish.
+    """
+    rows = []
+    current_days = None
+    for block in blocks:
+        text = block.strip()
+        if not text:
+            continue
+        if _STOP_RE.match(text) or _TIME_RE.search(text):
+            current_days = None
+            continue
+        day_match = _DAY_PREFIX_RE.match(text)
+        if day_match:
+            current_days = [_DAY_NAMES[day_match.group(1).lower()]]
+            if day_match.group(2):
+                rows.extend(_dish_rows(current_days, day_match.group(2)))
+            continue
+        week_match = _WEEK_HEADING_RE.match(text)
+        if week_match:
+            current_days = list(DAYS)
+            if week_match.group(2):
+                heading = week_match.group(1).lower()
+                dish = text if heading.startswith("veckans") else week_match.group(2)
+                rows.extend(_dish_rows(current_days, dish))
+            continue
+        if current_days:
+            rows.extend(_dish_rows(current_days, text))
+    return rows
+
+
+def parse_with_rules(parser_name: str, blocks: list[str], restaurant_id: str | None):
+    """Run a registered rule parser; returns validated CSV or None to fall back to OpenAI."""
+    parser = get_parser(parser_name)
+    if not parser:
+        print("rule_parsers unknown parser", {"restaurant_id": restaurant_id, "parser": parser_name})
+        return None
+    try:
+        rows = parser(blocks)
+    except Exception as exc:
+        print(
+            "rule_parsers parser failed",
+            {"restaurant_id": restaurant_id, "parser": parser_name, "error": str(exc)},
+        )
+        return None
+    if len({row["day"] for row in rows}) < 2:
+        print(
+            "rule_parsers too few days",
+            {"restaurant_id": restaurant_id, "parser": parser_name, "rows": len(rows)},
+        )
+        return None
+    rows = sorted(rows, key=lambda item: DAYS.index(item["day"]))
+    csv_text = csv_repair.rows_to_csv(
+        csv_repair.CSV_HEADER, [[row[name] for name in csv_repair.CSV_HEADER] for row in rows]
+    )
+    errors = openai_client.csv_validation_errors(csv_text)
+    if errors:
+        metrics.put("rule_parser_invalid")
+        print(
+            "rule_parsers CSV validation failed",
+            {"restaurant_id": restaurant_id, "parser": parser_name, "errors": errors},
+        )
+        return None
+    return csv_text
@@ -3,14 +3,17 @@ import sys
 import urllib.parse
 import time
 
-import boto3
-
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+from shared import concurrency  # noqa: E402
+from shared import metrics  # noqa: E402
 from shared import openai_client  # noqa: E402
 from shared import storage  # noqa: E402
+from parse_image import preprocess  # noqa: E402
+
 
-ddb = boto3.resource("dynamodb")
+def resolve_max_upload_bytes() -> int:
+    return int(os.environ.get("UPLOAD_MAX_BYTES", str(50_000_000)))
 
 
 def extract_restaurant_id(key: str):
@@ -20,39 +23,88 @@ def extract_restaurant_id(key: str):
     return None
 
 
-def handler(event, _context):
-    table = ddb.Table(os.environ["TABLE_NAME"])
-    for record in event.get("Records", []):
-        bucket = record["s3"]["bucket"]["name"]
-        key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
-        restaurant_id = extract_restaurant_id(key)
+def parse_record(record):
+    bucket = record["s3"]["bucket"]["name"]
+    key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+    restaurant_id = extract_restaurant_id(key)
 
-        if not restaurant_id:
-            continue
+    if not restaurant_id:
+        return None
 
-        obj = storage.get_s3_object(bucket, key)
-        body = obj.get("Body")
-        if not body:
-            raise ValueError("Menu object body was empty")
+    with metrics.scope("image", restaurant_id):
+        return parse_menu_upload(bucket, key, restaurant_id)
 
-        binary = body.read()
-        info = table.get_item(Key={"restaurant_id": restaurant_id, "sk": "INFO"}).get("Item", {})
-        city = info.get("city", "")
-        area = info.get("area", "")
 
-        csv_content = openai_client.parse_image_to_csv(
-            binary,
-            {"restaurant_id": restaurant_id, "city": city, "area": area},
-        )
-        storage.save_weekly_csv(csv_content, restaurant_id, city=city, area=area)
+def parse_menu_upload(bucket: str, key: str, restaurant_id: str):
+    obj = storage.get_s3_object(bucket, key)
+    body = obj.get("Body")
+    if not body:
+        raise ValueError("Menu object body was empty")
+    size = obj.get("ContentLength") or 0
+    if size > resolve_max_upload_bytes():
+        # Retrying cannot help, so skip instead of failing the event.
+        body.close()
+        metrics.put("upload_rejected")
         print(
-            "parse_image done",
-            {
-                "restaurant_id": restaurant_id,
-                "city": city,
-                "area": area,
-                "timestamp_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            },
+            "parse_image upload rejected",
+            {"restaurant_id": restaurant_id, "key": key, "bytes": size, "limit": resolve_max_upload_bytes()},
         )
+        return None
+
+    with metrics.stage_timer("s3_read"):
+        binary = body.read()
+    metrics.put("upload_bytes", len(binary))
+    table = concurrency.thread_table(os.environ["TABLE_NAME"])
+    info = table.get_item(Key={"restaurant_id": restaurant_id, "sk": "INFO"}).get("Item", {})
+    city = info.get("city", "")
+    area = info.get("area", "")
+
+    context = {"restaurant_id": restaurant_id, "city": city, "area": area}
+    with metrics.stage_timer("preprocess"):
+        prepared = preprocess.prepare_upload(binary)
+    print("parse_image preprocessed", {"restaurant_id": restaurant_id, **prepared["report"]})
+    try:
+        with metrics.stage_timer("openai"):
+            if prepared["text"]:
+                # PDF with a text layer: the text prompt is far cheaper than vision input.
+                csv_content = openai_client.parse_html_to_csv(prepared["text"], context)
+            else:
+                csv_content = openai_client.parse_image_to_csv(binary, context, prepared["images"])
+    except openai_client.PayloadTooLarge as exc:
+        metrics.put("upload_rejected")
+        print("parse_image upload rejected", {"restaurant_id": restaurant_id, "key": key, "error": str(exc)})
+        return None
+    with metrics.stage_timer("save"):
+        storage.save_weekly_csv(csv_content, restaurant_id, city=city, area=area)
+    print(
+        "parse_image done",
+        {
+            "restaurant_id": restaurant_id,
+            "city": city,
+            "area": area,
+            "timestamp_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+    )
+    return restaurant_id
+
 
+def handler(event, context):
+    openai_client.reset_request_stats()
+    openai_client.set_deadline(context)
+    records = event.get("Records", [])
+    outcomes = concurrency.run_concurrently(records, parse_record, concurrency.resolve_concurrency())
+    failures = concurrency.collect_failures(
+        outcomes, lambda record: {"key": urllib.parse.unquote_plus(record["s3"]["object"]["key"])}
+    )
+    print(
+        "parse_image summary",
+        {
+            "records": len(records),
+            "parsed": [result for _record, result, error in outcomes if error is None and result],
+            "failed": failures,
+        },
+    )
+    print("parse_image openai stats", openai_client.get_request_stats())
+    if failures:
+        raise RuntimeError(f"parse_image failed for {len(failures)} of {len(records)} records")
     return {"ok": True}
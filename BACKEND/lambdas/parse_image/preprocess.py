@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from parse_html import menu_region  # noqa: E402
+from shared import openai_client  # noqa: E402
+
+_JPEG_QUALITY = 85
+# Page text below this score has no weekday/price signal and is not a menu page.
+_MIN_PAGE_SCORE = 6.0
+_MIN_TEXT_CHARS = 100
+_MIN_EDGE = 512
+# Room left in the payload limit for the prompts and JSON around the files.
+_PROMPT_BYTES = 64 * 1024
+# Image formats the vision input accepts; anything else (BMP, TIFF, ...) is re-encoded.
+_SUPPORTED_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+
+def resolve_max_edge() -> int:
+    return int(os.environ.get("IMAGE_MAX_EDGE", "2048"))
+
+
+def resolve_max_image_bytes() -> int:
+    return int(os.environ.get("IMAGE_MAX_BYTES", str(1_500_000)))
+
+
+def resolve_max_pages() -> int:
+    return int(os.environ.get("PDF_MAX_PAGES", "4"))
+
+
+def downscale_image(binary: bytes, max_edge: int | None = None):
+    """Return (bytes, mime_type), shrunk to IMAGE_MAX_EDGE and recompressed when oversized.
+
+    Formats the vision input does not accept are always re-encoded as JPEG.
+    """
+    mime_type = openai_client.detect_mime_type(binary)
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return binary, mime_type
+
+    max_edge = max_edge or resolve_max_edge()
+    try:
+        image = Image.open(io.BytesIO(binary))
+        image.load()
+    except Exception as exc:
+        print("parse_image image decode failed", {"error": str(exc)})
+        return binary, mime_type
+    mime_type = _SUPPORTED_FORMATS.get(image.format)
+    if mime_type and max(image.size) <= max_edge and len(binary) <= resolve_max_image_bytes():
+        return binary, mime_type
+
+    # Phone photos are often stored sideways with an EXIF rotation flag.
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge))
+    if image.mode not in {"RGB", "L"}:
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=_JPEG_QUALITY, optimize=True)
+    resized = output.getvalue()
+    if mime_type and len(resized) >= len(binary):
+        return binary, mime_type
+    return resized, "image/jpeg"
+
+
+def _menu_pages(reader):
+    """Return ([(page_index, text)], found) where found means the text layer scored as a menu."""
+    pages = []
+    for index, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception as exc:
+            print("parse_image pdf text failed", {"page": index, "error": str(exc)})
+            text = ""
+        pages.append((index, text))
+    menu_pages = [(index, text) for index, text in pages if menu_region.score_block(text) >= _MIN_PAGE_SCORE]
+    return (menu_pages or pages)[: resolve_max_pages()], bool(menu_pages)
+
+
+def _page_images(reader, page_indexes: list[int]) -> list:
+    images = []
+    for index in page_indexes:
+        try:
+            page_images = list(reader.pages[index].images)
+        except Exception as exc:
+            print("parse_image pdf image failed", {"page": index, "error": str(exc)})
+            continue
+        # A scanned page is normally one full-page image; take the largest.
+        if page_images:
+            largest = max(page_images, key=lambda image: len(image.data))
+            images.append(downscale_image(largest.data))
+    return images
+
+
+def prepare_pdf(binary: bytes) -> dict:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return {"text": None, "images": [(binary, "application/pdf")], "report": {"kind": "pdf"}}
+
+    reader = PdfReader(io.BytesIO(binary))
+    pages, found = _menu_pages(reader)
+    text = "\n\n".join(page_text.strip() for _index, page_text in pages if page_text.strip())
+    report = {"kind": "pdf", "pages": len(reader.pages), "menu_pages": [index + 1 for index, _text in pages]}
+    if found and len(text) >= _MIN_TEXT_CHARS:
+        return {"text": text, "images": [], "report": {**report, "path": "text", "text_chars": len(text)}}
+
+    images = _page_images(reader, [index for index, _text in pages])
+    if images:
+        return {
+            "text": None,
+            "images": images,
+            "report": {**report, "path": "page_images", "image_bytes": sum(len(data) for data, _mime in images)},
+        }
+    return {"text": None, "images": [(binary, "application/pdf")], "report": {**report, "path": "pdf"}}
+
+
+def _payload_size(images: list) -> int:
+    return sum(openai_client.encoded_size(len(data)) for data, _mime in images) + _PROMPT_BYTES
+
+
+def fit_payload(prepared: dict) -> dict:
+    """Downscale images further until the request fits OPENAI_MAX_PAYLOAD_BYTES.
+
+    PDFs sent as files cannot be shrunk here; query_chatgpt rejects them
+    with PayloadTooLarge if they are still over the limit.
+    """
+    limit = openai_client.resolve_max_payload_bytes()
+    edge = resolve_max_edge()
+    while prepared["images"] and _payload_size(prepared["images"]) > limit and edge > _MIN_EDGE:
+        edge = max(_MIN_EDGE, int(edge * 0.7))
+        prepared["images"] = [
+            image if mime_type == "application/pdf" else downscale_image(image, edge)
+            for image, mime_type in prepared["images"]
+        ]
+        prepared["report"]["max_edge"] = edge
+    if prepared["images"]:
+        prepared["report"]["payload_bytes"] = _payload_size(prepared["images"])
+    return prepared
+
+
+def prepare_upload(binary: bytes) -> dict:
+    """Turn an uploaded menu into either text or a list of (bytes, mime_type) images.
+
+    PDFs with a text layer take the cheaper text path. Scanned PDFs send the
+    images of their menu pages, and photos are downscaled before upload.
+    """
+    if openai_client.detect_mime_type(binary) == "application/pdf":
+        prepared = prepare_pdf(binary)
+    else:
+        image = downscale_image(binary)
+        prepared = {"text": None, "images": [image], "report": {"kind": "image", "path": "image"}}
+    prepared["report"]["original_bytes"] = len(binary)
+    return fit_payload(prepared)
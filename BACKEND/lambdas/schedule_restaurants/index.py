@@ -0,0 +1,140 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from enqueue_restaurants import index as enqueue_restaurants  # noqa: E402
+from shared import concurrency  # noqa: E402
+from shared import date_utils  # noqa: E402
+
+
+def resolve_default_offset_hours() -> float:
+    # Monday 08:00 UTC, the old fixed weekly schedule.
+    return float(os.environ.get("DEFAULT_PUBLISH_OFFSET_HOURS", "8"))
+
+
+def resolve_history_weeks() -> int:
+    return int(os.environ.get("PUBLISH_HISTORY_WEEKS", "8"))
+
+
+def resolve_early_margin_hours() -> float:
+    return float(os.environ.get("EARLY_MARGIN_HOURS", "2"))
+
+
+def resolve_poll_interval_hours() -> float:
+    return float(os.environ.get("POLL_INTERVAL_MINUTES", "30")) / 60
+
+
+def resolve_max_poll_interval_hours() -> float:
+    return float(os.environ.get("MAX_POLL_INTERVAL_HOURS", "12"))
+
+
+def _string(item: dict, name: str) -> str | None:
+    return item.get(name, {}).get("S")
+
+
+def _number(item: dict, name: str, default: float = 0) -> float:
+    value = item.get(name, {}).get("N")
+    return float(value) if value is not None else default
+
+
+def expected_offset_hours(item: dict) -> float:
+    """Hours into the week a new menu usually appears, from SCHEDULE publish_offsets.
+
+    Uses the lower quartile of recent weeks: polling a little early costs a
+    cheap conditional fetch, polling late leaves the API without a menu.
+    """
+    offsets = [float(value["N"]) for value in item.get("publish_offsets", {}).get("L", [])]
+    recent = sorted(offsets[-resolve_history_weeks():])
+    if not recent:
+        return resolve_default_offset_hours()
+    return recent[len(recent) // 4]
+
+
+def poll_interval_hours(attempts: int) -> float:
+    """Back-off between polls once the expected publish time has passed."""
+    return min(resolve_max_poll_interval_hours(), resolve_poll_interval_hours() * 2 ** max(0, attempts - 1))
+
+
+def is_due(item: dict, week: str, now_offset: float, now: float) -> bool:
+    """item is the restaurant's SCHEDULE item, or {} before its first import."""
+    if _string(item, "last_parsed_week") == week:
+        return False
+    if now_offset < expected_offset_hours(item) - resolve_early_margin_hours():
+        return False
+    if _string(item, "poll_week") != week:
+        return True
+    attempts = int(_number(item, "poll_attempts"))
+    return now - _number(item, "last_polled_at") >= poll_interval_hours(attempts) * 3600
+
+
+def record_poll(table_name: str, restaurant_id: str, item: dict, week: str, now: float):
+    attempts = int(_number(item, "poll_attempts")) + 1 if _string(item, "poll_week") == week else 1
+    enqueue_restaurants.ddb.update_item(
+        TableName=table_name,
+        Key={"restaurant_id": {"S": restaurant_id}, "sk": {"S": enqueue_restaurants.SCHEDULE_SK}},
+        UpdateExpression="SET poll_week = :week, poll_attempts = :attempts, last_polled_at = :now",
+        ExpressionAttributeValues={
+            ":week": {"S": week},
+            ":attempts": {"N": str(attempts)},
+            ":now": {"N": str(int(now))},
+        },
+    )
+
+
+def handler(event, _context):
+    """Enqueue the restaurants whose menu is due, instead of all of them once a week.
+
+    Runs every POLL_INTERVAL_MINUTES. A restaurant is due from its expected
+    publish time (minus EARLY_MARGIN_HOURS) until import_to_ddb records a
+    new menu for the week, polled with exponential back-off in between.
+    """
+    table_name = os.environ["TABLE_NAME"]
+    queue_url = os.environ["QUEUE_URL"]
+    event = event if isinstance(event, dict) else {}
+    week = date_utils.build_week()
+    now_offset = date_utils.week_offset_hours()
+    now = time.time()
+
+    infos = list(enqueue_restaurants.iter_info_items(table_name, enqueue_restaurants.resolve_segments()))
+    schedules = enqueue_restaurants.get_schedule_items(table_name, [_string(info, "restaurant_id") for info in infos])
+    due = []
+    pending = 0
+    for info in infos:
+        message = enqueue_restaurants.build_message(info)
+        if not message:
+            continue
+        item = schedules.get(message["restaurant_id"], {})
+        if event.get("force") or is_due(item, week, now_offset, now):
+            due.append((item, message))
+        elif _string(item, "last_parsed_week") != week:
+            pending += 1
+
+    messages = enqueue_restaurants.group_by_url([message for _item, message in due])
+    failed = enqueue_restaurants.send_messages(queue_url, messages)
+    failed_ids = {
+        restaurant_id for message in failed for restaurant_id in enqueue_restaurants.message_restaurant_ids(message)
+    }
+    sent = [(item, message) for item, message in due if message["restaurant_id"] not in failed_ids]
+    outcomes = concurrency.run_concurrently(
+        sent,
+        lambda entry: record_poll(table_name, entry[1]["restaurant_id"], entry[0], week, now),
+        concurrency.resolve_concurrency(8),
+    )
+    poll_failures = concurrency.collect_failures(outcomes, lambda entry: {"restaurant_id": entry[1]["restaurant_id"]})
+
+    print(
+        "schedule_restaurants done",
+        {
+            "week": week,
+            "week_offset_hours": round(now_offset, 2),
+            "enqueued": len(sent),
+            "waiting": pending,
+            "failed": sorted(failed_ids),
+            "poll_state_failed": poll_failures,
+        },
+    )
+    if failed:
+        raise RuntimeError(f"schedule_restaurants failed to send {len(failed)} of {len(messages)} messages")
+    return {"ok": True, "enqueued": len(sent)}
@@ -0,0 +1,92 @@
+import json
+import os
+from pathlib import Path
+
+from shared import storage
+
+# Resolved store per prefix (None when caching is off), kept for warm invocations.
+_STORES = {}
+
+
+class S3Store:
+    def __init__(self, bucket: str, prefix: str):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}"
+
+    def get_json(self, key: str):
+        try:
+            obj = storage.s3.get_object(Bucket=self.bucket, Key=self._key(key))
+        except storage.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(obj["Body"].read().decode("utf-8"))
+
+    def put_json(self, key: str, value: dict):
+        storage.s3.put_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            Body=json.dumps(value, ensure_ascii=False).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+
+class LocalStore:
+    def __init__(self, root: str, prefix: str):
+        self.root = Path(root) / prefix.strip("/")
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def get_json(self, key: str):
+        path = self._path(key)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def put_json(self, key: str, value: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+
+
+def resolve_store(prefix: str):
+    bucket = os.environ.get("CACHE_BUCKET")
+    backend = os.environ.get("CACHE_BACKEND", "s3" if bucket else "none").strip().lower()
+    if backend == "s3":
+        if not bucket:
+            raise RuntimeError("CACHE_BUCKET is required when CACHE_BACKEND=s3")
+        return S3Store(bucket, prefix)
+    if backend == "local":
+        return LocalStore(os.environ.get("CACHE_DIR", ".cache"), prefix)
+    return None
+
+
+def get_store(prefix: str):
+    if prefix not in _STORES:
+        _STORES[prefix] = resolve_store(prefix)
+    return _STORES[prefix]
+
+
+def get_json(prefix: str, key: str):
+    """Read one entry; None when caching is off, the key is missing or the read fails."""
+    store = get_store(prefix)
+    if not store:
+        return None
+    try:
+        return store.get_json(key)
+    except Exception as exc:
+        print("cache_store read failed", {"prefix": prefix, "key": key, "error": str(exc)})
+        return None
+
+
+def put_json(prefix: str, key: str, value: dict):
+    """Write one entry; failures are logged, never raised."""
+    store = get_store(prefix)
+    if not store:
+        return
+    try:
+        store.put_json(key, value)
+    except Exception as exc:
+        print("cache_store write failed", {"prefix": prefix, "key": key, "error": str(exc)})
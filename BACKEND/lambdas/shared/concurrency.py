@@ -0,0 +1,51 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+_local = threading.local()
+
+
+def resolve_concurrency(default: int = 4) -> int:
+    return max(1, int(os.environ.get("RECORD_CONCURRENCY", str(default))))
+
+
+def run_concurrently(items, fn, max_workers: int):
+    """Run fn for every item on a bounded thread pool.
+
+    Returns (item, result, error) tuples in input order. Exceptions are
+    captured per item so one failure does not stop the others.
+    """
+
+    def _run(item):
+        try:
+            return item, fn(item), None
+        except Exception as exc:
+            return item, None, exc
+
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [_run(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(_run, items))
+
+
+def collect_failures(outcomes, describe) -> list[dict]:
+    """Structured failure entries for the (item, result, error) tuples that failed."""
+    return [
+        {**describe(item), "error": f"{type(error).__name__}: {error}"}
+        for item, _result, error in outcomes
+        if error is not None
+    ]
+
+
+def thread_table(table_name: str):
+    """Return a DynamoDB Table owned by the calling thread.
+
+    boto3 resources are not thread-safe, so each worker gets its own session.
+    """
+    tables = _local.__dict__.setdefault("tables", {})
+    if table_name not in tables:
+        tables[table_name] = boto3.session.Session().resource("dynamodb").Table(table_name)
+    return tables[table_name]
@@ -0,0 +1,134 @@
+import csv
+import io
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+CSV_HEADER = ["day", "lunch", "price", "tags"]
+# Compact output: one row per dish, with all its weekdays in the first field.
+COMPACT_CSV_HEADER = ["days", "lunch", "price", "tags"]
+DAYS_SEPARATOR = "|"
+_DAY_ALIASES = {
+    "mon": "mon",
+    "monday": "mon",
+    "mån": "mon",
+    "måndag": "mon",
+    "tue": "tue",
+    "tuesday": "tue",
+    "tis": "tue",
+    "tisdag": "tue",
+    "wed": "wed",
+    "wednesday": "wed",
+    "ons": "wed",
+    "onsdag": "wed",
+    "thu": "thu",
+    "thursday": "thu",
+    "tor": "thu",
+    "tors": "thu",
+    "torsdag": "thu",
+    "fri": "fri",
+    "friday": "fri",
+    "fre": "fri",
+    "fredag": "fri",
+}
+_WEEKDAYS = ["mon", "tue", "wed", "thu", "fri"]
+_DAYS_SPLIT_RE = re.compile(r"\s*[|,;/ ]\s*")
+_DAY_RANGE_RE = re.compile(r"^(\w+)\s*[-–]\s*(\w+)$")
+# Thousands may be grouped with a space, no-break space or narrow no-break space ("1 295").
+_PRICE_RE = re.compile(r"(\d{1,3}(?:[ \u00a0\u202f]\d{3}(?!\d))+|\d+)(?:[.,](\d+))?")
+_FENCE_RE = re.compile(r"^\s*```")
+
+
+def normalize_day(raw: str) -> str:
+    value = raw.strip().lower().rstrip(":.")
+    return _DAY_ALIASES.get(value, value)
+
+
+def normalize_days(raw: str) -> str:
+    """Normalize a compact days field such as "Mån, Ons", "mon-fri" or "hela veckan"."""
+    value = raw.strip().lower().rstrip(":.")
+    if value in {"hela veckan", "all week", "alla dagar"}:
+        return DAYS_SEPARATOR.join(_WEEKDAYS)
+    match = _DAY_RANGE_RE.match(value)
+    if match:
+        first, last = normalize_day(match.group(1)), normalize_day(match.group(2))
+        if first in _WEEKDAYS and last in _WEEKDAYS:
+            return DAYS_SEPARATOR.join(_WEEKDAYS[_WEEKDAYS.index(first) : _WEEKDAYS.index(last) + 1])
+    days = [normalize_day(day) for day in _DAYS_SPLIT_RE.split(value) if day]
+    return DAYS_SEPARATOR.join(dict.fromkeys(days))
+
+
+def normalize_price(raw: str) -> str:
+    """Whole kronor of the first number in a price such as "129 kr", "89,50", "1 295:-" or "95/115".
+
+    This is the integer format import_to_ddb stores; it uses the same function.
+    """
+    match = _PRICE_RE.search(raw)
+    if not match:
+        return ""
+    whole, fraction = match.groups()
+    whole = re.sub(r"\D", "", whole)
+    value = Decimal(f"{whole}.{fraction or 0}").quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    return str(int(value))
+
+
+def normalize_tags(raw: str) -> str:
+    tags = [tag.strip().lower() for tag in re.split(r"[|,;]", raw)]
+    return " | ".join(tag for tag in tags if tag)
+
+
+def _looks_like_price(raw: str) -> bool:
+    return not raw.strip() or bool(_PRICE_RE.search(raw))
+
+
+def repair_header(row: list[str]) -> list[str]:
+    normalized = [field.strip().lower() for field in row]
+    if normalized in (CSV_HEADER, COMPACT_CSV_HEADER):
+        return normalized
+    return row
+
+
+def repair_row(row: list[str], compact: bool = False) -> list[str]:
+    if len(row) > 4 and _looks_like_price(row[-2]):
+        # Unquoted comma inside the dish name.
+        row = [row[0], ",".join(row[1:-2]), row[-2], row[-1]]
+    elif len(row) == 3 and _looks_like_price(row[2]):
+        row = row + [""]
+    if len(row) != 4:
+        return row
+    day, lunch, price, tags = row
+    day = normalize_days(day) if compact else normalize_day(day)
+    return [day, lunch.strip(), normalize_price(price), normalize_tags(tags)]
+
+
+def is_fence(line: str) -> bool:
+    return bool(_FENCE_RE.match(line))
+
+
+def parse_rows(csv_text: str) -> list[list[str]]:
+    lines = [line for line in csv_text.splitlines() if line.strip() and not is_fence(line)]
+    return [row for row in csv.reader(io.StringIO("\n".join(lines))) if any(field.strip() for field in row)]
+
+
+def rows_to_csv(header: list[str], rows: list[list[str]]) -> str:
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue().strip()
+
+
+def repair_locally(csv_text: str) -> tuple[list[str], list[list[str]]]:
+    """Apply deterministic fixes and return (header, rows).
+
+    Strips code fences and any prose before the header row, then
+    normalizes day names, prices and tags row by row.
+    """
+    rows = parse_rows(csv_text)
+    for index, row in enumerate(rows):
+        if repair_header(row) in (CSV_HEADER, COMPACT_CSV_HEADER):
+            rows = rows[index:]
+            break
+    if not rows:
+        return [], []
+    header = repair_header(rows[0])
+    return header, [repair_row(row, header == COMPACT_CSV_HEADER) for row in rows[1:]]
@@ -1,5 +1,5 @@
 import re
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 
 _WEEKLY_KEY_RE = re.compile(r"^weekly/year=(\d{4})/week=(\d{2})/(.+)\.csv$")
@@ -11,6 +11,20 @@ def build_weekly_key(restaurant_id: str, date: datetime | None = None) -> str:
     return f"weekly/year={year}/week={week:02d}/{restaurant_id}.csv"
 
 
+def build_week(date: datetime | None = None) -> str:
+    """ISO week as stored on menu items, e.g. "2025_07"."""
+    current = date or datetime.now(timezone.utc)
+    year, week, _ = current.isocalendar()
+    return f"{year}_{week:02d}"
+
+
+def week_offset_hours(date: datetime | None = None) -> float:
+    """Hours since Monday 00:00 UTC of the date's ISO week."""
+    current = date or datetime.now(timezone.utc)
+    start = (current - timedelta(days=current.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (current - start).total_seconds() / 3600
+
+
 def parse_weekly_key(key: str):
     match = _WEEKLY_KEY_RE.match(key)
     if not match:
@@ -0,0 +1,29 @@
+import hashlib
+import time
+
+from shared import cache_store
+
+_PREFIX = "fetch-state"
+
+
+def body_digest(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def build_state_key(restaurant_id: str, url: str) -> str:
+    url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return f"{restaurant_id}/{url_hash}.json"
+
+
+def get_state(restaurant_id: str, url: str):
+    return cache_store.get_json(_PREFIX, build_state_key(restaurant_id, url))
+
+
+def save_state(restaurant_id: str, url: str, state: dict):
+    entry = {
+        **state,
+        "url": url,
+        "restaurant_id": restaurant_id,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    cache_store.put_json(_PREFIX, build_state_key(restaurant_id, url), entry)
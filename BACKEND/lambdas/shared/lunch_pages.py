@@ -0,0 +1,165 @@
+import gzip
+import json
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from shared import storage
+
+ddb = boto3.resource("dynamodb")
+
+PAGE_PREFIX = "lunch-pages"
+INFO_FIELDS = (
+    "restaurant_name",
+    "url",
+    "city_name",
+    "info",
+    "lunch_hours",
+    "address",
+    "coordinates",
+    "phone",
+)
+
+
+def page_prefix(city: str, week: str, day: str) -> str:
+    return f"{PAGE_PREFIX}/{city}/{week}/{day}/"
+
+
+def page_key(city: str, week: str, day: str, area: str | None = None) -> str:
+    return f"{page_prefix(city, week, day)}{area or 'all'}.json.gz"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload) -> str:
+    return json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+
+def _query_menu_items(table, index_name: str, city: str, week: str, day: str):
+    query_args = {
+        "IndexName": index_name,
+        "KeyConditionExpression": Key("city_week_day").eq(f"{city}#{week}#{day}"),
+    }
+    while True:
+        result = table.query(**query_args)
+        yield from result.get("Items", [])
+        last_key = result.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        query_args["ExclusiveStartKey"] = last_key
+
+
+def _get_info_items(table, restaurant_ids: list[str]) -> dict:
+    infos = {}
+    for start in range(0, len(restaurant_ids), 100):
+        request = {
+            table.name: {
+                "Keys": [
+                    {"restaurant_id": restaurant_id, "sk": "INFO"}
+                    for restaurant_id in restaurant_ids[start : start + 100]
+                ]
+            }
+        }
+        while request:
+            result = ddb.batch_get_item(RequestItems=request)
+            for item in result.get("Responses", {}).get(table.name, []):
+                infos[item["restaurant_id"]] = item
+            request = result.get("UnprocessedKeys") or None
+    return infos
+
+
+def _page(city: str, area: str | None, week: str, day: str, items: list) -> dict:
+    return {"city": city, "area": area, "week": week, "day": day, "items": items}
+
+
+def page_entries(table, city: str, week: str, day: str, menu_items: list) -> list:
+    """Project MENU items to the /lunch item shape: dishes plus INFO display fields."""
+    infos = _get_info_items(table, sorted({item["restaurant_id"] for item in menu_items}))
+    entries = []
+    for item in menu_items:
+        info = infos.get(item["restaurant_id"], {})
+        entry = {
+            "restaurant_id": item["restaurant_id"],
+            "city": city,
+            "area": item.get("area") or info.get("area", ""),
+            "week": week,
+            "day": day,
+            "dishes": item.get("dishes", []),
+        }
+        for field in INFO_FIELDS:
+            entry[field] = info.get(field, "")
+        entries.append(entry)
+    return entries
+
+
+def build_lunch_pages(
+    table, index_name: str, city: str, week: str, day: str, written: dict | None = None
+) -> dict:
+    """Return {area or None: document} for one city/week/day.
+
+    Each document lists every restaurant serving lunch that day with its
+    dishes joined with the display fields from its INFO item. The None key
+    holds the city-wide document.
+
+    written maps restaurant_id to the menu item just written for this day
+    (None when it was deleted or moved to another city). GSI reads are
+    eventually consistent, so these replace what the query returns.
+    """
+    menu_items = {item["restaurant_id"]: item for item in _query_menu_items(table, index_name, city, week, day)}
+    menu_items.update(written or {})
+    entries = page_entries(table, city, week, day, [item for item in menu_items.values() if item is not None])
+    entries.sort(key=lambda entry: (entry["restaurant_name"] or entry["restaurant_id"]).lower())
+
+    pages = {None: _page(city, None, week, day, entries)}
+    for area in sorted({entry["area"] for entry in entries if entry["area"]}):
+        pages[area] = _page(city, area, week, day, [entry for entry in entries if entry["area"] == area])
+    return pages
+
+
+def published_areas(bucket: str, city: str, week: str, day: str) -> set:
+    prefix = page_prefix(city, week, day)
+    areas = set()
+    paginator = storage.s3.get_paginator("list_objects_v2")
+    for result in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in result.get("Contents", []):
+            area = obj["Key"][len(prefix) :].removesuffix(".json.gz")
+            if area != "all":
+                areas.add(area)
+    return areas
+
+
+def publish_lunch_pages(bucket: str, city: str, week: str, day: str, pages: dict):
+    # An area whose last restaurant left gets an empty page instead of
+    # keeping its old one.
+    for area in published_areas(bucket, city, week, day) - set(pages):
+        pages[area] = _page(city, area, week, day, [])
+    for area, document in pages.items():
+        # mtime=0 keeps the gzip bytes, and so the S3 ETag, stable for unchanged content.
+        body = gzip.compress(dumps(document).encode("utf-8"), mtime=0)
+        storage.s3.put_object(
+            Bucket=bucket,
+            Key=page_key(city, week, day, area),
+            Body=body,
+            ContentType="application/json",
+            ContentEncoding="gzip",
+            CacheControl="public, max-age=300",
+        )
+    print(
+        "lunch pages published",
+        {"city": city, "week": week, "day": day, "areas": [area or "all" for area in pages]},
+    )
+
+
+def get_lunch_page(bucket: str, city: str, week: str, day: str, area: str | None = None):
+    """Return (document, etag) for a published page, or None when there is none."""
+    try:
+        obj = storage.s3.get_object(Bucket=bucket, Key=page_key(city, week, day, area))
+    except storage.s3.exceptions.NoSuchKey:
+        return None
+    document = json.loads(gzip.decompress(obj["Body"].read()).decode("utf-8"))
+    return document, obj["ETag"]
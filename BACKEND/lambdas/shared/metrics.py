@@ -0,0 +1,117 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+_UNITS = {"ms": "Milliseconds", "bytes": "Bytes"}
+_CURRENT = threading.local()
+
+
+def resolve_log_level() -> int:
+    return _LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").strip().upper(), _LEVELS["INFO"])
+
+
+def debug_enabled() -> bool:
+    return resolve_log_level() <= _LEVELS["DEBUG"]
+
+
+def log_debug(message: str, data: dict):
+    """Print only with LOG_LEVEL=DEBUG; for full events, payloads and raw responses."""
+    if debug_enabled():
+        print(message, data)
+
+
+def resolve_namespace() -> str:
+    return os.environ.get("METRICS_NAMESPACE", "PadevLunch")
+
+
+def _unit_for(name: str) -> str:
+    return _UNITS.get(name.rsplit("_", 1)[-1], "Count")
+
+
+class MetricsContext:
+    """Metrics for one unit of work, flushed as a single EMF log line.
+
+    CloudWatch extracts every value as a metric under both the task and the
+    task+restaurant_id dimension sets; properties are only searchable in logs.
+    """
+
+    def __init__(self, dimensions: dict):
+        self.dimensions = {name: str(value) for name, value in dimensions.items() if value}
+        self.values = {}
+        self.properties = {}
+
+    def put(self, name: str, value: float):
+        self.values[name] = self.values.get(name, 0) + value
+
+    def set_property(self, name: str, value):
+        self.properties[name] = value
+
+    def to_emf(self) -> dict:
+        dimension_sets = [["task"], list(self.dimensions)] if len(self.dimensions) > 1 else [list(self.dimensions)]
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": resolve_namespace(),
+                        "Dimensions": [names for names in dimension_sets if names],
+                        "Metrics": [{"Name": name, "Unit": _unit_for(name)} for name in sorted(self.values)],
+                    }
+                ],
+            },
+            **self.properties,
+            **self.dimensions,
+            **{name: round(value, 1) for name, value in self.values.items()},
+        }
+
+    def flush(self):
+        if self.values:
+            print(json.dumps(self.to_emf(), ensure_ascii=False, default=str))
+        self.values = {}
+
+
+def current() -> MetricsContext | None:
+    return getattr(_CURRENT, "context", None)
+
+
+@contextlib.contextmanager
+def scope(task: str, restaurant_id: str | None = None):
+    """Collect metrics recorded in this thread and emit them on exit.
+
+    Each record is handled in its own worker thread, so scopes for
+    concurrently processed restaurants do not mix.
+    """
+    previous = current()
+    context = MetricsContext({"task": task, "restaurant_id": restaurant_id})
+    _CURRENT.context = context
+    try:
+        yield context
+    except Exception as exc:
+        context.put("failures", 1)
+        context.set_property("error", f"{type(exc).__name__}: {exc}"[:500])
+        raise
+    finally:
+        _CURRENT.context = previous
+        context.flush()
+
+
+def put(name: str, value: float = 1):
+    """Add to a metric of the current scope; a no-op outside of one.
+
+    Names ending in _ms and _bytes get the Milliseconds and Bytes units.
+    """
+    context = current()
+    if context is not None:
+        context.put(name, value)
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        put(f"{stage}_ms", (time.perf_counter() - start) * 1000)
@@ -0,0 +1,47 @@
+import time
+
+from shared import cache_store
+
+_PREFIX = "model-stats"
+# Outcomes and latencies kept per model; older ones are dropped.
+_WINDOW = 10
+
+
+def build_stats_key(restaurant_id: str, task: str) -> str:
+    return f"{restaurant_id}/{task}.json"
+
+
+def get_stats(restaurant_id: str | None, task: str) -> dict:
+    if not restaurant_id:
+        return {}
+    return cache_store.get_json(_PREFIX, build_stats_key(restaurant_id, task)) or {}
+
+
+def save_stats(restaurant_id: str | None, task: str, stats: dict):
+    if not restaurant_id:
+        return
+    entry = {
+        **stats,
+        "restaurant_id": restaurant_id,
+        "task": task,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    cache_store.put_json(_PREFIX, build_stats_key(restaurant_id, task), entry)
+
+
+def record_outcome(stats: dict, model: str, ok: bool, latency_ms: float):
+    entry = stats.setdefault("models", {}).setdefault(model, {"outcomes": [], "latency_ms": []})
+    entry["outcomes"] = (entry["outcomes"] + [ok])[-_WINDOW:]
+    entry["latency_ms"] = (entry["latency_ms"] + [round(latency_ms)])[-_WINDOW:]
+
+
+def failure_rate(stats: dict, model: str) -> float | None:
+    outcomes = stats.get("models", {}).get(model, {}).get("outcomes", [])
+    if not outcomes:
+        return None
+    return outcomes.count(False) / len(outcomes)
+
+
+def median_latency_ms(stats: dict, model: str) -> float | None:
+    latencies = sorted(stats.get("models", {}).get(model, {}).get("latency_ms", []))
+    return latencies[len(latencies) // 2] if latencies else None
@@ -0,0 +1,88 @@
+import json
+import uuid
+
+from shared import openai_client
+
+BATCH_ENDPOINT = "/v1/responses"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_line(custom_id: str, request: dict) -> str:
+    return json.dumps(
+        {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": request,
+        },
+        ensure_ascii=False,
+    )
+
+
+def _multipart_body(fields: dict, filename: str, content: bytes, content_type: str):
+    boundary = f"----padevlunch{uuid.uuid4().hex}"
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode("utf-8")
+        )
+    parts.append(
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode("utf-8")
+    )
+    parts.append(content)
+    parts.append(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def upload_batch_file(lines: list[str]) -> str:
+    content = ("\n".join(lines) + "\n").encode("utf-8")
+    body, content_type = _multipart_body(
+        {"purpose": "batch"}, "batch.jsonl", content, "application/jsonl"
+    )
+    raw = openai_client.openai_request("POST", "/v1/files", body, content_type=content_type)
+    return json.loads(raw)["id"]
+
+
+def create_batch(input_file_id: str, metadata: dict | None = None) -> dict:
+    request = {
+        "input_file_id": input_file_id,
+        "endpoint": BATCH_ENDPOINT,
+        "completion_window": "24h",
+    }
+    if metadata:
+        request["metadata"] = metadata
+    raw = openai_client.openai_request("POST", "/v1/batches", json.dumps(request).encode("utf-8"))
+    return json.loads(raw)
+
+
+def get_batch(batch_id: str) -> dict:
+    return json.loads(openai_client.openai_request("GET", f"/v1/batches/{batch_id}"))
+
+
+def download_file(file_id: str) -> str:
+    return openai_client.openai_request("GET", f"/v1/files/{file_id}/content").decode("utf-8")
+
+
+def parse_batch_output(jsonl_text: str) -> dict:
+    """Map custom_id to {"text": ...} or {"error": ...} for each output line."""
+    results = {}
+    for line in jsonl_text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        custom_id = entry.get("custom_id")
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code", 200) >= 400:
+            results[custom_id] = {"error": entry.get("error") or response.get("body")}
+            continue
+        try:
+            results[custom_id] = {
+                "text": openai_client.extract_response_text(response.get("body") or {}).strip()
+            }
+        except ValueError as exc:
+            results[custom_id] = {"error": str(exc)}
+    return results
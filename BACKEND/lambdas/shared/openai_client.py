@@ -1,16 +1,46 @@
 import base64
 import csv
+import hashlib
 import io
 import json
 import os
+import random
+import re
+import secrets
+import threading
 import time
-import urllib.request
 
 import boto3
+import requests
+from requests.adapters import HTTPAdapter
+
+from shared import csv_repair
+from shared import metrics
+from shared import model_stats
+from shared import parse_cache
 
 DEFAULT_MODEL = "gpt-4.1-2025-04-14"
 #DEFAULT_MODEL = "gpt-5-nano-2025-08-07" #"gpt-5-nano"
 _OPENAI_SECRET_CACHE = {}
+_OPENAI_SECRET_LOCK = threading.Lock()
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_REQUEST_STATS = {}
+_REQUEST_STATS_LOCK = threading.Lock()
+# time.monotonic() by which OpenAI work must stop; see set_deadline.
+_DEADLINE = None
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Image and PDF bytes are left out of the request dict and spliced in as
+# base64 while the body is sent; see StreamedRequestBody. The nonce is new
+# for every request, so scraped page text cannot forge a placeholder.
+_FILE_PLACEHOLDER = "@@file:{}:{}@@"
+_FILE_PLACEHOLDER_PATTERN = r"@@file:{}:(\d+)@@"
+_ENCODE_CHUNK_BYTES = 3 * 64 * 1024
+STREAM_MAX_INVALID_ROWS = 3
+# Prose before the header ("Här är menyn:") is stripped by repair_locally,
+# so streaming tolerates a few such lines before giving up.
+STREAM_MAX_PREAMBLE_LINES = 3
+STREAM_MAX_PREAMBLE_CHARS = 1000
 SYSTEM_PROMPT = (
     f"""You extract restaurant lunch menus and return a clean CSV.
 Return only CSV text with a header row. Use UTF-8 and keep Swedish diacritics.
@@ -30,11 +60,31 @@ mon,"Marinerad kycklingstek med rostad potatis & rotfrukter",169,husmanskost
 tue,"Gravad lax med dillstuvad potatis serveras med citron och sallad på rädisa & sockerärtor.",169,fisk | svenskt | husmanskost
 """
 )
+COMPACT_SYSTEM_PROMPT = (
+    f"""You extract restaurant lunch menus and return a clean, compact CSV.
+Return only CSV text with a header row. Use UTF-8 and keep Swedish diacritics.
+Format and rules:
+- Header: days,lunch,price,tags
+- One row per dish. Never repeat a dish for each day; list all days it is served in days.
+- days are lowercase mon,tue,wed,thu,fri joined by "|" without spaces, e.g. mon|wed (ignore weekends unless explicitly present).
+- A dish served all week ("hela veckan", "veckans", "alla dagar") gets mon|tue|wed|thu|fri.
+- price is numeric; if missing, leave blank.
+- tags are lowercase and separated by " | " (pipe with spaces). Use a few best-fit tags.
+- Quote fields containing commas or quotes; escape quotes with double quotes.
+- Output only CSV, no explanations or markdown.
+
+Example:
+days,lunch,price,tags
+mon,"Pocherad torsk med kokt potatis, räkor, ägg, pepparrot & brynt smör.",169,fisk | svenskt | husmanskost
+mon|tue|wed|thu|fri,"Veckans vegetariska: Halloumi med bulgur och tzatziki",149,vegetariskt
+tue|thu,"Gravad lax med dillstuvad potatis serveras med citron och sallad på rädisa & sockerärtor.",169,fisk | svenskt | husmanskost
+"""
+)
 HTML_PROMPT = (
     f"""Parse the following HTML content and extract the lunch menu for each day of the week.
 For each day, provide the day of the week, what's for lunch, and the price. There might be multiple lunch options for a day. Keep all text in Swedish.
 The day of the week should always be in lowercase, 3-letter shortened as mon, tue, wed, thu, fri.
-Some courses can be for multiple days; copy them for each day they are on the menu.
+Some courses are served on multiple days; include every day they are on the menu.
 Also tag the dish (e.g. italian, asian, swedish, husmanskost). A dish can have multiple tags.
 Ignore non-menu content such as opening hours or addresses.
 Return only CSV and follow the CSV schema from the system prompt.
@@ -44,30 +94,38 @@ IMAGE_PROMPT = (
     f"""Parse the included PDF or image and extract the lunch menu for each day of the week.
 For each day, provide the day of the week, what's for lunch, and the price. There might be multiple lunch options for a day. Keep all text in Swedish.
 The day of the week should always be in lowercase, 3-letter shortened as mon, tue, wed, thu, fri.
-Some courses can be for multiple days; copy them for each day they are on the menu.
+Some courses are served on multiple days; include every day they are on the menu.
 Also tag the dish (e.g. italian, asian, swedish, husmanskost). A dish can have multiple tags.
 Ignore non-menu content such as opening hours or addresses.
 Return only CSV and follow the CSV schema from the system prompt.
 """
 )
 
+REPAIR_PROMPT = (
+    f"""Some rows of a lunch menu CSV failed validation. The payload lists the rows and the validation errors.
+Return corrected versions of only these rows, following the CSV schema from the system prompt, with the header row.
+Keep all text in Swedish. Drop a row if it is not a lunch dish.
+"""
+)
+
 
 def _load_secret_value(secret_id: str) -> str | None:
-    if secret_id in _OPENAI_SECRET_CACHE:
-        return _OPENAI_SECRET_CACHE[secret_id]
+    with _OPENAI_SECRET_LOCK:
+        if secret_id in _OPENAI_SECRET_CACHE:
+            return _OPENAI_SECRET_CACHE[secret_id]
 
-    client = boto3.client("secretsmanager")
-    response = client.get_secret_value(SecretId=secret_id)
-    if "SecretString" in response and response["SecretString"]:
-        secret_value = response["SecretString"]
-    else:
-        binary = response.get("SecretBinary")
-        if not binary:
-            return None
-        secret_value = base64.b64decode(binary).decode("utf-8")
+        client = boto3.client("secretsmanager")
+        response = client.get_secret_value(SecretId=secret_id)
+        if "SecretString" in response and response["SecretString"]:
+            secret_value = response["SecretString"]
+        else:
+            binary = response.get("SecretBinary")
+            if not binary:
+                return None
+            secret_value = base64.b64decode(binary).decode("utf-8")
 
-    _OPENAI_SECRET_CACHE[secret_id] = secret_value
-    return secret_value
+        _OPENAI_SECRET_CACHE[secret_id] = secret_value
+        return secret_value
 
 
 def resolve_openai_api_key() -> str | None:
@@ -99,6 +157,36 @@ def resolve_openai_api_key() -> str | None:
     return secret_value
 
 
+def resolve_model() -> str:
+    return os.environ.get("OPENAI_MODEL", DEFAULT_MODEL)
+
+
+def resolve_model_tiers() -> list[str]:
+    """Models to try from cheapest to strongest (OPENAI_MODEL_TIERS); OPENAI_MODEL alone by default."""
+    tiers = [model.strip() for model in os.environ.get("OPENAI_MODEL_TIERS", "").split(",") if model.strip()]
+    return tiers or [resolve_model()]
+
+
+def resolve_escalate_failure_rate() -> float:
+    return float(os.environ.get("OPENAI_ESCALATE_FAILURE_RATE", "0.5"))
+
+
+def resolve_csv_format() -> str:
+    """CSV the model is asked for: "rows" (one row per dish per day) or "days" (compact)."""
+    csv_format = os.environ.get("OPENAI_CSV_FORMAT", "rows").strip().lower()
+    return csv_format if csv_format in {"rows", "days"} else "rows"
+
+
+def resolve_system_prompt(csv_format: str | None = None) -> str:
+    return COMPACT_SYSTEM_PROMPT if (csv_format or resolve_csv_format()) == "days" else SYSTEM_PROMPT
+
+
+def resolve_prompt_version(task: str) -> str:
+    task_prompt = {"html": HTML_PROMPT, "image": IMAGE_PROMPT}.get(task, "")
+    digest = hashlib.sha256(f"{resolve_system_prompt()}\n{task_prompt}".encode("utf-8")).hexdigest()
+    return digest[:12]
+
+
 def resolve_max_tokens(restaurant_id: str | None):
     override_raw = os.environ.get("OPENAI_MAX_TOKENS_OVERRIDES")
     if override_raw:
@@ -133,6 +221,11 @@ def resolve_text_verbosity() -> str | None:
     return os.environ.get("OPENAI_TEXT_VERBOSITY")
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token for Swedish/English text)."""
+    return (len(text) + 3) // 4
+
+
 def detect_mime_type(binary: bytes) -> str:
     if binary.startswith(b"%PDF"):
         return "application/pdf"
@@ -140,10 +233,36 @@ def detect_mime_type(binary: bytes) -> str:
         return "image/jpeg"
     if binary.startswith(b"\x89PNG"):
         return "image/png"
+    if binary[:4] == b"RIFF" and binary[8:12] == b"WEBP":
+        return "image/webp"
+    if binary.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
     return "image/jpeg"
 
 
-def build_openai_request(task: str, context: dict, payload: dict, model: str, max_tokens: int):
+def request_images(payload: dict) -> list:
+    # Preprocessed uploads pass (bytes, mime_type) pairs, e.g. one per PDF page.
+    return payload.get("images") or [(payload.get("binary", b""), payload.get("mime_type"))]
+
+
+def new_file_nonce() -> str:
+    return secrets.token_hex(8)
+
+
+def build_file_content(binary: bytes, mime_type: str | None = None, placeholder: str | None = None) -> dict:
+    """Content part for one file; with a placeholder the data is filled in by StreamedRequestBody."""
+    mime_type = mime_type or detect_mime_type(binary)
+    data = placeholder or base64.b64encode(binary).decode("utf-8")
+    data_url = f"data:{mime_type};base64,{data}"
+    if mime_type == "application/pdf":
+        return {"type": "input_file", "filename": "menu.pdf", "file_data": data_url}
+    return {"type": "input_image", "image_url": data_url}
+
+
+def build_openai_request(
+    task: str, context: dict, payload: dict, model: str, max_tokens: int, file_nonce: str | None = None
+):
+    """Build a Responses request; with file_nonce, image data is left as placeholders for encode_request_body."""
     if task == "html":
         user_prompt = HTML_PROMPT
         payload_block = payload.get("html", "")
@@ -161,10 +280,7 @@ def build_openai_request(task: str, context: dict, payload: dict, model: str, ma
         ]
     elif task == "image":
         user_prompt = IMAGE_PROMPT
-        binary = payload.get("binary", b"")
-        image_base64 = base64.b64encode(binary).decode("utf-8")
-        mime_type = payload.get("mime_type") or detect_mime_type(binary)
-        image_url = f"data:{mime_type};base64,{image_base64}"
+        images = request_images(payload)
         user_content = [
             {
                 "type": "input_text",
@@ -175,20 +291,38 @@ def build_openai_request(task: str, context: dict, payload: dict, model: str, ma
                     }
                 ),
             },
+            *(
+                build_file_content(
+                    binary, mime_type, _FILE_PLACEHOLDER.format(file_nonce, index) if file_nonce else None
+                )
+                for index, (binary, mime_type) in enumerate(images)
+            ),
+        ]
+    elif task == "repair":
+        user_content = [
             {
-                "type": "input_image",
-                "image_url": image_url,
-            },
+                "type": "input_text",
+                "text": json.dumps(
+                    {
+                        "prompt": REPAIR_PROMPT,
+                        "context": context,
+                        "payload": {"rows": payload.get("rows", ""), "errors": payload.get("errors", [])},
+                    }
+                ),
+            }
         ]
     else:
         raise ValueError(f"Unknown task: {task}")
 
+    # Repairs follow the format of the rows being repaired; batch results can
+    # come from a run with a different OPENAI_CSV_FORMAT.
+    system_prompt = resolve_system_prompt(payload.get("csv_format"))
     request = {
         "model": model,
         "max_output_tokens": max_tokens,
         "text": {"format": {"type": "text"}},
         "input": [
-            {"role": "system", "content": [{"type": "input_text", "text": SYSTEM_PROMPT}]},
+            {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
             {
                 "role": "user",
                 "content": user_content,
@@ -214,7 +348,52 @@ def build_openai_request(task: str, context: dict, payload: dict, model: str, ma
     return request
 
 
-def validate_csv_response(csv_text: str, restaurant_id: str | None):
+CSV_HEADER = csv_repair.CSV_HEADER
+CSV_DAYS = ["mon", "tue", "wed", "thu", "fri"]
+
+
+def csv_header_for(csv_format: str) -> list[str]:
+    return csv_repair.COMPACT_CSV_HEADER if csv_format == "days" else CSV_HEADER
+
+
+def _validate_csv_header(header: list[str], expected: list[str] = CSV_HEADER) -> list[str]:
+    if header != expected:
+        return [f"csv_header_invalid: {header}"]
+    return []
+
+
+def _validate_days_field(index: int, value: str) -> list[str]:
+    days = value.split(csv_repair.DAYS_SEPARATOR)
+    errors = [f"row_{index}_day_invalid: {day}" for day in days if day not in CSV_DAYS]
+    if len(set(days)) != len(days):
+        errors.append(f"row_{index}_days_duplicate: {value}")
+    return errors
+
+
+def _validate_csv_row(index: int, row: list[str], compact: bool = False) -> list[str]:
+    if len(row) != 4:
+        return [f"row_{index}_field_count: {len(row)}"]
+    errors = []
+    day, lunch, price, tags = row
+    if compact:
+        errors.extend(_validate_days_field(index, day))
+    elif day not in CSV_DAYS:
+        errors.append(f"row_{index}_day_invalid: {day}")
+    if not lunch.strip():
+        errors.append(f"row_{index}_lunch_empty")
+    if price.strip():
+        try:
+            float(price)
+        except ValueError:
+            errors.append(f"row_{index}_price_invalid: {price}")
+    if tags.strip():
+        for tag in tags.split(" | "):
+            if not tag or tag != tag.lower():
+                errors.append(f"row_{index}_tag_invalid: {tag}")
+    return errors
+
+
+def csv_validation_errors(csv_text: str, csv_format: str = "rows") -> list[str]:
     errors = []
     csv_text = "\n".join(line for line in csv_text.splitlines() if line.strip())
     try:
@@ -227,30 +406,16 @@ def validate_csv_response(csv_text: str, restaurant_id: str | None):
     if not rows:
         errors.append("csv_empty")
     else:
-        header = rows[0]
-        if header != ["day", "lunch", "price", "tags"]:
-            errors.append(f"csv_header_invalid: {header}")
-
+        errors.extend(_validate_csv_header(rows[0], csv_header_for(csv_format)))
         for index, row in enumerate(rows[1:], start=2):
-            if len(row) != 4:
-                errors.append(f"row_{index}_field_count: {len(row)}")
-                continue
-            day, lunch, price, tags = row
-            if day not in {"mon", "tue", "wed", "thu", "fri"}:
-                errors.append(f"row_{index}_day_invalid: {day}")
-            if not lunch.strip():
-                errors.append(f"row_{index}_lunch_empty")
-            if price.strip():
-                try:
-                    float(price)
-                except ValueError:
-                    errors.append(f"row_{index}_price_invalid: {price}")
-            if tags.strip():
-                for tag in tags.split(" | "):
-                    if not tag or tag != tag.lower():
-                        errors.append(f"row_{index}_tag_invalid: {tag}")
+            errors.extend(_validate_csv_row(index, row, csv_format == "days"))
+    return errors
+
 
+def validate_csv_response(csv_text: str, restaurant_id: str | None, csv_format: str = "rows"):
+    errors = csv_validation_errors(csv_text, csv_format)
     if errors:
+        metrics.put("validation_failures")
         print(
             "OpenAI CSV validation failed",
             {"restaurant_id": restaurant_id, "errors": errors, "csv": csv_text},
@@ -258,7 +423,92 @@ def validate_csv_response(csv_text: str, restaurant_id: str | None):
         raise ValueError("OpenAI CSV validation failed")
 
 
-def _extract_response_text(payload: dict) -> str:
+class CsvStreamAborted(ValueError):
+    pass
+
+
+class CsvStreamValidator:
+    """Validate CSV output line by line while it is still being generated.
+
+    Records go through the same local repairs as repair_csv_response first.
+    feed() raises CsvStreamAborted once more than STREAM_MAX_PREAMBLE_LINES
+    lines came before a valid header, or once more rows are broken than the
+    repair stage would recover, so the caller can close the stream instead
+    of paying for the rest of the output.
+    """
+
+    def __init__(self, csv_format: str = "rows"):
+        self.header = csv_header_for(csv_format)
+        self.compact = csv_format == "days"
+        self.pending = ""
+        self.rows = 0
+        self.preamble_lines = 0
+        self.invalid_rows = []
+
+    def _check_record(self, line: str):
+        if not line.strip() or csv_repair.is_fence(line):
+            return
+        try:
+            row = next(csv.reader(io.StringIO(line)))
+        except csv.Error as exc:
+            if self.rows == 0:
+                row = []
+            else:
+                raise CsvStreamAborted(f"csv_parse_error: {exc}") from exc
+        if self.rows == 0:
+            header = csv_repair.repair_header(row)
+            if self.compact and header == CSV_HEADER:
+                # The model ignored the compact format; rows output is still usable.
+                self.header, self.compact = CSV_HEADER, False
+            errors = _validate_csv_header(header, self.header)
+            if errors:
+                self.preamble_lines += 1
+                if self.preamble_lines > STREAM_MAX_PREAMBLE_LINES:
+                    raise CsvStreamAborted("; ".join(errors))
+                return
+        else:
+            errors = _validate_csv_row(self.rows + 1, csv_repair.repair_row(row, self.compact), self.compact)
+            if errors:
+                self.invalid_rows.append(errors)
+                if len(self.invalid_rows) > STREAM_MAX_INVALID_ROWS:
+                    raise CsvStreamAborted("; ".join(sum(self.invalid_rows, [])))
+        self.rows += 1
+
+    def feed(self, delta: str):
+        self.pending += delta
+        start = search = 0
+        while True:
+            end = self.pending.find("\n", search)
+            if end < 0:
+                break
+            record = self.pending[start:end]
+            search = end + 1
+            if self.rows and record.count('"') % 2:
+                # Newline inside a quoted field; the record continues.
+                continue
+            self._check_record(record.rstrip("\r"))
+            start = search
+        self.pending = self.pending[start:]
+        if self.rows == 0 and len(self.pending) > STREAM_MAX_PREAMBLE_CHARS:
+            raise CsvStreamAborted(f"csv_header_missing: {self.pending[:40]!r}")
+        if self.rows == 0 and self.preamble_lines >= STREAM_MAX_PREAMBLE_LINES:
+            # Out of preamble lines; reject more prose without waiting for a newline.
+            head = self.pending.lstrip().lower()
+            expected = [",".join(self.header)] + ([",".join(CSV_HEADER)] if self.compact else [])
+            if head and not (
+                any(header.startswith(head) or head.startswith(header) for header in expected)
+                or "```".startswith(head[:3])
+            ):
+                raise CsvStreamAborted(f"csv_header_invalid: {head[:40]!r}")
+
+    def finish(self):
+        line, self.pending = self.pending, ""
+        self._check_record(line.rstrip("\r"))
+        if self.rows == 0:
+            raise CsvStreamAborted("csv_empty")
+
+
+def extract_response_text(payload: dict) -> str:
     if isinstance(payload.get("output_text"), str) and payload["output_text"].strip():
         return payload["output_text"]
     if isinstance(payload.get("text"), str) and payload["text"].strip():
@@ -284,14 +534,348 @@ def _extract_response_text(payload: dict) -> str:
     raise ValueError("OpenAI response missing output text")
 
 
-def query_chatgpt(task: str, context: dict, payload: dict):
+class PayloadTooLarge(ValueError):
+    pass
+
+
+def resolve_max_payload_bytes() -> int:
+    return int(os.environ.get("OPENAI_MAX_PAYLOAD_BYTES", str(20_000_000)))
+
+
+def encoded_size(size: int) -> int:
+    """Length of the base64 encoding of size bytes."""
+    return 4 * ((size + 2) // 3)
+
+
+class StreamedRequestBody:
+    """JSON request body that base64-encodes its files chunk by chunk while sending.
+
+    Avoids holding the base64 text, the data URL and the serialized JSON of a
+    large upload in memory at once. It can be iterated again for retries, and
+    its length is known up front so requests sends a Content-Length.
+    """
+
+    def __init__(self, request_json: str, files: list[bytes], file_nonce: str | None = None):
+        # Alternates literal JSON and file bytes: [json, file, json, file, json].
+        self._parts = []
+        position = 0
+        if files and file_nonce:
+            for match in re.finditer(_FILE_PLACEHOLDER_PATTERN.format(re.escape(file_nonce)), request_json):
+                index = int(match.group(1))
+                if index >= len(files):
+                    continue
+                self._parts += [request_json[position : match.start()].encode("utf-8"), files[index]]
+                position = match.end()
+        self._parts.append(request_json[position:].encode("utf-8"))
+        self._length = sum(
+            len(part) if position % 2 == 0 else encoded_size(len(part))
+            for position, part in enumerate(self._parts)
+        )
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for position, part in enumerate(self._parts):
+            if position % 2 == 0:
+                yield part
+                continue
+            view = memoryview(part)
+            # Chunks are a multiple of three bytes, so their encodings concatenate cleanly.
+            for start in range(0, len(view), _ENCODE_CHUNK_BYTES):
+                yield base64.b64encode(view[start : start + _ENCODE_CHUNK_BYTES])
+
+
+def encode_request_body(request: dict, files: list[bytes], file_nonce: str | None = None) -> StreamedRequestBody:
+    body = StreamedRequestBody(json.dumps(request), files, file_nonce)
+    limit = resolve_max_payload_bytes()
+    if len(body) > limit:
+        _record_stat("payload_rejected")
+        print(
+            "OpenAI payload too large",
+            {"restaurant_id": request.get("metadata", {}).get("restaurant_id"), "bytes": len(body), "limit": limit},
+        )
+        raise PayloadTooLarge(f"OpenAI request body is {len(body)} bytes, limit is {limit}")
+    return body
+
+
+def resolve_base_url() -> str:
+    return os.environ.get("OPENAI_BASE_URL", "https://api.openai.com").rstrip("/")
+
+
+def resolve_timeouts() -> tuple[float, float]:
+    connect = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+    read = float(os.environ.get("OPENAI_READ_TIMEOUT", "60"))
+    return connect, read
+
+
+def resolve_max_retries() -> int:
+    return max(0, int(os.environ.get("OPENAI_MAX_RETRIES", "3")))
+
+
+def resolve_deadline_margin() -> float:
+    return float(os.environ.get("OPENAI_DEADLINE_MARGIN_SECONDS", "10"))
+
+
+def resolve_escalate_min_seconds() -> float:
+    return float(os.environ.get("OPENAI_ESCALATE_MIN_SECONDS", "30"))
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def set_deadline(lambda_context):
+    """Bound retries and tier escalation by the invocation's remaining time.
+
+    Stops OPENAI_DEADLINE_MARGIN_SECONDS before the Lambda timeout, so the
+    handler can still report batchItemFailures instead of the whole SQS
+    batch being redelivered. Without a Lambda context there is no deadline.
+    """
+    global _DEADLINE
+    remaining_ms = getattr(lambda_context, "get_remaining_time_in_millis", None)
+    _DEADLINE = time.monotonic() + remaining_ms() / 1000 - resolve_deadline_margin() if remaining_ms else None
+
+
+def remaining_seconds() -> float | None:
+    return None if _DEADLINE is None else _DEADLINE - time.monotonic()
+
+
+def deadline_allows(seconds: float) -> bool:
+    remaining = remaining_seconds()
+    return remaining is None or remaining > seconds
+
+
+def _get_session() -> requests.Session:
+    """Return the module-level session so warm invocations reuse TCP/TLS connections."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            pool_size = max(4, int(os.environ.get("RECORD_CONCURRENCY", "4")))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+        return _SESSION
+
+
+def _record_stat(name: str, value: float = 1):
+    with _REQUEST_STATS_LOCK:
+        _REQUEST_STATS[name] = _REQUEST_STATS.get(name, 0) + value
+
+
+def _record_usage(usage: dict | None):
+    for name in ("input_tokens", "output_tokens"):
+        if usage and usage.get(name):
+            _record_stat(name, usage[name])
+            metrics.put(name, usage[name])
+
+
+def get_request_stats() -> dict:
+    with _REQUEST_STATS_LOCK:
+        stats = dict(_REQUEST_STATS)
+    if stats.get("responses"):
+        stats["avg_latency_ms"] = round(stats["latency_ms_total"] / stats["responses"])
+    return stats
+
+
+def reset_request_stats():
+    with _REQUEST_STATS_LOCK:
+        _REQUEST_STATS.clear()
+
+
+def _parse_reset_duration(value: str | None) -> float | None:
+    """Parse OpenAI rate-limit reset values such as "1s", "6m0s" or "250ms"."""
+    if not value:
+        return None
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value.strip())
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def _retry_delay(response: requests.Response | None, attempt: int) -> float:
+    base = float(os.environ.get("OPENAI_BACKOFF_BASE", "0.5"))
+    cap = float(os.environ.get("OPENAI_BACKOFF_MAX", "20"))
+    # Full jitter: spread concurrent retries instead of retrying in lockstep.
+    delay = random.uniform(0, min(cap, base * (2**attempt)))
+    if response is not None:
+        hinted = None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                hinted = float(retry_after)
+            except ValueError:
+                hinted = None
+        if hinted is None:
+            resets = [
+                _parse_reset_duration(response.headers.get(header))
+                for header in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+            ]
+            resets = [reset for reset in resets if reset is not None]
+            hinted = max(resets) if resets and response.status_code == 429 else None
+        if hinted is not None:
+            delay = max(delay, min(cap, hinted))
+    return delay
+
+
+def openai_request(
+    method: str,
+    path: str,
+    body: bytes | StreamedRequestBody | None = None,
+    content_type: str = "application/json",
+    timeout: tuple[float, float] | None = None,
+    stream: bool = False,
+):
+    """Send a request to the OpenAI API with retries.
+
+    Returns the response body, or the open response when stream is set so
+    the caller can consume it incrementally (retries only cover the
+    request up to the response headers).
+    """
     api_key = resolve_openai_api_key()
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is required to query OpenAI")
 
-    model = os.environ.get("OPENAI_MODEL", DEFAULT_MODEL)
-    max_tokens = resolve_max_tokens(context.get("restaurant_id"))
-    request = build_openai_request(task, context, payload, model, max_tokens)
+    headers = {"Authorization": f"Bearer {api_key}"}
+    if body is not None:
+        headers["Content-Type"] = content_type
+    url = f"{resolve_base_url()}{path}"
+    timeout = timeout or resolve_timeouts()
+    max_retries = resolve_max_retries()
+    session = _get_session()
+
+    attempt = 0
+    while True:
+        if not deadline_allows(timeout[0]):
+            raise DeadlineExceeded(f"No time left for OpenAI {path}")
+        remaining = remaining_seconds()
+        attempt_timeout = timeout if remaining is None else (timeout[0], min(timeout[1], remaining))
+        start = time.monotonic()
+        response = None
+        if body is not None:
+            _record_stat("request_bytes", len(body))
+            metrics.put("openai_request_bytes", len(body))
+        try:
+            response = session.request(
+                method, url, data=body, headers=headers, timeout=attempt_timeout, stream=stream
+            )
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            _record_stat("errors")
+            delay = _retry_delay(None, attempt)
+            if attempt >= max_retries or not deadline_allows(delay + timeout[0]):
+                print("OpenAI request error", {"path": path, "attempt": attempt, "error": str(exc)})
+                raise
+            print(
+                "OpenAI request retry",
+                {"path": path, "attempt": attempt, "error": str(exc), "delay": round(delay, 2)},
+            )
+        else:
+            elapsed = time.monotonic() - start
+            _record_stat("responses")
+            _record_stat("latency_ms_total", round(elapsed * 1000))
+            if response.ok:
+                print(
+                    "OpenAI response received",
+                    {"path": path, "status": response.status_code, "seconds": round(elapsed, 2), "attempt": attempt},
+                )
+                return response if stream else response.content
+            _record_stat(f"status_{response.status_code}")
+            delay = _retry_delay(response, attempt)
+            if (
+                response.status_code not in RETRY_STATUS_CODES
+                or attempt >= max_retries
+                or not deadline_allows(delay + timeout[0])
+            ):
+                print(
+                    "OpenAI request failed",
+                    {"path": path, "status": response.status_code, "attempt": attempt, "body": response.text[:2000]},
+                )
+                response.raise_for_status()
+            print(
+                "OpenAI request retry",
+                {"path": path, "attempt": attempt, "status": response.status_code, "delay": round(delay, 2)},
+            )
+        _record_stat("retries")
+        metrics.put("openai_retries")
+        time.sleep(delay)
+        attempt += 1
+
+
+def resolve_stream_enabled() -> bool:
+    return os.environ.get("OPENAI_STREAM", "false").strip().lower() in {"1", "true", "yes"}
+
+
+def _iter_sse_events(response: requests.Response):
+    data_lines = []
+    for line in response.iter_lines(decode_unicode=False):
+        if line:
+            if line.startswith(b"data:"):
+                data_lines.append(line[5:].strip())
+            continue
+        if not data_lines:
+            continue
+        data = b"\n".join(data_lines)
+        data_lines = []
+        if data == b"[DONE]":
+            return
+        yield json.loads(data)
+
+
+def _query_chatgpt_stream(
+    request: dict, files: list[bytes], file_nonce: str | None, restaurant_id: str | None, csv_format: str
+) -> str:
+    body = encode_request_body({**request, "stream": True}, files, file_nonce)
+    response = openai_request("POST", "/v1/responses", body, stream=True)
+    validator = CsvStreamValidator(csv_format)
+    parts = []
+    start = time.monotonic()
+    try:
+        for event in _iter_sse_events(response):
+            event_type = event.get("type")
+            if event_type == "response.output_text.delta":
+                parts.append(event.get("delta", ""))
+                validator.feed(event.get("delta", ""))
+            elif event_type == "response.completed":
+                usage = (event.get("response") or {}).get("usage")
+                _record_usage(usage)
+                print("OpenAI stream completed", {"restaurant_id": restaurant_id, "usage": usage})
+            elif event_type in {"response.failed", "response.incomplete", "error"}:
+                print("OpenAI stream failed", {"restaurant_id": restaurant_id, "event": event})
+                raise ValueError(f"OpenAI stream {event_type}")
+        validator.finish()
+    except CsvStreamAborted as exc:
+        text = "".join(parts)
+        _record_stat("stream_aborts")
+        print(
+            "OpenAI stream aborted",
+            {
+                "restaurant_id": restaurant_id,
+                "reason": str(exc),
+                "seconds": round(time.monotonic() - start, 2),
+                "output_tokens_est": estimate_tokens(text),
+                "max_output_tokens": request.get("max_output_tokens"),
+                "text": text[:500],
+            },
+        )
+        raise
+    finally:
+        # Closing the connection early stops generation on the server side.
+        response.close()
+    return "".join(parts).strip()
+
+
+def query_chatgpt(
+    task: str, context: dict, payload: dict, max_tokens: int | None = None, model: str | None = None
+):
+    model = model or resolve_model()
+    max_tokens = max_tokens or resolve_max_tokens(context.get("restaurant_id"))
+    file_nonce = new_file_nonce() if task == "image" else None
+    request = build_openai_request(task, context, payload, model, max_tokens, file_nonce)
+    files = [binary for binary, _mime_type in request_images(payload)] if task == "image" else []
+    stream = resolve_stream_enabled()
     print(
         "OpenAI request prepared",
         {
@@ -300,58 +884,283 @@ def query_chatgpt(task: str, context: dict, payload: dict):
             "max_tokens": max_tokens,
             "temperature": request.get("temperature"),
             "top_p": request.get("top_p"),
+            "stream": stream,
         },
     )
 
-    body = json.dumps(request).encode("utf-8")
-    http_request = urllib.request.Request(
-        "https://api.openai.com/v1/responses",
-        data=body,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
+    if stream:
+        csv_format = payload.get("csv_format") or resolve_csv_format()
+        return _query_chatgpt_stream(request, files, file_nonce, context.get("restaurant_id"), csv_format)
 
-    try:
-        start = time.monotonic()
-        with urllib.request.urlopen(http_request, timeout=60) as response:
-            raw = response.read().decode("utf-8")
-        elapsed = round(time.monotonic() - start, 2)
-        print("OpenAI response received", {"status": response.status, "seconds": elapsed})
-    except urllib.error.HTTPError as exc:
-        error_body = exc.read().decode("utf-8") if exc.fp else ""
-        print(
-            "OpenAI request failed",
-            {"status": exc.code, "body": error_body[:2000]},
-        )
-        raise
-    except Exception as exc:
-        print("OpenAI request error", {"error": str(exc)})
-        raise
+    body = encode_request_body(request, files, file_nonce)
+    raw = openai_request("POST", "/v1/responses", body).decode("utf-8")
 
-    print("OpenAI raw response", {"body": raw[:2000]})
+    metrics.log_debug("OpenAI raw response", {"body": raw[:2000]})
     try:
         payload = json.loads(raw)
     except json.JSONDecodeError as exc:
         print("OpenAI response decode failed", {"error": str(exc), "body": raw[:2000]})
         raise
+    _record_usage(payload.get("usage"))
     try:
-        text = _extract_response_text(payload).strip()
+        text = extract_response_text(payload).strip()
     except Exception as exc:
         print("OpenAI response extract failed", {"error": str(exc), "keys": list(payload.keys())})
         raise
     return text
 
 
+def resolve_repair_max_rows() -> int:
+    return int(os.environ.get("OPENAI_REPAIR_MAX_ROWS", "10"))
+
+
+def _split_invalid_rows(rows: list[list[str]], compact: bool = False):
+    valid = []
+    invalid = []
+    for index, row in enumerate(rows, start=2):
+        errors = _validate_csv_row(index, row, compact)
+        if errors:
+            invalid.append((row, errors))
+        else:
+            valid.append(row)
+    return valid, invalid
+
+
+def _repair_rows_with_openai(invalid: list, context: dict, expected: list[str]) -> list[list[str]]:
+    rows_text = csv_repair.rows_to_csv(expected, [row for row, _errors in invalid])
+    errors = [error for _row, row_errors in invalid for error in row_errors]
+    try:
+        csv_text = query_chatgpt(
+            "repair",
+            context,
+            {"rows": rows_text, "errors": errors, "csv_format": "days" if expected != CSV_HEADER else "rows"},
+            max_tokens=estimate_tokens(rows_text) * 2 + 200,
+        )
+    except Exception as exc:
+        print("CSV repair request failed", {"restaurant_id": context.get("restaurant_id"), "error": str(exc)})
+        return []
+    header, rows = csv_repair.repair_locally(csv_text)
+    if _validate_csv_header(header, expected):
+        return []
+    return rows
+
+
+def repair_csv_response(csv_text: str, context: dict, csv_format: str = "rows") -> str:
+    """Return csv_text, or a repaired copy of it, or raise ValueError.
+
+    Tier 1 applies deterministic local fixes, tier 2 resubmits only the
+    still-invalid rows to OpenAI and tier 3 drops whatever is still invalid
+    as long as most of the menu is valid.
+    """
+    if not csv_validation_errors(csv_text, csv_format):
+        return csv_text
+
+    restaurant_id = context.get("restaurant_id")
+    expected = csv_header_for(csv_format)
+    compact = csv_format == "days"
+    header, rows = csv_repair.repair_locally(csv_text)
+    valid, invalid = _split_invalid_rows(rows, compact)
+    tier = "local"
+    if header == expected and valid and invalid and len(invalid) <= resolve_repair_max_rows():
+        repaired = [row for row in _repair_rows_with_openai(invalid, context, expected) if row not in valid]
+        fixed, _still_invalid = _split_invalid_rows(repaired, compact)
+        # Rows the model did not return fixed stay invalid for the drop tier.
+        valid, invalid = valid + fixed, invalid[len(fixed):]
+        tier = "openai"
+    if header == expected and valid and invalid and len(valid) > len(invalid):
+        print(
+            "CSV repair dropped rows",
+            {"restaurant_id": restaurant_id, "rows": [row for row, _errors in invalid]},
+        )
+        invalid = []
+        tier = "drop"
+
+    if header != expected or not valid or invalid:
+        _record_stat("csv_repair_failed")
+        metrics.put("csv_repair_failed")
+        # Raises and logs the original validation errors.
+        validate_csv_response(csv_text, restaurant_id, csv_format)
+
+    _record_stat(f"csv_repair_{tier}")
+    metrics.put(f"csv_repair_{tier}")
+    print("CSV repaired", {"restaurant_id": restaurant_id, "tier": tier, "rows": len(valid)})
+    valid.sort(key=lambda row: CSV_DAYS.index(row[0].split(csv_repair.DAYS_SEPARATOR)[0]))
+    return csv_repair.rows_to_csv(header, valid)
+
+
+def expand_compact_csv(csv_text: str) -> str:
+    """Turn validated days,lunch,price,tags output into one row per dish per day."""
+    rows = csv_repair.parse_rows(csv_text)[1:]
+    expanded = [[day, *row[1:]] for row in rows for day in row[0].split(csv_repair.DAYS_SEPARATOR)]
+    expanded.sort(key=lambda row: CSV_DAYS.index(row[0]))
+    return csv_repair.rows_to_csv(CSV_HEADER, expanded)
+
+
+def finish_csv_response(csv_text: str, context: dict, csv_format: str | None = None) -> str:
+    """Repair a model response and return it in the day,lunch,price,tags format.
+
+    Compact output is expanded here, so storage and import_to_ddb only ever
+    see one row per dish per day. The output tokens the compact format saved
+    are estimated from the length of both versions.
+    """
+    csv_format = csv_format or resolve_csv_format()
+    if csv_format == "days" and csv_repair.repair_locally(csv_text)[0] == CSV_HEADER:
+        # The model ignored the compact format; rows output is still usable.
+        print("OpenAI compact CSV ignored", {"restaurant_id": context.get("restaurant_id")})
+        csv_format = "rows"
+    csv_text = repair_csv_response(csv_text, context, csv_format)
+    if csv_format != "days":
+        return csv_text
+    expanded = expand_compact_csv(csv_text)
+    saved = max(0, estimate_tokens(expanded) - estimate_tokens(csv_text))
+    _record_stat("output_tokens_saved", saved)
+    metrics.put("output_tokens_saved", saved)
+    print(
+        "OpenAI compact CSV expanded",
+        {
+            "restaurant_id": context.get("restaurant_id"),
+            "compact_rows": len(csv_repair.parse_rows(csv_text)) - 1,
+            "rows": len(csv_repair.parse_rows(expanded)) - 1,
+            "output_tokens_est": estimate_tokens(csv_text),
+            "expanded_tokens_est": estimate_tokens(expanded),
+            "output_tokens_saved": saved,
+        },
+    )
+    return expanded
+
+
+def choose_start_tier(tiers: list[str], stats: dict) -> int:
+    """First tier worth trying for this restaurant.
+
+    Cheaper tiers are skipped when they failed in most recent attempts, or
+    when they were not even faster than the strongest tier. Every
+    OPENAI_TIER_RETRY_EVERY parses all tiers are tried again, so a site that
+    got easier can move back down.
+    """
+    retry_every = int(os.environ.get("OPENAI_TIER_RETRY_EVERY", "8"))
+    if retry_every and stats.get("parses", 0) % retry_every == retry_every - 1:
+        return 0
+    strongest_latency = model_stats.median_latency_ms(stats, tiers[-1])
+    for index, model in enumerate(tiers[:-1]):
+        rate = model_stats.failure_rate(stats, model)
+        latency = model_stats.median_latency_ms(stats, model)
+        slower = latency is not None and strongest_latency is not None and latency >= strongest_latency
+        if (rate is None or rate < resolve_escalate_failure_rate()) and not slower:
+            return index
+    return len(tiers) - 1
+
+
+def completeness_problems(csv_text: str, stats: dict) -> list[str]:
+    """Signs that a valid CSV still misses part of the menu.
+
+    The expected weekday count is learned from the strongest tier's results
+    for the restaurant, so places that only serve some days do not escalate
+    forever; all five days are expected until then.
+    """
+    days = {row[0] for row in csv_repair.parse_rows(csv_text)[1:] if row}
+    expected = int(stats.get("expected_days", len(CSV_DAYS)))
+    if len(days) < expected:
+        return [f"{len(days)} of {expected} expected weekdays"]
+    return []
+
+
+def _cached_csv(task: str, context: dict, digest: str, models: list[str]) -> str | None:
+    """Return the cached CSV of the first model in models that parsed this content."""
+    prompt_version = resolve_prompt_version(task)
+    for model in models:
+        cached = parse_cache.get_cached_csv(task, digest, model, prompt_version)
+        if cached:
+            metrics.put("parse_cache_hits")
+            print("parse_cache hit", {"task": task, "restaurant_id": context.get("restaurant_id"), "model": model})
+            return cached
+    metrics.put("parse_cache_misses")
+    return None
+
+
+def _query_model(task: str, context: dict, payload: dict, model: str) -> str:
+    return finish_csv_response(query_chatgpt(task, context, payload, model=model), context)
+
+
+def _parse_to_csv(task: str, context: dict, payload: dict, digest: str):
+    restaurant_id = context.get("restaurant_id")
+    tiers = resolve_model_tiers()
+    prompt_version = resolve_prompt_version(task)
+    # Unchanged content is never sent again, whichever tier parsed it last;
+    # the strongest tier's result is preferred.
+    cached = _cached_csv(task, context, digest, tiers[::-1])
+    if cached:
+        return cached
+    if len(tiers) == 1:
+        csv_text = _query_model(task, context, payload, tiers[0])
+        parse_cache.put_cached_csv(task, digest, tiers[0], prompt_version, csv_text, restaurant_id)
+        return csv_text
+
+    stats = model_stats.get_stats(restaurant_id, task)
+    start = choose_start_tier(tiers, stats)
+    for index in range(start, len(tiers)):
+        model = tiers[index]
+        strongest = index == len(tiers) - 1
+        started = time.monotonic()
+        error = None
+        try:
+            csv_text = _query_model(task, context, payload, model)
+            problems = completeness_problems(csv_text, stats)
+        except (ValueError, requests.RequestException) as exc:
+            error = exc
+            if strongest:
+                model_stats.record_outcome(stats, model, False, (time.monotonic() - started) * 1000)
+                stats["parses"] = stats.get("parses", 0) + 1
+                model_stats.save_stats(restaurant_id, task, stats)
+                raise
+            problems = [str(exc)]
+
+        latency_ms = (time.monotonic() - started) * 1000
+        if problems and not strongest:
+            model_stats.record_outcome(stats, model, False, latency_ms)
+            if not deadline_allows(resolve_escalate_min_seconds()):
+                # Not enough time left for another model; keep an incomplete
+                # menu rather than letting the Lambda time out.
+                stats["parses"] = stats.get("parses", 0) + 1
+                model_stats.save_stats(restaurant_id, task, stats)
+                metrics.put("openai_escalations_skipped")
+                print(
+                    "OpenAI escalation skipped",
+                    {
+                        "restaurant_id": restaurant_id,
+                        "model": model,
+                        "problems": problems,
+                        "remaining_seconds": round(remaining_seconds(), 1),
+                    },
+                )
+                if error is not None:
+                    raise error
+                return csv_text
+            metrics.put("openai_escalations")
+            print(
+                "OpenAI model escalated",
+                {"restaurant_id": restaurant_id, "from": model, "to": tiers[index + 1], "problems": problems},
+            )
+            continue
+
+        model_stats.record_outcome(stats, model, True, latency_ms)
+        days = len({row[0] for row in csv_repair.parse_rows(csv_text)[1:] if row})
+        if strongest or days > int(stats.get("expected_days", 0)):
+            stats["expected_days"] = days
+        stats["parses"] = stats.get("parses", 0) + 1
+        model_stats.save_stats(restaurant_id, task, stats)
+        metrics.put("model_tier", index)
+        print(
+            "OpenAI model routed",
+            {"restaurant_id": restaurant_id, "model": model, "tier": index, "start_tier": start, "days": days},
+        )
+        parse_cache.put_cached_csv(task, digest, model, prompt_version, csv_text, restaurant_id)
+        return csv_text
+
+
 def parse_html_to_csv(_html: str, context: dict):
-    csv_text = query_chatgpt("html", context, {"html": _html})
-    validate_csv_response(csv_text, context.get("restaurant_id"))
-    return csv_text
+    return _parse_to_csv("html", context, {"html": _html}, parse_cache.content_digest(_html))
 
 
-def parse_image_to_csv(_binary: bytes, context: dict):
-    csv_text = query_chatgpt("image", context, {"binary": _binary})
-    validate_csv_response(csv_text, context.get("restaurant_id"))
-    return csv_text
+def parse_image_to_csv(_binary: bytes, context: dict, images: list | None = None):
+    payload = {"binary": _binary, "images": images}
+    return _parse_to_csv("image", context, payload, parse_cache.content_digest(_binary))
@@ -0,0 +1,46 @@
+import hashlib
+import time
+
+from shared import cache_store
+
+_PREFIX = "parse-cache"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def content_digest(content) -> str:
+    if isinstance(content, str):
+        content = normalize_text(content).encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def build_cache_key(task: str, digest: str, model: str, prompt_version: str) -> str:
+    return f"{task}/{model}/{prompt_version}/{digest}.json"
+
+
+def get_cached_csv(task: str, digest: str, model: str, prompt_version: str):
+    entry = cache_store.get_json(_PREFIX, build_cache_key(task, digest, model, prompt_version))
+    if not entry:
+        return None
+    return entry.get("csv")
+
+
+def put_cached_csv(
+    task: str,
+    digest: str,
+    model: str,
+    prompt_version: str,
+    csv_text: str,
+    restaurant_id: str | None,
+):
+    entry = {
+        "csv": csv_text,
+        "task": task,
+        "model": model,
+        "prompt_version": prompt_version,
+        "restaurant_id": restaurant_id,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    cache_store.put_json(_PREFIX, build_cache_key(task, digest, model, prompt_version), entry)
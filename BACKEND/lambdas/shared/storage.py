@@ -1,3 +1,4 @@
+import json
 import os
 
 import boto3
@@ -26,3 +27,35 @@ def save_weekly_csv(csv_text: str, restaurant_id: str, city: str = "", area: str
         ContentType="text/csv",
         Metadata=metadata,
     )
+
+
+def _batch_manifest_key(batch_id: str, status: str) -> str:
+    return f"batches/{status}/{batch_id}.json"
+
+
+def save_batch_manifest(manifest: dict, status: str = "pending"):
+    s3.put_object(
+        Bucket=os.environ["WEEKLY_LUNCHMENUS_BUCKET"],
+        Key=_batch_manifest_key(manifest["batch_id"], status),
+        Body=json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def list_batch_manifests(status: str = "pending"):
+    bucket = os.environ["WEEKLY_LUNCHMENUS_BUCKET"]
+    paginator = s3.get_paginator("list_objects_v2")
+    manifests = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"batches/{status}/"):
+        for item in page.get("Contents", []):
+            obj = s3.get_object(Bucket=bucket, Key=item["Key"])
+            manifests.append(json.loads(obj["Body"].read().decode("utf-8")))
+    return manifests
+
+
+def move_batch_manifest(manifest: dict, from_status: str, to_status: str):
+    save_batch_manifest(manifest, to_status)
+    s3.delete_object(
+        Bucket=os.environ["WEEKLY_LUNCHMENUS_BUCKET"],
+        Key=_batch_manifest_key(manifest["batch_id"], from_status),
+    )
@@ -37,7 +37,13 @@ export class PadevLunchStack extends cdk.Stack {
       bucketName: name("weekly-lunchmenus"),
       blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
       encryption: s3.BucketEncryption.S3_MANAGED,
-      enforceSSL: true
+      enforceSSL: true,
+      lifecycleRules: [
+        {
+          prefix: "parse-cache/",
+          expiration: cdk.Duration.days(60)
+        }
+      ]
     });
 
     const deadLetterQueue = new sqs.Queue(this, "LunchmenuParseDLQ", {
@@ -55,6 +61,10 @@ export class PadevLunchStack extends cdk.Stack {
     });
 
     const tableName = name("lunchrestaurants");
+    // DynamoDB creates only one GSI per table update. Existing tables get
+    // restaurant_directory with -c cityDayIndex=false first, then
+    // by_city_week_day in a second, plain deploy.
+    const cityDayIndex = String(this.node.tryGetContext("cityDayIndex") ?? "true") !== "false";
 
     const lunchTable = new dynamodb.CfnTable(this, "LunchRestaurantsTable", {
       tableName,
@@ -64,7 +74,14 @@ export class PadevLunchStack extends cdk.Stack {
         { attributeName: "sk", attributeType: "S" },
         { attributeName: "city", attributeType: "S" },
         { attributeName: "week", attributeType: "S" },
-        { attributeName: "day", attributeType: "S" }
+        { attributeName: "day", attributeType: "S" },
+        { attributeName: "directory", attributeType: "S" },
+        ...(cityDayIndex
+          ? [
+              { attributeName: "city_week_day", attributeType: "S" },
+              { attributeName: "area_restaurant", attributeType: "S" }
+            ]
+          : [])
       ],
       keySchema: [
         { attributeName: "restaurant_id", keyType: "HASH" },
@@ -80,7 +97,29 @@ export class PadevLunchStack extends cdk.Stack {
             { attributeName: "restaurant_id", keyType: "RANGE" }
           ],
           projection: { projectionType: "ALL" }
-        }
+        },
+        {
+          // Sparse index: only INFO items carry the `directory` attribute.
+          indexName: "restaurant_directory",
+          keySchema: [
+            { attributeName: "directory", keyType: "HASH" },
+            { attributeName: "restaurant_id", keyType: "RANGE" }
+          ],
+          projection: { projectionType: "ALL" }
+        },
+        ...(cityDayIndex
+          ? [
+              {
+                // city#week#day -> area#restaurant_id, written by import_to_ddb.
+                indexName: "by_city_week_day",
+                keySchema: [
+                  { attributeName: "city_week_day", keyType: "HASH" },
+                  { attributeName: "area_restaurant", keyType: "RANGE" }
+                ],
+                projection: { projectionType: "ALL" }
+              }
+            ]
+          : [])
       ]
     });
 
@@ -114,7 +153,13 @@ export class PadevLunchStack extends cdk.Stack {
         WEEKLY_LUNCHMENUS_BUCKET: weeklyLunchmenusBucket.bucketName,
         RESTAURANT_SOURCES_BUCKET: restaurantSourcesBucket.bucketName,
         OPENAI_API_KEY_SECRET_ARN: openAiApiKeySecret.secretArn,
-        OPENAI_MAX_TOKENS_OVERRIDES: JSON.stringify({ pagoden: 4000 })
+        OPENAI_MAX_TOKENS_OVERRIDES: JSON.stringify({ pagoden: 4000 }),
+        // Compact one-row-per-dish output, expanded before saving.
+        OPENAI_CSV_FORMAT: "days",
+        // Cheapest first; escalates on invalid or incomplete CSV.
+        OPENAI_MODEL_TIERS: "gpt-4.1-mini-2025-04-14,gpt-4.1-2025-04-14",
+        CACHE_BUCKET: weeklyLunchmenusBucket.bucketName,
+        RECORD_CONCURRENCY: "5"
       }
     });
 
@@ -129,7 +174,13 @@ export class PadevLunchStack extends cdk.Stack {
         RESTAURANT_SOURCES_BUCKET: restaurantSourcesBucket.bucketName,
         TABLE_NAME: tableName,
         OPENAI_API_KEY_SECRET_ARN: openAiApiKeySecret.secretArn,
-        OPENAI_MAX_TOKENS_OVERRIDES: JSON.stringify({ pagoden: 4000 })
+        OPENAI_MAX_TOKENS_OVERRIDES: JSON.stringify({ pagoden: 4000 }),
+        // Compact one-row-per-dish output, expanded before saving.
+        OPENAI_CSV_FORMAT: "days",
+        // Cheapest first; escalates on invalid or incomplete CSV.
+        OPENAI_MODEL_TIERS: "gpt-4.1-mini-2025-04-14,gpt-4.1-2025-04-14",
+        CACHE_BUCKET: weeklyLunchmenusBucket.bucketName,
+        RECORD_CONCURRENCY: "4"
       }
     });
 
@@ -140,7 +191,10 @@ export class PadevLunchStack extends cdk.Stack {
       code: lambdaCode,
       timeout: cdk.Duration.minutes(2),
       environment: {
-        TABLE_NAME: tableName
+        TABLE_NAME: tableName,
+        CITY_DAY_INDEX_NAME: "by_city_week_day",
+        LUNCH_PAGES_BUCKET: weeklyLunchmenusBucket.bucketName,
+        RECORD_CONCURRENCY: "4"
       }
     });
 
@@ -152,6 +206,64 @@ export class PadevLunchStack extends cdk.Stack {
       timeout: cdk.Duration.minutes(1),
       environment: {
         TABLE_NAME: tableName,
+        QUEUE_URL: parseQueue.queueUrl,
+        DIRECTORY_INDEX_NAME: "restaurant_directory",
+        // Parallel Scan segments over the directory index; 1 = a single Query.
+        ENQUEUE_SEGMENTS: "1",
+        SKIP_PARSED: "false",
+        RECORD_CONCURRENCY: "8"
+      }
+    });
+
+    const scheduleRestaurantsLambda = new lambda.Function(this, "ScheduleLunchrestaurantsLambda", {
+      functionName: name("schedule-lunchrestaurants"),
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "schedule_restaurants.index.handler",
+      code: lambdaCode,
+      timeout: cdk.Duration.minutes(1),
+      environment: {
+        TABLE_NAME: tableName,
+        QUEUE_URL: parseQueue.queueUrl,
+        DIRECTORY_INDEX_NAME: "restaurant_directory",
+        ENQUEUE_SEGMENTS: "1",
+        DEFAULT_PUBLISH_OFFSET_HOURS: "8",
+        PUBLISH_HISTORY_WEEKS: "8",
+        EARLY_MARGIN_HOURS: "2",
+        POLL_INTERVAL_MINUTES: "30",
+        MAX_POLL_INTERVAL_HOURS: "12",
+        RECORD_CONCURRENCY: "8"
+      }
+    });
+
+    const batchCollectLambda = new lambda.Function(this, "BatchCollectLunchmenusLambda", {
+      functionName: name("batch-collect-lunchmenus"),
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "batch_collect.index.handler",
+      code: lambdaCode,
+      timeout: cdk.Duration.minutes(10),
+      memorySize: 1024,
+      environment: {
+        TABLE_NAME: tableName,
+        WEEKLY_LUNCHMENUS_BUCKET: weeklyLunchmenusBucket.bucketName,
+        OPENAI_API_KEY_SECRET_ARN: openAiApiKeySecret.secretArn,
+        OPENAI_MAX_TOKENS_OVERRIDES: JSON.stringify({ pagoden: 4000 }),
+        // Compact one-row-per-dish output, expanded before saving.
+        OPENAI_CSV_FORMAT: "days",
+        CACHE_BUCKET: weeklyLunchmenusBucket.bucketName,
+        RECORD_CONCURRENCY: "8"
+      }
+    });
+
+    const batchPollLambda = new lambda.Function(this, "BatchPollLunchmenusLambda", {
+      functionName: name("batch-poll-lunchmenus"),
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "batch_poll.index.handler",
+      code: lambdaCode,
+      timeout: cdk.Duration.minutes(5),
+      environment: {
+        WEEKLY_LUNCHMENUS_BUCKET: weeklyLunchmenusBucket.bucketName,
+        OPENAI_API_KEY_SECRET_ARN: openAiApiKeySecret.secretArn,
+        CACHE_BUCKET: weeklyLunchmenusBucket.bucketName,
         QUEUE_URL: parseQueue.queueUrl
       }
     });
@@ -164,11 +276,18 @@ export class PadevLunchStack extends cdk.Stack {
       timeout: cdk.Duration.minutes(1),
       environment: {
         TABLE_NAME: tableName,
-        GSI_NAME: "by_location_and_day"
+        CITY_DAY_INDEX_NAME: "by_city_week_day",
+        DIRECTORY_INDEX_NAME: "restaurant_directory",
+        LUNCH_PAGES_BUCKET: weeklyLunchmenusBucket.bucketName
       }
     });
 
-    parseHtmlLambda.addEventSource(new lambdaEventSources.SqsEventSource(parseQueue));
+    parseHtmlLambda.addEventSource(
+      new lambdaEventSources.SqsEventSource(parseQueue, {
+        batchSize: 5,
+        reportBatchItemFailures: true
+      })
+    );
 
     restaurantSourcesBucket.addEventNotification(
       s3.EventType.OBJECT_CREATED,
@@ -182,7 +301,11 @@ export class PadevLunchStack extends cdk.Stack {
       { prefix: "weekly/" }
     );
 
-    if (envName === "prod") {
+    // "sync" (default): one SQS message and OpenAI call per restaurant.
+    // "batch": collect all pages into one OpenAI Batch API submission.
+    const parseMode = this.node.tryGetContext("parseMode") || "sync";
+
+    if (envName === "prod" && parseMode === "batch") {
       const weeklyRule = new events.Rule(this, "WeeklyLunchmenuIngestRule", {
         ruleName: name("weekly-lunchmenu-ingest"),
         schedule: events.Schedule.cron({
@@ -192,7 +315,27 @@ export class PadevLunchStack extends cdk.Stack {
         })
       });
 
-      weeklyRule.addTarget(new targets.LambdaFunction(enqueueRestaurantsLambda));
+      weeklyRule.addTarget(new targets.LambdaFunction(batchCollectLambda));
+    }
+
+    if (envName === "prod" && parseMode !== "batch") {
+      // Enqueues each restaurant around its learned publish time, with back-off
+      // until a new week's menu is imported. enqueue_restaurants stays for manual runs.
+      const scheduleRule = new events.Rule(this, "ScheduleLunchrestaurantsRule", {
+        ruleName: name("schedule-lunchrestaurants"),
+        schedule: events.Schedule.rate(cdk.Duration.minutes(30))
+      });
+
+      scheduleRule.addTarget(new targets.LambdaFunction(scheduleRestaurantsLambda));
+    }
+
+    if (parseMode === "batch") {
+      const batchPollRule = new events.Rule(this, "BatchPollLunchmenusRule", {
+        ruleName: name("batch-poll-lunchmenus"),
+        schedule: events.Schedule.rate(cdk.Duration.minutes(15))
+      });
+
+      batchPollRule.addTarget(new targets.LambdaFunction(batchPollLambda));
     }
 
     const apiAccessLogGroup = new logs.LogGroup(this, "ApiAccessLogs", {
@@ -201,6 +344,7 @@ export class PadevLunchStack extends cdk.Stack {
 
     const api = new apigateway.RestApi(this, "LunchApi", {
       restApiName: name("api"),
+      minimumCompressionSize: 1024,
       deployOptions: {
         throttlingRateLimit: 5,
         throttlingBurstLimit: 20,
@@ -232,22 +376,40 @@ export class PadevLunchStack extends cdk.Stack {
     apiDdbRole.addToPolicy(
       new iam.PolicyStatement({
         actions: ["dynamodb:Query"],
-        resources: [`${table.tableArn}/index/by_location_and_day`]
+        resources: [
+          `${table.tableArn}/index/by_location_and_day`,
+          `${table.tableArn}/index/restaurant_directory`,
+          `${table.tableArn}/index/by_city_week_day`
+        ]
       })
     );
 
     const listRestaurantsIntegration = new apigateway.AwsIntegration({
       service: "dynamodb",
-      action: "Scan",
+      action: "Query",
       options: {
         credentialsRole: apiDdbRole,
         requestTemplates: {
-          "application/json": JSON.stringify({
-            TableName: tableName,
-            FilterExpression: "#sk = :INFO",
-            ExpressionAttributeNames: { "#sk": "sk" },
-            ExpressionAttributeValues: { ":INFO": { S: "INFO" } }
-          })
+          "application/json": [
+            "#set($limit = $input.params('limit'))",
+            "#if(!$limit.matches('^[1-9][0-9]?$|^100$'))#set($limit = '100')#end",
+            "#set($token = $input.params('next_token'))",
+            "{",
+            "  \"TableName\": \"" + tableName + "\",",
+            "  \"IndexName\": \"restaurant_directory\",",
+            "  \"KeyConditionExpression\": \"#directory = :info\",",
+            "  \"ExpressionAttributeNames\": {\"#directory\": \"directory\"},",
+            "  \"ExpressionAttributeValues\": {\":info\": {\"S\": \"INFO\"}},",
+            "  \"Limit\": $limit",
+            "#if($token != \"\")",
+            "  ,\"ExclusiveStartKey\": {",
+            "    \"directory\": {\"S\": \"INFO\"},",
+            "    \"sk\": {\"S\": \"INFO\"},",
+            "    \"restaurant_id\": {\"S\": \"$util.escapeJavaScript($util.base64Decode($token))\"}",
+            "  }",
+            "#end",
+            "}"
+          ].join("\n")
         },
         integrationResponses: [
           {
@@ -276,7 +438,12 @@ export class PadevLunchStack extends cdk.Stack {
                 "      \"phone\": \"$!item.phone.S\"",
                 "    }#if($foreach.hasNext),#end",
                 "#end",
-                "  ]",
+                "  ],",
+                "#if($inputRoot.LastEvaluatedKey != \"\")",
+                "  \"next_token\": \"$util.base64Encode($inputRoot.LastEvaluatedKey.restaurant_id.S)\"",
+                "#else",
+                "  \"next_token\": null",
+                "#end",
                 "}"
               ].join("\n")
             }
@@ -431,108 +598,79 @@ export class PadevLunchStack extends cdk.Stack {
     const lunchCity = lunch.addResource("{city}");
     const lunchWeek = lunchCity.addResource("{week}");
     const lunchDay = lunchWeek.addResource("{day}");
-    const lunchByLocationIntegration = new apigateway.AwsIntegration({
-      service: "dynamodb",
-      action: "Query",
-      options: {
-        credentialsRole: apiDdbRole,
-        requestTemplates: {
-          "application/json": [
-            "#set($area = $input.params('area'))",
-            "{",
-            "  \"TableName\": \"" + tableName + "\",",
-            "  \"IndexName\": \"by_location_and_day\",",
-            "  \"KeyConditionExpression\": \"#city = :city AND #week = :week AND #day = :day\",",
-            "  \"ExpressionAttributeNames\": {",
-            "    \"#city\": \"city\",",
-            "    \"#week\": \"week\",",
-            "    \"#day\": \"day\"#if($area != \"\"),",
-            "    \"#area\": \"area\"#end",
-            "  },",
-            "  \"ExpressionAttributeValues\": {",
-            "    \":city\": {\"S\": \"$input.params('city')\"},",
-            "    \":week\": {\"S\": \"$input.params('week')\"},",
-            "    \":day\": {\"S\": \"$input.params('day')\"}#if($area != \"\"),",
-            "    \":area\": {\"S\": \"$area\"}#end",
-            "  }",
-            "#if($area != \"\")",
-            "  ,\"FilterExpression\": \"#area = :area\"",
-            "#end",
-            "}"
-          ].join("\n")
-        },
-        integrationResponses: [
-          {
-            statusCode: "200",
-            responseParameters: {
-              "method.response.header.Access-Control-Allow-Origin": "'*'"
-            },
-            responseTemplates: {
-              "application/json": [
-                "#set($inputRoot = $input.path('$'))",
-                "{",
-                "  \"items\": [",
-                "#foreach($item in $inputRoot.Items)",
-                "    {",
-                "      \"restaurant_id\": \"$item.restaurant_id.S\",",
-                "      \"restaurant_name\": \"$item.restaurant_name.S\",",
-                "      \"city\": \"$!item.city.S\",",
-                "      \"area\": \"$!item.area.S\",",
-                "      \"week\": \"$!item.week.S\",",
-                "      \"day\": \"$!item.day.S\",",
-                "      \"dishes\": [",
-                "#foreach($dish in $item.dishes.L)",
-                "        #set($dishMap = $dish.M)",
-                "        #set($tags = $dishMap.tags.L)",
-                "        {",
-                "          \"name\": \"$dishMap.name.S\",",
-                "          \"price\": #if($dishMap.price.N != \"\")$dishMap.price.N#else null#end,",
-                "          \"tags\": [",
-                "#if($tags != \"\")",
-                "#foreach($tag in $tags)",
-                "            \"$tag.S\"#if($foreach.hasNext),#end",
-                "#end",
-                "#end",
-                "          ]",
-                "        }#if($foreach.hasNext),#end",
-                "#end",
-                "      ]",
-                "    }#if($foreach.hasNext),#end",
-                "#end",
-                "  ]",
-                "}"
-              ].join("\n")
-            }
-          }
-        ]
-      }
-    });
+    // Served by the api Lambda from the precomputed lunch-pages/ documents,
+    // falling back to a Query on by_city_week_day.
+    const lunchByLocationIntegration = new apigateway.LambdaIntegration(apiLambda);
 
-    lunchDay.addMethod("GET", lunchByLocationIntegration, {
-      methodResponses: [
-        {
-          statusCode: "200",
-          responseParameters: {
-            "method.response.header.Access-Control-Allow-Origin": true
-          }
-        }
-      ]
-    });
+    lunchDay.addMethod("GET", lunchByLocationIntegration);
 
     weeklyLunchmenusBucket.grantPut(parseHtmlLambda);
     weeklyLunchmenusBucket.grantPut(parseImageLambda);
+    weeklyLunchmenusBucket.grantReadWrite(parseHtmlLambda, "parse-cache/*");
+    weeklyLunchmenusBucket.grantReadWrite(parseHtmlLambda, "fetch-state/*");
+    weeklyLunchmenusBucket.grantReadWrite(parseImageLambda, "parse-cache/*");
+    // Per-restaurant model tier statistics (shared/model_stats.py).
+    weeklyLunchmenusBucket.grantReadWrite(parseHtmlLambda, "model-stats/*");
+    weeklyLunchmenusBucket.grantReadWrite(parseImageLambda, "model-stats/*");
     restaurantSourcesBucket.grantRead(parseImageLambda);
     weeklyLunchmenusBucket.grantRead(importToDdbLambda);
+    weeklyLunchmenusBucket.grantPut(importToDdbLambda, "lunch-pages/*");
+    weeklyLunchmenusBucket.grantRead(apiLambda, "lunch-pages/*");
+
+    weeklyLunchmenusBucket.grantPut(batchCollectLambda);
+    weeklyLunchmenusBucket.grantReadWrite(batchCollectLambda, "parse-cache/*");
+    weeklyLunchmenusBucket.grantReadWrite(batchCollectLambda, "fetch-state/*");
+    weeklyLunchmenusBucket.grantReadWrite(batchCollectLambda, "batches/*");
+    weeklyLunchmenusBucket.grantPut(batchPollLambda);
+    weeklyLunchmenusBucket.grantReadWrite(batchPollLambda, "parse-cache/*");
+    weeklyLunchmenusBucket.grantReadWrite(batchPollLambda, "fetch-state/*");
+    weeklyLunchmenusBucket.grantReadWrite(batchPollLambda, "batches/*");
+    weeklyLunchmenusBucket.grantDelete(batchPollLambda, "batches/*");
 
     openAiApiKeySecret.grantRead(parseHtmlLambda);
     openAiApiKeySecret.grantRead(parseImageLambda);
+    openAiApiKeySecret.grantRead(batchCollectLambda);
+    openAiApiKeySecret.grantRead(batchPollLambda);
 
     table.grantReadWriteData(importToDdbLambda);
+    importToDdbLambda.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["dynamodb:Query"],
+        resources: [`${table.tableArn}/index/by_city_week_day`]
+      })
+    );
     table.grantReadData(enqueueRestaurantsLambda);
+    table.grantReadData(batchCollectLambda);
+    table.grantReadData(scheduleRestaurantsLambda);
+    scheduleRestaurantsLambda.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["dynamodb:UpdateItem"],
+        resources: [table.tableArn]
+      })
+    );
+    for (const directoryReader of [enqueueRestaurantsLambda, scheduleRestaurantsLambda, batchCollectLambda]) {
+      directoryReader.addToRolePolicy(
+        new iam.PolicyStatement({
+          actions: ["dynamodb:Query", "dynamodb:Scan"],
+          resources: [`${table.tableArn}/index/restaurant_directory`]
+        })
+      );
+    }
     table.grantReadData(apiLambda);
+    apiLambda.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["dynamodb:Query"],
+        resources: [
+          `${table.tableArn}/index/restaurant_directory`,
+          `${table.tableArn}/index/by_city_week_day`
+        ]
+      })
+    );
     table.grantReadData(parseImageLambda);
 
     parseQueue.grantSendMessages(enqueueRestaurantsLambda);
+    parseQueue.grantSendMessages(scheduleRestaurantsLambda);
+    parseQueue.grantSendMessages(batchPollLambda);
 
     new cdk.CfnOutput(this, "ApiEndpoint", {
       value: api.url
@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "lambdas"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-north-1")
+os.environ.setdefault("CACHE_BACKEND", "none")
@@ -0,0 +1,101 @@
+import pytest
+
+from api import index as api
+from shared import ttl_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ttl_cache.time, "monotonic", clock)
+    cache = ttl_cache.TTLCache(2)
+
+    cache.put("a", 1, 10)
+    cache.put("b", 2, 60)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 60)
+    assert cache.get("b") is None
+
+    clock.now += 30
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    assert cache.stats == {"hits": 2, "misses": 2, "evictions": 1, "expired": 1}
+
+
+def _result(status_code=200, etag='"abc"'):
+    return {"statusCode": status_code, "headers": {"ETag": etag}, "body": "{}"}
+
+
+@pytest.mark.parametrize("header", ['"abc"', 'W/"abc"', '"old", "abc"'])
+def test_matching_etag_returns_304(header):
+    result = api.not_modified(_result(), {"headers": {"if-none-match": header}})
+
+    assert (result["statusCode"], result["body"]) == (304, "")
+
+
+@pytest.mark.parametrize(
+    "result, header",
+    [(_result(), '"other"'), (_result(), None), (_result(status_code=404), '"abc"')],
+)
+def test_other_requests_are_returned_unchanged(result, header):
+    event = {"headers": {"If-None-Match": header} if header else {}}
+
+    assert api.not_modified(result, event) == result
+
+
+class FakeTable:
+    name = "lunch"
+
+    def __init__(self):
+        self.queries = 0
+
+    def get_item(self, Key):
+        return {"Item": {"version": 3}} if Key["restaurant_id"] == "VERSION" else {}
+
+    def query(self, **_kwargs):
+        self.queries += 1
+        return {"Items": [{"restaurant_id": "r1"}]}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setenv("TABLE_NAME", "lunch")
+    monkeypatch.delenv("LUNCH_PAGES_BUCKET", raising=False)
+    monkeypatch.setattr(api.ddb, "Table", lambda _name: table)
+    monkeypatch.setattr(api.lunch_pages.ddb, "batch_get_item", lambda RequestItems: {"Responses": {}})
+    api._CACHE.clear()
+    api._VERSIONS.clear()
+    return table
+
+
+def _event(resource, params, headers=None):
+    return {"httpMethod": "GET", "resource": resource, "pathParameters": params, "headers": headers or {}}
+
+
+def test_lunch_responses_are_cached_and_revalidated(table):
+    event = _event("/lunch/{city}/{week}/{day}", {"city": "goteborg", "week": "2026_04", "day": "mon"})
+
+    first = api.handler(event, None)
+    second = api.handler({**event, "headers": {"If-None-Match": first["headers"]["ETag"]}}, None)
+
+    assert first["headers"]["X-Cache"] == "miss"
+    assert (second["statusCode"], second["headers"]["X-Cache"]) == (304, "hit")
+    assert table.queries == 1
+
+
+def test_restaurant_routes_are_not_cached(table):
+    event = _event("/restaurants", {})
+
+    api.handler(event, None)
+    result = api.handler(event, None)
+
+    assert "X-Cache" not in result["headers"]
+    assert table.queries == 2
@@ -0,0 +1,108 @@
+import json
+
+from batch_collect import index as batch_collect
+from batch_poll import index as batch_poll
+from shared import parse_cache
+
+PAGE = "<h2>Kök A</h2><p>Måndag: Kottbullar 129 kr</p><h2>Kök B</h2><p>Måndag: Pasta 119 kr</p>"
+URL = "https://example.com/lunch"
+VALID_CSV = "day,lunch,price,tags\nmon,Pasta,119,italienskt"
+
+
+class FakeStorage:
+    def __init__(self):
+        self.saved = {}
+        self.manifests = []
+
+    def save_weekly_csv(self, csv_text, restaurant_id, city="", area=""):
+        self.saved[restaurant_id] = (csv_text, city, area)
+
+    def save_batch_manifest(self, manifest):
+        self.manifests.append(manifest)
+
+    def move_batch_manifest(self, manifest, _source, _target):
+        self.manifests.append(manifest)
+
+
+def _setup(monkeypatch):
+    fetches = []
+    fetch_states = []
+    page = {"html": PAGE, "etag": None, "last_modified": None, "body_hash": "hash"}
+
+    def fake_fetch(restaurant_id, _url):
+        fetches.append(restaurant_id)
+        return page, "key"
+
+    monkeypatch.setattr(batch_collect.parse_html, "fetch_changed_page", fake_fetch)
+    monkeypatch.setattr(batch_collect.parse_html, "save_fetch_state", lambda *args: fetch_states.append(args[0]))
+    monkeypatch.setattr(parse_cache, "get_cached_csv", lambda *_args: None)
+    monkeypatch.setattr(parse_cache, "put_cached_csv", lambda *_args: None)
+    return fetches, fetch_states
+
+
+def _message(restaurant_id, section=None, city="goteborg"):
+    message = {"restaurant_id": restaurant_id, "restaurant_url": URL, "city": city, "area": "centrum"}
+    if section:
+        message["section"] = section
+    return message
+
+
+def _request_text(parse) -> str:
+    return "\n".join(part["text"] for entry in parse["request"]["input"] for part in entry["content"])
+
+
+def test_only_the_restaurant_section_is_submitted(monkeypatch):
+    _setup(monkeypatch)
+
+    (parse,) = batch_collect.prepare_restaurant(_message("b", "Kök B"))["parses"]
+
+    assert "Pasta" in _request_text(parse)
+    assert "Kottbullar" not in _request_text(parse)
+
+
+def test_missing_section_fails_only_that_restaurant(monkeypatch):
+    _setup(monkeypatch)
+    message = {
+        "restaurant_id": "a",
+        "restaurant_url": URL,
+        "restaurants": [_message("a", "Kök A"), _message("c", "Kök C")],
+    }
+
+    prepared = batch_collect.prepare_restaurant(message)
+
+    assert prepared["failed"] == ["c"]
+    assert [parse["restaurants"][0]["restaurant_id"] for parse in prepared["parses"]] == ["a"]
+
+
+def test_restaurants_on_one_url_share_a_fetch_and_a_batch_line(monkeypatch):
+    fetches, fetch_states = _setup(monkeypatch)
+    monkeypatch.setenv("TABLE_NAME", "lunch")
+    monkeypatch.setattr(
+        batch_collect.enqueue_restaurants,
+        "iter_restaurant_messages",
+        lambda *_args: iter([_message("a"), _message("b", city="kungsbacka")]),
+    )
+    lines = []
+    monkeypatch.setattr(batch_collect.openai_batch, "upload_batch_file", lambda batch_lines: lines.extend(batch_lines) or "file")
+    monkeypatch.setattr(batch_collect.openai_batch, "create_batch", lambda *_args: {"id": "batch"})
+    storage = FakeStorage()
+    monkeypatch.setattr(batch_collect, "storage", storage)
+
+    result = batch_collect.handler({}, None)
+
+    assert fetches == ["a"]
+    assert result["submitted"] == 1
+    assert [json.loads(line)["custom_id"] for line in lines] == ["a"]
+    (manifest,) = storage.manifests
+    assert [restaurant["restaurant_id"] for restaurant in manifest["entries"]["a"]["restaurants"]] == ["a", "b"]
+    assert fetch_states == []
+
+    monkeypatch.setattr(batch_poll.openai_batch, "get_batch", lambda _batch_id: {"status": "completed"})
+    monkeypatch.setattr(batch_poll, "collect_results", lambda _batch: {"a": {"text": VALID_CSV}})
+    monkeypatch.setattr(batch_poll, "storage", storage)
+    monkeypatch.setattr(batch_poll.parse_html, "save_fetch_state", lambda *args: fetch_states.append(args[0]))
+
+    assert batch_poll.handle_manifest(manifest)["saved"] == 2
+
+    assert storage.saved == {"a": (VALID_CSV, "goteborg", "centrum"), "b": (VALID_CSV, "kungsbacka", "centrum")}
+    assert fetch_states == ["a"]
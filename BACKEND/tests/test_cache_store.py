@@ -0,0 +1,39 @@
+import pytest
+
+from shared import cache_store
+from shared import parse_cache
+
+
+@pytest.fixture
+def local_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("CACHE_BACKEND", "local")
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache_store, "_STORES", {})
+    return tmp_path
+
+
+def test_parse_cache_round_trip(local_cache):
+    digest = parse_cache.content_digest("  Måndag:\n Köttbullar ")
+
+    assert parse_cache.get_cached_csv("html", digest, "m", "v1") is None
+    parse_cache.put_cached_csv("html", digest, "m", "v1", "day,lunch,price,tags", "r1")
+
+    assert parse_cache.get_cached_csv("html", digest, "m", "v1") == "day,lunch,price,tags"
+    assert (local_cache / "parse-cache" / "html" / "m" / "v1" / f"{digest}.json").exists()
+
+
+def test_read_failures_are_logged_not_raised(local_cache, capsys):
+    (local_cache / "fetch-state").mkdir()
+    (local_cache / "fetch-state" / "broken.json").write_text("{", encoding="utf-8")
+
+    assert cache_store.get_json("fetch-state", "broken.json") is None
+    assert "cache_store read failed" in capsys.readouterr().out
+
+
+def test_disabled_cache_is_a_no_op(monkeypatch):
+    monkeypatch.setenv("CACHE_BACKEND", "none")
+    monkeypatch.setattr(cache_store, "_STORES", {})
+
+    cache_store.put_json("parse-cache", "key.json", {"csv": "x"})
+
+    assert cache_store.get_json("parse-cache", "key.json") is None
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+
+import pytest
+
+from parse_html import index as parse_html
+from parse_image import index as parse_image
+from shared import concurrency
+
+
+def test_results_keep_input_order_and_errors_stay_per_item():
+    def work(item):
+        time.sleep(0.01 * (5 - item))
+        if item == 2:
+            raise ValueError("bad item")
+        return item * 10
+
+    outcomes = concurrency.run_concurrently(range(5), work, 4)
+
+    assert [(item, result) for item, result, _error in outcomes] == [(0, 0), (1, 10), (2, None), (3, 30), (4, 40)]
+    assert [str(error) for _item, _result, error in outcomes if error] == ["bad item"]
+    assert concurrency.collect_failures(outcomes, lambda item: {"item": item}) == [
+        {"item": 2, "error": "ValueError: bad item"}
+    ]
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_pool_is_bounded(max_workers):
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def work(_item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    concurrency.run_concurrently(range(8), work, max_workers)
+
+    assert peak[0] <= max_workers
+    assert (peak[0] > 1) == (max_workers > 1)
+
+
+def test_thread_table_is_per_thread():
+    tables = []
+    worker = threading.Thread(target=lambda: tables.append(concurrency.thread_table("lunch")))
+    worker.start()
+    worker.join()
+
+    assert concurrency.thread_table("lunch") is concurrency.thread_table("lunch")
+    assert tables[0] is not concurrency.thread_table("lunch")
+
+
+def _sqs_record(message_id, restaurant_id):
+    return {"messageId": message_id, "body": json.dumps({"restaurant_id": restaurant_id})}
+
+
+def test_parse_html_reports_only_failed_messages(monkeypatch):
+    handled = []
+
+    def fake_handle_record(record):
+        body = json.loads(record["body"])
+        handled.append(body["restaurant_id"])
+        if body["restaurant_id"] == "broken":
+            raise RuntimeError("fetch failed")
+
+    monkeypatch.setattr(parse_html, "handle_record", fake_handle_record)
+    event = {"Records": [_sqs_record("m1", "a"), _sqs_record("m2", "broken"), _sqs_record("m3", "c")]}
+
+    result = parse_html.handler(event, None)
+
+    assert result == {"ok": False, "batchItemFailures": [{"itemIdentifier": "m2"}]}
+    assert sorted(handled) == ["a", "broken", "c"]
+
+
+def test_parse_image_fails_the_event_after_processing_every_record(monkeypatch):
+    handled = []
+
+    def fake_parse_record(record):
+        key = record["s3"]["object"]["key"]
+        handled.append(key)
+        if key == "menus/broken.jpg":
+            raise ValueError("unreadable")
+        return key
+
+    monkeypatch.setattr(parse_image, "parse_record", fake_parse_record)
+    keys = ["menus/a.jpg", "menus/broken.jpg", "menus/c.jpg"]
+    event = {"Records": [{"s3": {"object": {"key": key}}} for key in keys]}
+
+    with pytest.raises(RuntimeError, match="1 of 3"):
+        parse_image.handler(event, None)
+
+    assert sorted(handled) == keys
@@ -0,0 +1,90 @@
+import pytest
+
+from shared import openai_client
+
+CONTEXT = {"restaurant_id": "r1"}
+VALID_ROWS = [
+    "mon,Köttbullar med potatismos,129,husmanskost",
+    "tue,Fiskgratäng,139,fisk",
+    "wed,Pasta carbonara,119,pasta",
+    "thu,Ärtsoppa med pannkakor,105,husmanskost",
+]
+
+
+class FakeRepair:
+    def __init__(self, text=""):
+        self.text = text
+        self.payloads = []
+
+    def __call__(self, task, _context, payload, **_kwargs):
+        assert task == "repair"
+        self.payloads.append(payload)
+        return self.text
+
+
+@pytest.fixture
+def repair(monkeypatch):
+    fake = FakeRepair()
+    monkeypatch.setattr(openai_client, "query_chatgpt", fake)
+    return fake
+
+
+def _csv(*rows) -> str:
+    return "\n".join(["day,lunch,price,tags", *rows])
+
+
+def _tier(capsys) -> str:
+    line = next(line for line in capsys.readouterr().out.splitlines() if line.startswith("CSV repaired"))
+    return line.split("'tier': '")[1].split("'")[0]
+
+
+def test_valid_csv_is_returned_as_is(repair):
+    csv_text = _csv(*VALID_ROWS)
+
+    assert openai_client.repair_csv_response(csv_text, CONTEXT) == csv_text
+    assert repair.payloads == []
+
+
+def test_local_tier_fixes_format_problems(repair, capsys):
+    csv_text = "Här är menyn:\n```csv\nDay,Lunch,Price,Tags\nMåndag,Köttbullar,129 kr,Husmanskost\nTisdag,Lax,139:-,Fisk\n```"
+
+    repaired = openai_client.repair_csv_response(csv_text, CONTEXT)
+
+    assert repaired == _csv("mon,Köttbullar,129,husmanskost", "tue,Lax,139,fisk")
+    assert _tier(capsys) == "local"
+    assert repair.payloads == []
+
+
+def test_openai_tier_resubmits_only_invalid_rows(repair, capsys):
+    repair.text = _csv("fri,Biff Rydberg,155,kött")
+
+    repaired = openai_client.repair_csv_response(_csv(*VALID_ROWS, "fri,,155,kött"), CONTEXT)
+
+    assert repaired == _csv(*VALID_ROWS, "fri,Biff Rydberg,155,kött")
+    assert _tier(capsys) == "openai"
+    assert repair.payloads[0]["rows"] == _csv("fri,,155,kött")
+
+
+def test_drop_tier_removes_rows_that_stay_invalid(repair, capsys):
+    repair.text = "Tyvärr kan jag inte hjälpa till."
+
+    repaired = openai_client.repair_csv_response(_csv(*VALID_ROWS, "fri,,155,kött"), CONTEXT)
+
+    assert repaired == _csv(*VALID_ROWS)
+    assert _tier(capsys) == "drop"
+
+
+def test_too_many_invalid_rows_skip_the_openai_tier(monkeypatch, repair):
+    monkeypatch.setenv("OPENAI_REPAIR_MAX_ROWS", "1")
+    broken = ["tue,,139,fisk", "wed,,119,pasta"]
+
+    with pytest.raises(ValueError):
+        openai_client.repair_csv_response(_csv(VALID_ROWS[0], *broken), CONTEXT)
+
+    assert repair.payloads == []
+
+
+@pytest.mark.parametrize("csv_text", ["Ingen meny denna vecka.", _csv("mon,,129,", "tue,,139,")])
+def test_unrepairable_output_raises(repair, csv_text):
+    with pytest.raises(ValueError, match="validation failed"):
+        openai_client.repair_csv_response(csv_text, CONTEXT)
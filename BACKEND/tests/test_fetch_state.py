@@ -0,0 +1,93 @@
+import pytest
+
+from parse_html import index as parse_html
+from shared import cache_store
+
+URL = "https://example.com/lunch"
+HTML = "<p>Måndag: Köttbullar 129 kr</p>"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text=HTML, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise parse_html.requests.HTTPError(str(self.status_code))
+
+
+class FakeServer:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers, timeout):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def local_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("CACHE_BACKEND", "local")
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache_store, "_STORES", {})
+
+
+def _serve(monkeypatch, *responses) -> FakeServer:
+    server = FakeServer(*responses)
+    monkeypatch.setattr(parse_html.requests, "get", server.get)
+    return server
+
+
+def _fetch_and_save(restaurant_id="r1", force=False):
+    fetched = parse_html.fetch_changed_page(restaurant_id, URL, force=force)
+    if fetched:
+        page, weekly_key = fetched
+        parse_html.save_fetch_state(restaurant_id, URL, page, weekly_key)
+    return fetched
+
+
+def test_saved_validators_are_sent_and_304_skips_the_parse(monkeypatch):
+    validators = {"ETag": '"v1"', "Last-Modified": "Mon, 19 Jan 2026 08:00:00 GMT"}
+    server = _serve(monkeypatch, FakeResponse(headers=validators), FakeResponse(status_code=304, text=""))
+
+    assert _fetch_and_save()
+    assert _fetch_and_save() is None
+
+    assert "If-None-Match" not in server.requests[0]
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+    assert server.requests[1]["If-Modified-Since"] == "Mon, 19 Jan 2026 08:00:00 GMT"
+
+
+def test_identical_body_without_validators_is_skipped(monkeypatch):
+    _serve(monkeypatch, FakeResponse(), FakeResponse(), FakeResponse(text=HTML + "<p>Tisdag: Lax</p>"))
+
+    assert _fetch_and_save()
+    assert _fetch_and_save() is None
+    assert _fetch_and_save()
+
+
+@pytest.mark.parametrize("new_week, force", [(True, False), (False, True)])
+def test_state_is_ignored_in_a_new_week_or_when_forced(monkeypatch, new_week, force):
+    server = _serve(monkeypatch, FakeResponse(headers={"ETag": '"v1"'}), FakeResponse(headers={"ETag": '"v1"'}))
+    assert _fetch_and_save()
+    if new_week:
+        monkeypatch.setattr(
+            parse_html.date_utils, "build_weekly_key", lambda restaurant_id: f"weekly/next/{restaurant_id}.csv"
+        )
+
+    # The same body is parsed again: the saved menu belongs to another week.
+    assert _fetch_and_save(force=force)
+
+    assert "If-None-Match" not in server.requests[1]
+
+
+def test_unchanged_page_is_not_parsed(monkeypatch):
+    _serve(monkeypatch, FakeResponse(headers={"ETag": '"v1"'}), FakeResponse(status_code=304, text=""))
+    _fetch_and_save()
+    monkeypatch.setattr(parse_html, "parse_blocks_to_csv", lambda *_args: pytest.fail("unchanged page was parsed"))
+
+    parse_html.handle_payload({"restaurant_id": "r1", "restaurant_url": URL}, "test")
@@ -0,0 +1,98 @@
+import gzip
+import json
+
+from api import index as api
+from shared import lunch_pages
+
+
+class FakeTable:
+    name = "lunch"
+
+    def __init__(self, items):
+        self.items = items
+
+    def query(self, **_kwargs):
+        return {"Items": list(self.items)}
+
+
+class FakePaginator:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def paginate(self, Bucket, Prefix):
+        yield {"Contents": [{"Key": key} for key in sorted(self.objects) if key.startswith(Prefix)]}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **_kwargs):
+        self.objects[Key] = Body
+
+    def get_paginator(self, _name):
+        return FakePaginator(self.objects)
+
+    def document(self, key):
+        return json.loads(gzip.decompress(self.objects[key]))
+
+
+def _menu_item(restaurant_id, area, dish):
+    return {"restaurant_id": restaurant_id, "area": area, "dishes": [{"name": dish, "tags": []}]}
+
+
+def _no_infos(monkeypatch):
+    monkeypatch.setattr(lunch_pages.ddb, "batch_get_item", lambda RequestItems: {"Responses": {}})
+
+
+def test_written_items_replace_stale_index_results(monkeypatch):
+    _no_infos(monkeypatch)
+    table = FakeTable([_menu_item("r1", "centrum", "Old"), _menu_item("r2", "centrum", "Soppa")])
+    written = {"r1": _menu_item("r1", "centrum", "New"), "r3": _menu_item("r3", "majorna", "Lax"), "r2": None}
+
+    pages = lunch_pages.build_lunch_pages(table, "idx", "goteborg", "2026_04", "mon", written)
+
+    assert [entry["dishes"][0]["name"] for entry in pages[None]["items"]] == ["New", "Lax"]
+    assert sorted(area for area in pages if area) == ["centrum", "majorna"]
+
+
+def test_emptied_area_page_is_overwritten(monkeypatch):
+    _no_infos(monkeypatch)
+    s3 = FakeS3()
+    monkeypatch.setattr(lunch_pages.storage, "s3", s3)
+    table = FakeTable([_menu_item("r1", "centrum", "Soppa"), _menu_item("r2", "majorna", "Lax")])
+    pages = lunch_pages.build_lunch_pages(table, "idx", "goteborg", "2026_04", "mon")
+    lunch_pages.publish_lunch_pages("bucket", "goteborg", "2026_04", "mon", pages)
+
+    pages = lunch_pages.build_lunch_pages(table, "idx", "goteborg", "2026_04", "mon", {"r2": None})
+    lunch_pages.publish_lunch_pages("bucket", "goteborg", "2026_04", "mon", pages)
+
+    assert s3.document(lunch_pages.page_key("goteborg", "2026_04", "mon", "majorna"))["items"] == []
+    assert len(s3.document(lunch_pages.page_key("goteborg", "2026_04", "mon", "centrum"))["items"]) == 1
+    assert len(s3.document(lunch_pages.page_key("goteborg", "2026_04", "mon"))["items"]) == 1
+
+
+def test_index_fallback_returns_the_page_item_shape(monkeypatch):
+    info = {"restaurant_id": "r1", "sk": "INFO", "restaurant_name": "Kök Ett", "address": "Gatan 1"}
+    monkeypatch.setattr(lunch_pages.ddb, "batch_get_item", lambda RequestItems: {"Responses": {"lunch": [info]}})
+    menu_item = {
+        **_menu_item("r1", "centrum", "Soppa"),
+        "sk": "MENU#2026_04#mon",
+        "dishes_hash": "abc",
+        "city_week_day": "goteborg#2026_04#mon",
+        "area_restaurant": "centrum#r1",
+    }
+    table = FakeTable([menu_item])
+    event = {
+        "httpMethod": "GET",
+        "resource": "/lunch/{city}/{week}/{day}",
+        "pathParameters": {"city": "goteborg", "week": "2026_04", "day": "mon"},
+        "queryStringParameters": {"limit": "10"},
+    }
+
+    (item,) = json.loads(api.route(event, table)["body"])["items"]
+
+    (page_item,) = lunch_pages.build_lunch_pages(table, "idx", "goteborg", "2026_04", "mon")[None]["items"]
+    assert item == json.loads(lunch_pages.dumps(page_item))
+    assert item["restaurant_name"] == "Kök Ett"
+    assert "sk" not in item
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+from parse_html import index as parse_html
+from parse_html import menu_region
+
+FIXTURE = Path(__file__).resolve().parents[2] / "SCRIPTS" / "fixtures" / "html" / "sample_wordpress.html"
+NOISE = [f"Nyhet {index}: Vi har fått ett nytt pris för vår service och tackar alla gäster" for index in range(40)]
+EVENTS = [f"Evenemang {index}: Vinprovning i vår bar med musik och mingel hela kvällen" for index in range(40)]
+
+
+@pytest.fixture
+def menu_blocks():
+    return parse_html.sanitize_html_blocks(FIXTURE.read_text(encoding="utf-8"))
+
+
+def test_menu_region_drops_surrounding_noise(menu_blocks):
+    result = menu_region.extract_menu_region(NOISE + menu_blocks + EVENTS)
+
+    assert result["report"]["used_region"] is True
+    assert result["report"]["token_reduction_pct"] > 50
+    for dish in ("Pocherad torsk", "Falafel med hummus", "Veckans sallad"):
+        assert dish in result["text"]
+    assert "Nyhet" not in result["text"]
+    assert "Evenemang 10:" not in result["text"]
+
+
+def test_context_blocks_are_kept_around_the_region(monkeypatch, menu_blocks):
+    monkeypatch.setenv("MENU_REGION_CONTEXT_BLOCKS", "0")
+    tight = menu_region.extract_menu_region(NOISE + menu_blocks + EVENTS)["text"]
+    monkeypatch.setenv("MENU_REGION_CONTEXT_BLOCKS", "3")
+    wide = menu_region.extract_menu_region(NOISE + menu_blocks + EVENTS)["text"]
+
+    assert tight in wide
+    assert "Evenemang 2:" in wide and "Evenemang" not in tight
+
+
+@pytest.mark.parametrize(
+    "blocks, reason",
+    [
+        ([], "empty"),
+        (["Välkommen till oss", "Kontakt"], "no_signal"),
+        (NOISE + ["Måndag", "Köttbullar med potatismos 129 kr", "Pannbiff med lök 129 kr"] + NOISE, "low_confidence"),
+    ],
+)
+def test_weak_regions_fall_back_to_the_full_text(blocks, reason):
+    result = menu_region.extract_menu_region(blocks)
+
+    assert result["report"]["reason"] == reason
+    assert result["text"] == " ".join(blocks)
+
+
+def test_page_that_is_mostly_menu_is_sent_whole(menu_blocks):
+    result = menu_region.extract_menu_region(menu_blocks)
+
+    assert result["report"]["reason"] == "region_too_large"
+    assert result["text"] == " ".join(menu_blocks)
+
+
+def test_extraction_can_be_disabled(monkeypatch, menu_blocks):
+    monkeypatch.setenv("MENU_REGION_EXTRACTION", "off")
+
+    result = menu_region.extract_menu_region(NOISE + menu_blocks)
+
+    assert result["report"]["reason"] == "disabled"
+    assert result["text"] == " ".join(NOISE + menu_blocks)
@@ -0,0 +1,110 @@
+import pytest
+import requests
+
+from shared import openai_client
+
+VALID_CSV = """day,lunch,price,tags
+mon,Köttbullar,129,husmanskost
+tue,Pasta,119,italienskt
+wed,Lax,139,fisk
+thu,Ärtsoppa,105,husmanskost
+fri,Biff,155,kött"""
+
+
+def test_cheap_tier_failure_escalates_to_strong_tier(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL_TIERS", "cheap,strong")
+    calls = []
+
+    def fake_query_model(_task, _context, _payload, model):
+        calls.append(model)
+        if model == "cheap":
+            raise ValueError("OpenAI CSV validation failed")
+        return VALID_CSV
+
+    monkeypatch.setattr(openai_client, "_query_model", fake_query_model)
+
+    csv_text = openai_client.parse_html_to_csv("<p>menu</p>", {"restaurant_id": "r1"})
+
+    assert calls == ["cheap", "strong"]
+    assert csv_text == VALID_CSV
+
+
+def test_cheap_tier_request_error_escalates(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL_TIERS", "cheap,strong")
+    calls = []
+
+    def fake_query_model(_task, _context, _payload, model):
+        calls.append(model)
+        if model == "cheap":
+            raise requests.HTTPError("429 Client Error: Too Many Requests")
+        return VALID_CSV
+
+    monkeypatch.setattr(openai_client, "_query_model", fake_query_model)
+
+    assert openai_client.parse_html_to_csv("<p>menu</p>", {"restaurant_id": "r1"}) == VALID_CSV
+    assert calls == ["cheap", "strong"]
+
+
+def test_cached_strong_result_skips_the_cheap_tier(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL_TIERS", "cheap,strong")
+    monkeypatch.setattr(
+        openai_client.parse_cache,
+        "get_cached_csv",
+        lambda _task, _digest, model, _version: VALID_CSV if model == "strong" else None,
+    )
+
+    def fake_query_model(*_args):
+        raise AssertionError("unchanged content must not be sent to OpenAI")
+
+    monkeypatch.setattr(openai_client, "_query_model", fake_query_model)
+
+    assert openai_client.parse_html_to_csv("<p>menu</p>", {"restaurant_id": "r1"}) == VALID_CSV
+
+
+def test_strong_tier_failure_is_raised(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL_TIERS", "cheap,strong")
+
+    def fake_query_model(_task, _context, _payload, _model):
+        raise ValueError("OpenAI CSV validation failed")
+
+    monkeypatch.setattr(openai_client, "_query_model", fake_query_model)
+
+    with pytest.raises(ValueError, match="validation failed"):
+        openai_client.parse_html_to_csv("<p>menu</p>", {"restaurant_id": "r1"})
+
+
+class FakeLambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_no_escalation_past_the_deadline(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL_TIERS", "cheap,strong")
+    calls = []
+
+    def fake_query_model(_task, _context, _payload, model):
+        calls.append(model)
+        return "\n".join(VALID_CSV.splitlines()[:3])
+
+    monkeypatch.setattr(openai_client, "_query_model", fake_query_model)
+    openai_client.set_deadline(FakeLambdaContext(20_000))
+    try:
+        csv_text = openai_client.parse_html_to_csv("<p>menu</p>", {"restaurant_id": "r1"})
+    finally:
+        openai_client.set_deadline(None)
+
+    assert calls == ["cheap"]
+    assert csv_text.count("\n") == 2
+
+
+def test_openai_request_stops_at_the_deadline(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    openai_client.set_deadline(FakeLambdaContext(1_000))
+    try:
+        with pytest.raises(openai_client.DeadlineExceeded):
+            openai_client.openai_request("POST", "/v1/responses", b"{}")
+    finally:
+        openai_client.set_deadline(None)
@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+from parse_image import preprocess
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _encode(image_format: str, size=(64, 48)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(output, format=image_format)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("image_format", ["BMP", "TIFF"])
+def test_unsupported_format_is_reencoded_as_jpeg(image_format):
+    binary, mime_type = preprocess.downscale_image(_encode(image_format))
+
+    assert mime_type == "image/jpeg"
+    assert Image.open(io.BytesIO(binary)).format == "JPEG"
+
+
+def test_bmp_upload_is_labelled_by_its_content():
+    prepared = preprocess.prepare_upload(_encode("BMP"))
+
+    (binary, mime_type), = prepared["images"]
+    assert mime_type == "image/jpeg"
+    assert binary.startswith(b"\xFF\xD8")
+
+
+@pytest.mark.parametrize("image_format, expected", [("PNG", "image/png"), ("WEBP", "image/webp"), ("GIF", "image/gif")])
+def test_small_supported_image_is_kept(image_format, expected):
+    original = _encode(image_format)
+
+    assert preprocess.downscale_image(original) == (original, expected)
@@ -0,0 +1,57 @@
+import pytest
+
+from import_to_ddb import index as import_to_ddb
+from shared import csv_repair
+from shared import openai_client
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("89,50", "90"),
+        ("89.40", "89"),
+        ("129 kr", "129"),
+        ("129:-", "129"),
+        ("95/115", "95"),
+        ("1 295 kr", "1295"),
+        ("", ""),
+    ],
+)
+def test_repair_outputs_whole_kronor(raw, expected):
+    assert csv_repair.normalize_price(raw) == expected
+
+
+def test_comma_decimal_price_survives_repair_and_import():
+    csv_text = 'day,lunch,price,tags\nmon,Köttbullar,"89,50",husmanskost\ntue,Lax,129 kr,fisk'
+
+    repaired = openai_client.repair_csv_response(csv_text, {"restaurant_id": "r1"})
+    items = import_to_ddb.build_menu_items(import_to_ddb.parse_csv(repaired), "r1", "2026_04", None, None)
+
+    assert items["MENU#2026_04#mon"]["dishes"][0]["price"] == 90
+    assert items["MENU#2026_04#tue"]["dishes"][0]["price"] == 129
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("89,50", 90),
+        ("1 295", 1295),
+        ("1\u00a0295 kr", 1295),
+        ("1\u202f295:-", 1295),
+        ("2 100,50 kr", 2101),
+        # Only the first of several prices is kept (the cheapest option).
+        ("95/115", 95),
+        ("", None),
+    ],
+)
+def test_importer_uses_the_same_normaliser(raw, expected):
+    assert import_to_ddb.normalize_price(raw) == expected
+
+
+def test_thousands_separator_survives_repair_and_import():
+    csv_text = "day,lunch,price,tags\nmon,Avsmakningsmeny,1\u00a0295 kr,fest\ntue,Lax,129 kr,fisk"
+
+    repaired = openai_client.repair_csv_response(csv_text, {"restaurant_id": "r1"})
+    items = import_to_ddb.build_menu_items(import_to_ddb.parse_csv(repaired), "r1", "2026_04", None, None)
+
+    assert items["MENU#2026_04#mon"]["dishes"][0]["price"] == 1295
@@ -0,0 +1,44 @@
+import base64
+import json
+
+from shared import openai_client
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 3
+
+
+def _body_bytes(body) -> bytes:
+    data = b"".join(body)
+    assert len(data) == len(body)
+    return data
+
+
+def test_html_with_placeholder_text_is_sent_verbatim():
+    html = "Kod @@file:0@@ rabatt"
+    request = openai_client.build_openai_request("html", {"restaurant_id": "r1"}, {"html": html}, "m", 100)
+
+    body = _body_bytes(openai_client.encode_request_body(request, []))
+
+    assert json.loads(body) == request
+
+
+def test_image_request_matches_inline_encoding():
+    payload = {"images": [(PNG, "image/png")]}
+    nonce = openai_client.new_file_nonce()
+    request = openai_client.build_openai_request("image", {"restaurant_id": "r1"}, payload, "m", 100, nonce)
+    inline = openai_client.build_openai_request("image", {"restaurant_id": "r1"}, payload, "m", 100)
+
+    body = _body_bytes(openai_client.encode_request_body(request, [PNG], nonce))
+
+    assert json.loads(body) == inline
+
+
+def test_forged_placeholder_in_page_text_is_not_spliced():
+    payload = {"images": [(PNG, "image/png")]}
+    context = {"restaurant_id": "r1", "restaurant_url": "https://example.com/@@file:0@@ @@file:x:0@@"}
+    nonce = openai_client.new_file_nonce()
+    request = openai_client.build_openai_request("image", context, payload, "m", 100, nonce)
+
+    body = _body_bytes(openai_client.encode_request_body(request, [PNG], nonce))
+
+    assert json.loads(body)["input"][1]["content"][0]["text"] == request["input"][1]["content"][0]["text"]
+    assert body.count(base64.b64encode(PNG)) == 1
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from parse_html import index as parse_html
+from parse_html import rule_parsers
+from shared import metrics
+
+ROOT = Path(__file__).resolve().parents[2]
+FIXTURE = ROOT / "SCRIPTS" / "fixtures" / "html" / "sample_wordpress.html"
+
+
+def test_day_headings_on_the_sample_page():
+    blocks = parse_html.sanitize_html_blocks(FIXTURE.read_text(encoding="utf-8"))
+
+    rows = rule_parsers.parse_day_headings(blocks)
+
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row["day"], []).append((row["lunch"], row["price"]))
+    assert sorted(by_day) == ["fri", "mon", "thu", "tue", "wed"]
+    assert by_day["tue"][0] == ("Gravad lax med dillstuvad potatis, citron och sallad på rädisa", "139")
+    # "Hela veckan" dishes are copied to every weekday; opening hours are not dishes.
+    assert all(("Veckans sallad: Kyckling, quinoa, fetaost och granatäpple", "125") in by_day[day] for day in by_day)
+    assert len(rows) == 15
+
+
+def test_day_name_with_inline_dish():
+    blocks = ["Måndag 14/10: Pannbiff med lök 129 kr", "Tisdagen - Fiskgratäng med potatismos 139:-", "Kontakt"]
+
+    assert rule_parsers.parse_day_headings(blocks) == [
+        {"day": "mon", "lunch": "Pannbiff med lök", "price": "129", "tags": ""},
+        {"day": "tue", "lunch": "Fiskgratäng med potatismos", "price": "139", "tags": ""},
+    ]
+
+
+def test_parse_with_rules_returns_sorted_csv():
+    blocks = ["Tisdag", "Fiskgratäng med potatismos 139 kr", "Måndag", "Pannbiff med lök 129 kr"]
+
+    csv_text = rule_parsers.parse_with_rules("day_headings", blocks, "r1")
+
+    assert csv_text.splitlines() == [
+        "day,lunch,price,tags",
+        "mon,Pannbiff med lök,129,",
+        "tue,Fiskgratäng med potatismos,139,",
+    ]
+
+
+def test_invalid_rule_output_uses_rule_metric(monkeypatch, capsys):
+    monkeypatch.setattr(
+        rule_parsers,
+        "_PARSERS",
+        {"broken": lambda _blocks: [{"day": day, "lunch": "", "price": "x", "tags": ""} for day in ("mon", "tue")]},
+    )
+
+    with metrics.scope("html", "r1"):
+        assert rule_parsers.parse_with_rules("broken", [], "r1") is None
+
+    log_line, emf_line = capsys.readouterr().out.splitlines()
+    assert log_line.startswith("rule_parsers CSV validation failed")
+    assert json.loads(emf_line)["rule_parser_invalid"] == 1
+    assert "validation_failures" not in emf_line
+
+
+@pytest.mark.parametrize("path", sorted((ROOT / "RestaurantSources").glob("*.json")), ids=lambda path: path.stem)
+def test_source_parsers_are_registered(path):
+    parser = json.loads(path.read_text(encoding="utf-8")).get("parser")
+
+    assert parser is None or rule_parsers.get_parser(parser)
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from parse_html import index as parse_html
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT / "SCRIPTS"))
+
+import bench_sanitize_html  # noqa: E402
+
+FIXTURE = ROOT / "SCRIPTS" / "fixtures" / "html" / "sample_wordpress.html"
+
+
+def test_single_pass_parser_matches_the_regex_cascade():
+    html = FIXTURE.read_text(encoding="utf-8")
+
+    text = parse_html.sanitize_html(html)
+
+    assert text == bench_sanitize_html.legacy_sanitize_html(html)
+    assert "Wallenbergare med potatispuré" in text
+    assert "elementorFrontendConfig" not in text
+
+
+@pytest.mark.parametrize("noise", ["blobs", "markup"])
+def test_padded_pages_match_the_regex_cascade(noise):
+    html = bench_sanitize_html.inflate(FIXTURE.read_text(encoding="utf-8"), 256 * 1024, noise)
+
+    assert parse_html.sanitize_html(html) == bench_sanitize_html.legacy_sanitize_html(html)
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from import_to_ddb import index as import_to_ddb
+from schedule_restaurants import index as schedule_restaurants
+from shared import date_utils
+
+
+class FakeDdbClient:
+    def __init__(self, infos, schedules):
+        self.infos = infos
+        self.schedules = schedules
+        self.updates = []
+
+    def query(self, **_kwargs):
+        return {"Items": self.infos}
+
+    def batch_get_item(self, RequestItems):
+        (table_name, request), = RequestItems.items()
+        wanted = {key["restaurant_id"]["S"] for key in request["Keys"]}
+        assert {key["sk"]["S"] for key in request["Keys"]} == {"SCHEDULE"}
+        return {"Responses": {table_name: [item for rid, item in self.schedules.items() if rid in wanted]}}
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+
+
+class FakeSqs:
+    def __init__(self):
+        self.sent = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.sent.extend(Entries)
+        return {"Failed": []}
+
+
+def _info(restaurant_id):
+    return {"restaurant_id": {"S": restaurant_id}, "sk": {"S": "INFO"}, "url": {"S": f"https://{restaurant_id}.se"}}
+
+
+def test_scheduler_reads_and_writes_the_schedule_item(monkeypatch):
+    monkeypatch.setenv("TABLE_NAME", "lunch")
+    monkeypatch.setenv("QUEUE_URL", "queue")
+    week = date_utils.build_week()
+    ddb = FakeDdbClient(
+        [_info("done"), _info("due")],
+        {
+            "done": {"restaurant_id": {"S": "done"}, "last_parsed_week": {"S": week}},
+            "due": {"restaurant_id": {"S": "due"}, "publish_offsets": {"L": [{"N": "0"}]}},
+        },
+    )
+    sqs = FakeSqs()
+    monkeypatch.setattr(schedule_restaurants.enqueue_restaurants, "ddb", ddb)
+    monkeypatch.setattr(schedule_restaurants.enqueue_restaurants, "sqs", sqs)
+
+    assert schedule_restaurants.handler({}, None) == {"ok": True, "enqueued": 1}
+
+    assert [update["Key"] for update in ddb.updates] == [{"restaurant_id": {"S": "due"}, "sk": {"S": "SCHEDULE"}}]
+    assert len(sqs.sent) == 1
+
+
+class FakeTable:
+    class meta:
+        class client:
+            class exceptions:
+                class ConditionalCheckFailedException(Exception):
+                    pass
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+        if kwargs["UpdateExpression"].startswith("REMOVE"):
+            return {}
+        self.offsets = self.offsets + kwargs["ExpressionAttributeValues"][":offset"]
+        return {"Attributes": {"publish_offsets": self.offsets}}
+
+
+def test_mark_parsed_caps_publish_history():
+    table = FakeTable([1] * import_to_ddb.MAX_PUBLISH_OFFSETS)
+
+    assert import_to_ddb.mark_parsed(table, "r1", "2026_04", "hash")
+
+    assert all(update["Key"] == {"restaurant_id": "r1", "sk": "SCHEDULE"} for update in table.updates)
+    assert table.updates[-1]["UpdateExpression"] == "REMOVE publish_offsets[0]"
+
+
+@pytest.mark.parametrize("attempts, hours_ago, due", [(1, 1, True), (3, 1, False)])
+def test_poll_backoff(monkeypatch, attempts, hours_ago, due):
+    monkeypatch.setenv("DEFAULT_PUBLISH_OFFSET_HOURS", "0")
+    monkeypatch.setenv("EARLY_MARGIN_HOURS", "0")
+    week = "2026_04"
+    now = time.time()
+    item = {
+        "poll_week": {"S": week},
+        "poll_attempts": {"N": str(attempts)},
+        "last_polled_at": {"N": str(int(now - hours_ago * 3600))},
+    }
+
+    assert schedule_restaurants.is_due(item, week, 10, now) is due
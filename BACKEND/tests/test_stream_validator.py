@@ -0,0 +1,35 @@
+import pytest
+
+from shared import openai_client
+
+MENU = "day,lunch,price,tags\nmon,Köttbullar,129,husmanskost\ntue,Lax,139,fisk\n"
+
+
+def _feed(text: str, step: int = 7) -> openai_client.CsvStreamValidator:
+    validator = openai_client.CsvStreamValidator()
+    for start in range(0, len(text), step):
+        validator.feed(text[start : start + step])
+    validator.finish()
+    return validator
+
+
+def test_short_prose_preamble_is_left_to_repair():
+    text = "Här är menyn för veckan:\n\n" + MENU
+
+    validator = _feed(text)
+
+    assert validator.rows == 3
+    assert openai_client.csv_validation_errors(text)
+    assert not openai_client.csv_validation_errors(openai_client.repair_csv_response(text, {}))
+
+
+def test_long_prose_is_aborted():
+    text = "".join(f"Rad {index} med text som inte är CSV.\n" for index in range(5)) + MENU
+
+    with pytest.raises(openai_client.CsvStreamAborted):
+        _feed(text)
+
+
+def test_prose_without_newlines_is_aborted():
+    with pytest.raises(openai_client.CsvStreamAborted):
+        _feed("Tyvärr " * 300)
@@ -0,0 +1,71 @@
+import argparse
+import sys
+from pathlib import Path
+
+import boto3
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "BACKEND" / "lambdas"))
+
+from import_to_ddb.index import city_day_keys  # noqa: E402
+
+
+def iter_menu_items(table):
+    scan_args = {
+        "FilterExpression": "begins_with(#sk, :menu)",
+        "ExpressionAttributeNames": {"#sk": "sk"},
+        "ExpressionAttributeValues": {":menu": "MENU#"},
+    }
+    while True:
+        result = table.scan(**scan_args)
+        yield from result.get("Items", [])
+        last_key = result.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        scan_args["ExclusiveStartKey"] = last_key
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table", required=True, help="DynamoDB table name")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+
+    table = boto3.resource("dynamodb").Table(args.table)
+    info_cache = {}
+    updated = skipped = 0
+
+    for item in iter_menu_items(table):
+        restaurant_id = item["restaurant_id"]
+        city = item.get("city")
+        area = item.get("area")
+        if not city:
+            if restaurant_id not in info_cache:
+                info_cache[restaurant_id] = table.get_item(
+                    Key={"restaurant_id": restaurant_id, "sk": "INFO"}
+                ).get("Item") or {}
+            city = info_cache[restaurant_id].get("city")
+            area = area or info_cache[restaurant_id].get("area")
+        if not city or not item.get("week") or not item.get("day"):
+            skipped += 1
+            continue
+
+        keys = city_day_keys(city, area, item["week"], item["day"], restaurant_id)
+        if all(item.get(name) == value for name, value in keys.items()):
+            continue
+        if not args.dry_run:
+            table.update_item(
+                Key={"restaurant_id": restaurant_id, "sk": item["sk"]},
+                UpdateExpression="SET city_week_day = :cwd, area_restaurant = :ar",
+                ExpressionAttributeValues={
+                    ":cwd": keys["city_week_day"],
+                    ":ar": keys["area_restaurant"],
+                },
+            )
+        updated += 1
+
+    action = "Would update" if args.dry_run else "Updated"
+    print(f"{action} {updated} menu items in {args.table} ({skipped} skipped without city/week/day)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from html.parser import HTMLParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "BACKEND" / "lambdas"))
+
+from parse_html import index as parse_html  # noqa: E402
+
+_LEGACY_SKIP_TAGS = {
+    "head",
+    "script",
+    "style",
+    "nav",
+    "footer",
+    "header",
+    "aside",
+    "noscript",
+    "svg",
+}
+
+# Page-builder output: large inline config scripts and JSON payloads.
+_BLOB_NOISE_BLOCK = (
+    "<script>var elementorConfig{index} = {{\"settings\": \"{blob}\"}};</script>"
+    '<script type="application/json">{{"block": {index}, "data": "{blob}"}}</script>'
+    '<div class="elementor-widget" data-settings="{padding}" style="margin:0 auto;">'
+    "<p>Relaterat innehåll {index}</p></div>\n"
+)
+# Tag-dense markup: many small elements, each with attributes to tokenize.
+_MARKUP_NOISE_BLOCK = (
+    '<div class="elementor-widget" data-settings="{{&quot;slides&quot;:[{padding}]}}" '
+    'style="margin:0 auto;padding:12px 24px;background:#fff;">'
+    "<script>var block{index} = {{\"id\": {index}, \"items\": [{padding}]}};</script>"
+    '<script type="application/json">{{"block": {index}, "data": "{padding}"}}</script>'
+    '<svg viewBox="0 0 24 24"><path d="M3 6h18v2H3V6zm0 5h18v2H3v-2z"></path></svg>'
+    "<p>Relaterat innehåll {index}</p></div>\n"
+)
+_NOISE_BLOCKS = {"blobs": _BLOB_NOISE_BLOCK, "markup": _MARKUP_NOISE_BLOCK}
+
+
+class _LegacyTextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, _attrs):
+        if tag in _LEGACY_SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in _LEGACY_SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+
+    def handle_data(self, data):
+        if self._skip_depth == 0 and data:
+            self._chunks.append(data)
+
+    def text(self) -> str:
+        return " ".join(self._chunks)
+
+
+def legacy_sanitize_html(html: str) -> str:
+    """The regex cascade that sanitize_html used before the single-pass parser."""
+    html = re.sub(r"<head\b[^>]*>[\s\S]*?</head>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<script\b[^>]*>[\s\S]*?</script>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<style\b[^>]*>[\s\S]*?</style>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<nav\b[^>]*>[\s\S]*?</nav>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<footer\b[^>]*>[\s\S]*?</footer>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<aside\b[^>]*>[\s\S]*?</aside>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<noscript\b[^>]*>[\s\S]*?</noscript>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<svg\b[^>]*>[\s\S]*?</svg>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<img\b[^>]*>", "", html, flags=re.IGNORECASE)
+    html = re.sub(
+        r"<[^>]+\btype\s*=\s*(['\"])application/json\1[^>]*>[\s\S]*?</[^>]+>",
+        "",
+        html,
+        flags=re.IGNORECASE,
+    )
+    html = re.sub(
+        r"\sdata-[\w:-]+\s*=\s*(['\"]).{200,}?\1",
+        "",
+        html,
+        flags=re.IGNORECASE,
+    )
+    html = re.sub(r"\sstyle\s*=\s*(['\"]).*?\1", "", html, flags=re.IGNORECASE)
+    extractor = _LegacyTextExtractor()
+    extractor.feed(html)
+    return " ".join(extractor.text().split())
+
+
+def inflate(html: str, target_bytes: int, noise: str = "blobs") -> str:
+    if len(html) >= target_bytes:
+        return html
+    blocks = []
+    size = len(html)
+    index = 0
+    padding = "x" * 400
+    blob = "y" * 30000
+    while size < target_bytes:
+        block = _NOISE_BLOCKS[noise].format(index=index, padding=padding, blob=blob)
+        blocks.append(block)
+        size += len(block)
+        index += 1
+    marker = html.lower().rfind("</body>")
+    if marker < 0:
+        return html + "".join(blocks)
+    return html[:marker] + "".join(blocks) + html[marker:]
+
+
+def measure(func, html: str, repeat: int):
+    timings = []
+    result = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fixtures-dir",
+        default="SCRIPTS/fixtures/html",
+        help="Folder with saved HTML pages",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per implementation")
+    parser.add_argument(
+        "--inflate-kb",
+        type=int,
+        default=0,
+        help="Pad each fixture with page-builder noise up to this size",
+    )
+    parser.add_argument(
+        "--noise",
+        choices=sorted(_NOISE_BLOCKS),
+        default="blobs",
+        help="Kind of padding used by --inflate-kb",
+    )
+    args = parser.parse_args()
+
+    fixtures_dir = (ROOT / args.fixtures_dir).resolve()
+    paths = sorted(fixtures_dir.glob("*.html"))
+    if not paths:
+        raise SystemExit(f"No fixtures found in {fixtures_dir}")
+
+    print(f"{'fixture':30} {'size_kb':>8} {'legacy_ms':>10} {'stream_ms':>10} {'speedup':>8} "
+          f"{'legacy_peak_kb':>15} {'stream_peak_kb':>15} {'same':>5}")
+    for path in paths:
+        html = path.read_text(encoding="utf-8", errors="replace")
+        if args.inflate_kb:
+            html = inflate(html, args.inflate_kb * 1024, args.noise)
+        legacy_text, legacy_seconds, legacy_peak = measure(legacy_sanitize_html, html, args.repeat)
+        stream_text, stream_seconds, stream_peak = measure(parse_html.sanitize_html, html, args.repeat)
+        speedup = legacy_seconds / stream_seconds if stream_seconds else 0
+        print(
+            f"{path.stem[:30]:30} {len(html) / 1024:8.0f} {legacy_seconds * 1000:10.1f} "
+            f"{stream_seconds * 1000:10.1f} {speedup:8.1f} {legacy_peak / 1024:15.0f} "
+            f"{stream_peak / 1024:15.0f} {str(legacy_text == stream_text):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_CSV = """day,lunch,price,tags
+mon,"Pocherad torsk med kokt potatis, räkor och brynt smör",139,fisk | husmanskost
+tue,"Pasta med svampragu, parmesan och ruccola",129,vegetariskt | italienskt
+wed,Wallenbergare med potatispuré och lingon,145,husmanskost
+thu,Ärtsoppa med fläsk och pannkakor,125,husmanskost
+fri,Biff Rydberg med äggula,155,kött | husmanskost"""
+
+
+class FakeOpenAI:
+    """In-memory stand-in for the OpenAI Responses, Files and Batch endpoints."""
+
+    def __init__(self, responses_dir: Path | None, batch_delay: float, stream_delay: float = 0):
+        self.responses_dir = responses_dir
+        self.batch_delay = batch_delay
+        self.stream_delay = stream_delay
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def csv_for(self, request: dict) -> str:
+        metadata = request.get("metadata") or {}
+        restaurant_id = metadata.get("restaurant_id")
+        suffix = ".repair.csv" if metadata.get("task") == "repair" else ".csv"
+        if self.responses_dir and restaurant_id:
+            path = self.responses_dir / f"{restaurant_id}{suffix}"
+            if path.exists():
+                return path.read_text(encoding="utf-8").strip()
+        if metadata.get("task") == "repair":
+            return DEFAULT_CSV.splitlines()[0]
+        return DEFAULT_CSV
+
+    def response_for(self, request: dict) -> dict:
+        text = self.csv_for(request)
+        prompt = json.dumps(request.get("input", []), ensure_ascii=False)
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "status": "completed",
+            "model": request.get("model"),
+            "output": [
+                {
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": text}],
+                }
+            ],
+            "usage": {
+                "input_tokens": (len(prompt) + 3) // 4,
+                "output_tokens": (len(text) + 3) // 4,
+                "total_tokens": (len(prompt) + len(text) + 6) // 4,
+            },
+        }
+
+    def stream_events(self, request: dict):
+        """Yield Responses API SSE events, sending the text in small deltas."""
+        response = self.response_for(request)
+        text = response["output"][0]["content"][0]["text"]
+        yield {"type": "response.created", "response": {**response, "status": "in_progress", "output": []}}
+        for start in range(0, len(text), 16):
+            yield {"type": "response.output_text.delta", "output_index": 0, "delta": text[start : start + 16]}
+        yield {"type": "response.output_text.done", "output_index": 0, "text": text}
+        yield {"type": "response.completed", "response": response}
+
+    def add_file(self, content: bytes, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "purpose": purpose}
+
+    def create_batch(self, request: dict) -> dict:
+        lines = self.files[request["input_file_id"]].decode("utf-8").splitlines()
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            output.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": entry["custom_id"],
+                        "response": {"status_code": 200, "body": self.response_for(entry["body"])},
+                        "error": None,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        output_file = self.add_file(("\n".join(output) + "\n").encode("utf-8"), "batch_output")
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window"),
+            "metadata": request.get("metadata"),
+            "created_at": time.time(),
+            "request_counts": {"total": len(output), "completed": len(output), "failed": 0},
+            "_output_file_id": output_file["id"],
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        return self.batch_view(batch)
+
+    def batch_view(self, batch: dict) -> dict:
+        view = {key: value for key, value in batch.items() if not key.startswith("_")}
+        if time.time() - batch["created_at"] >= self.batch_delay:
+            view["status"] = "completed"
+            view["output_file_id"] = batch["_output_file_id"]
+        else:
+            view["status"] = "in_progress"
+        return view
+
+
+def make_handler(fake: FakeOpenAI):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, request: dict):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                for event in fake.stream_events(request):
+                    payload = json.dumps(event, ensure_ascii=False)
+                    self.wfile.write(f"event: {event['type']}\ndata: {payload}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(fake.stream_delay)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client aborted the stream early.
+                pass
+
+        def _read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_POST(self):
+            body = self._read_body()
+            if self.path == "/v1/responses":
+                request = json.loads(body)
+                if request.get("stream"):
+                    self._send_stream(request)
+                else:
+                    self._send_json(200, fake.response_for(request))
+            elif self.path == "/v1/files":
+                header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                message = BytesParser(policy=HTTP).parsebytes(header + body)
+                fields = {}
+                for part in message.iter_parts():
+                    fields[part.get_param("name", header="content-disposition")] = part.get_payload(decode=True)
+                purpose = (fields.get("purpose") or b"").decode("utf-8")
+                self._send_json(200, fake.add_file(fields.get("file") or b"", purpose))
+            elif self.path == "/v1/batches":
+                self._send_json(200, fake.create_batch(json.loads(body)))
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) == 3 and parts[:2] == ["v1", "batches"] and parts[2] in fake.batches:
+                self._send_json(200, fake.batch_view(fake.batches[parts[2]]))
+            elif len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "content":
+                content = fake.files.get(parts[2])
+                if content is None:
+                    self._send_json(404, {"error": {"message": "No such file"}})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    responses_dir: Path | None = None,
+    batch_delay: float = 0,
+    stream_delay: float = 0,
+):
+    server = ThreadingHTTPServer(
+        (host, port), make_handler(FakeOpenAI(responses_dir, batch_delay, stream_delay))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address")
+    parser.add_argument("--port", type=int, default=8787, help="Port to listen on")
+    parser.add_argument(
+        "--responses-dir",
+        default=None,
+        help="Folder with recorded CSV responses named {restaurant_id}.csv",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0,
+        help="Seconds before a created batch reports completed",
+    )
+    parser.add_argument(
+        "--stream-delay",
+        type=float,
+        default=0,
+        help="Seconds to wait between streamed text deltas",
+    )
+    args = parser.parse_args()
+
+    responses_dir = Path(args.responses_dir).resolve() if args.responses_dir else None
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(FakeOpenAI(responses_dir, args.batch_delay, args.stream_delay))
+    )
+    print(f"Fake OpenAI listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
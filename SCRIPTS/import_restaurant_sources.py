@@ -14,6 +14,8 @@ def load_restaurants(sources_dir: Path):
         restaurant_id = path.stem
         payload["restaurant_id"] = restaurant_id
         payload["sk"] = "INFO"
+        # Sparse key for the restaurant_directory GSI; only INFO items have it.
+        payload["directory"] = "INFO"
         restaurants.append(payload)
     return restaurants
 
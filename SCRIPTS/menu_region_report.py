@@ -0,0 +1,76 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "BACKEND" / "lambdas"))
+
+from parse_html import index as parse_html  # noqa: E402
+from parse_html import menu_region  # noqa: E402
+
+
+def load_pages(sources_dir: Path, fixtures_dir: Path, live: bool):
+    pages = []
+    seen = set()
+    for path in sorted(sources_dir.glob("*.json")):
+        restaurant_id = path.stem
+        seen.add(restaurant_id)
+        fixture = fixtures_dir / f"{restaurant_id}.html"
+        if fixture.exists():
+            pages.append((restaurant_id, fixture.read_text(encoding="utf-8", errors="replace")))
+            continue
+        if not live:
+            pages.append((restaurant_id, None))
+            continue
+        with path.open("r", encoding="utf-8") as handle:
+            url = json.load(handle).get("url")
+        try:
+            pages.append((restaurant_id, parse_html.fetch_html(url) if url else None))
+        except Exception:
+            pages.append((restaurant_id, None))
+    for fixture in sorted(fixtures_dir.glob("*.html")):
+        if fixture.stem not in seen:
+            pages.append((fixture.stem, fixture.read_text(encoding="utf-8", errors="replace")))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sources-dir",
+        default="RestaurantSources",
+        help="Path to Restaurant Sources directory",
+    )
+    parser.add_argument(
+        "--fixtures-dir",
+        default="SCRIPTS/fixtures/html",
+        help="Folder with saved pages named {restaurant_id}.html",
+    )
+    parser.add_argument("--live", action="store_true", help="Fetch pages without a fixture")
+    args = parser.parse_args()
+
+    sources_dir = (ROOT / args.sources_dir).resolve()
+    fixtures_dir = (ROOT / args.fixtures_dir).resolve()
+
+    print(f"{'restaurant_id':24} {'full_tok':>9} {'region_tok':>10} {'saved_%':>8}  reason")
+    total_full = 0
+    total_region = 0
+    for restaurant_id, html in load_pages(sources_dir, fixtures_dir, args.live):
+        if html is None:
+            print(f"{restaurant_id[:24]:24} {'-':>9} {'-':>10} {'-':>8}  no page")
+            continue
+        report = menu_region.extract_menu_region(parse_html.sanitize_html_blocks(html))["report"]
+        total_full += report["full_tokens_est"]
+        total_region += report["region_tokens_est"]
+        print(
+            f"{restaurant_id[:24]:24} {report['full_tokens_est']:9d} {report['region_tokens_est']:10d} "
+            f"{report['token_reduction_pct']:8.1f}  {report['reason']}"
+        )
+    if total_full:
+        saved = 100 * (1 - total_region / total_full)
+        print(f"{'TOTAL':24} {total_full:9d} {total_region:10d} {saved:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
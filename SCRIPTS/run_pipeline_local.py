@@ -0,0 +1,300 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "BACKEND" / "lambdas"))
+sys.path.insert(0, str(ROOT / "SCRIPTS"))
+
+# The Lambda modules create boto3 clients at import time; nothing here calls AWS.
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-north-1")
+
+import fake_openai_server  # noqa: E402
+from import_to_ddb import index as import_to_ddb  # noqa: E402
+from parse_html import index as parse_html  # noqa: E402
+from parse_html import rule_parsers  # noqa: E402
+from parse_image import preprocess  # noqa: E402
+from shared import date_utils  # noqa: E402
+from shared import openai_client  # noqa: E402
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".pdf")
+STAGES = ("load", "sanitize", "region", "preprocess", "openai", "validate", "import")
+
+
+class LocalTable:
+    """DynamoDB stand-in: one JSON file of items per restaurant."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, restaurant_id: str) -> Path:
+        return self.root / f"{restaurant_id}.json"
+
+    def get_items(self, restaurant_id: str) -> dict:
+        path = self._path(restaurant_id)
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def put_items(self, restaurant_id: str, items: dict):
+        self._path(restaurant_id).write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+class LocalBucket:
+    """S3 stand-in: objects are files under root, keyed like the real bucket."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def put_text(self, key: str, text: str):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+
+def load_sources(sources_dir: Path) -> dict:
+    sources = {}
+    for path in sorted(sources_dir.glob("*.json")):
+        with path.open("r", encoding="utf-8") as handle:
+            source = json.load(handle)
+        sources[path.stem] = {**source, "restaurant_id": path.stem}
+    return sources
+
+
+def find_fixture(fixtures_dir: Path, restaurant_id: str):
+    html_path = fixtures_dir / "html" / f"{restaurant_id}.html"
+    if html_path.exists():
+        return "html", html_path
+    for suffix in IMAGE_SUFFIXES:
+        image_path = fixtures_dir / "images" / f"{restaurant_id}{suffix}"
+        if image_path.exists():
+            return "image", image_path
+    return None, None
+
+
+def list_restaurants(sources: dict, fixtures_dir: Path, only: set | None) -> list[str]:
+    restaurant_ids = set(sources)
+    # Fixtures without a source file still run, with an empty context.
+    for path in (fixtures_dir / "html").glob("*.html"):
+        restaurant_ids.add(path.stem)
+    for path in (fixtures_dir / "images").glob("*"):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            restaurant_ids.add(path.stem)
+    if only:
+        restaurant_ids &= only
+    return sorted(restaurant_ids)
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+
+
+def parse_html_fixture(html: str, context: dict, parser_name: str | None, timer: StageTimer, report: dict) -> str:
+    restaurant_id = context["restaurant_id"]
+    report["input_bytes"] = len(html.encode("utf-8"))
+    with timer.stage("sanitize"):
+        blocks = parse_html.sanitize_html_blocks(html)
+    if parser_name:
+        with timer.stage("region"):
+            csv_content = rule_parsers.parse_with_rules(parser_name, blocks, restaurant_id)
+        if csv_content:
+            report["path"] = f"rules:{parser_name}"
+            return csv_content
+    with timer.stage("region"):
+        markdown = parse_html.prepare_markdown(blocks, restaurant_id)
+    report["path"] = "html"
+    report["prompt_tokens_est"] = openai_client.estimate_tokens(markdown)
+    with timer.stage("openai"):
+        return openai_client.parse_html_to_csv(markdown, context)
+
+
+def parse_image_fixture(binary: bytes, context: dict, timer: StageTimer, report: dict) -> str:
+    report["input_bytes"] = len(binary)
+    with timer.stage("preprocess"):
+        prepared = preprocess.prepare_upload(binary)
+    report["path"] = f"image:{prepared['report'].get('path')}"
+    with timer.stage("openai"):
+        if prepared["text"]:
+            report["prompt_tokens_est"] = openai_client.estimate_tokens(prepared["text"])
+            return openai_client.parse_html_to_csv(prepared["text"], context)
+        return openai_client.parse_image_to_csv(binary, context, prepared["images"])
+
+
+def compare_items(previous: dict, items: dict) -> str:
+    if not previous:
+        return "new"
+    same = previous.keys() == items.keys() and all(
+        previous[sk].get("dishes_hash") == item["dishes_hash"] for sk, item in items.items()
+    )
+    return "same" if same else "changed"
+
+
+def run_restaurant(restaurant_id: str, source: dict, args, table: LocalTable, bucket: LocalBucket) -> dict:
+    timer = StageTimer()
+    report = {"restaurant_id": restaurant_id, "status": "ok"}
+    context = {
+        "restaurant_id": restaurant_id,
+        "restaurant_url": source.get("url", ""),
+        "city": source.get("city", ""),
+        "area": source.get("area", ""),
+    }
+    openai_client.reset_request_stats()
+    if args.memory:
+        tracemalloc.start()
+    try:
+        with timer.stage("load"):
+            kind, path = find_fixture(args.fixtures_dir, restaurant_id)
+            if kind is None and args.live and source.get("url"):
+                kind, content = "html", parse_html.fetch_html(source["url"])
+            elif kind == "html":
+                content = path.read_text(encoding="utf-8", errors="replace")
+            elif kind == "image":
+                content = path.read_bytes()
+        if kind is None:
+            report["status"] = "no fixture"
+            return report
+
+        if kind == "html":
+            csv_content = parse_html_fixture(content, context, source.get("parser"), timer, report)
+        else:
+            csv_content = parse_image_fixture(content, context, timer, report)
+
+        with timer.stage("validate"):
+            openai_client.validate_csv_response(csv_content, restaurant_id)
+
+        with timer.stage("import"):
+            weekly_key = date_utils.build_weekly_key(restaurant_id)
+            bucket.put_text(weekly_key, csv_content)
+            weekly_info = date_utils.parse_weekly_key(weekly_key)
+            week = f"{weekly_info['year']}_{weekly_info['week']}"
+            rows = import_to_ddb.parse_csv(csv_content)
+            items = import_to_ddb.build_menu_items(
+                rows, restaurant_id, week, context["city"] or None, context["area"] or None
+            )
+            report["rows"] = len(rows)
+            report["result"] = compare_items(table.get_items(restaurant_id), items)
+            table.put_items(restaurant_id, items)
+    except Exception as exc:
+        report["status"] = "failed"
+        report["error"] = f"{type(exc).__name__}: {exc}"
+    finally:
+        if args.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report["peak_kb"] = round(peak / 1024)
+        stats = openai_client.get_request_stats()
+        report["request_bytes"] = stats.get("request_bytes", 0)
+        report["input_tokens"] = stats.get("input_tokens", 0)
+        report["output_tokens"] = stats.get("output_tokens", 0)
+        report["output_tokens_saved"] = stats.get("output_tokens_saved", 0)
+        report["stage_ms"] = {name: round(seconds * 1000, 1) for name, seconds in timer.seconds.items()}
+        report["total_ms"] = round(sum(timer.seconds.values()) * 1000, 1)
+    return report
+
+
+def print_report(reports: list[dict]):
+    stage_columns = " ".join(f"{stage + '_ms':>13}" for stage in STAGES)
+    print(
+        f"{'restaurant_id':24} {'path':18} {'status':10} {'result':8} {'in_kb':>7} {'req_kb':>7} "
+        f"{'in_tok':>7} {'out_tok':>7} {'saved_tok':>9} {'peak_kb':>8} {stage_columns} {'total_ms':>9}"
+    )
+    for report in reports:
+        stages = " ".join(f"{report.get('stage_ms', {}).get(stage, 0):13.1f}" for stage in STAGES)
+        print(
+            f"{report['restaurant_id'][:24]:24} {report.get('path', '-')[:18]:18} {report['status'][:10]:10} "
+            f"{report.get('result', '-'):8} {report.get('input_bytes', 0) / 1024:7.1f} "
+            f"{report.get('request_bytes', 0) / 1024:7.1f} {report.get('input_tokens', 0):7d} "
+            f"{report.get('output_tokens', 0):7d} {report.get('output_tokens_saved', 0):9d} {report.get('peak_kb', 0):8d} {stages} "
+            f"{report.get('total_ms', 0):9.1f}"
+        )
+        if report.get("error"):
+            print(f"  {report['error']}")
+    ran = [report for report in reports if report["status"] != "no fixture"]
+    if ran:
+        print(
+            f"{len(ran)} restaurants, {sum(report['total_ms'] for report in ran) / 1000:.2f} s, "
+            f"{sum(report['input_tokens'] for report in ran)} input / "
+            f"{sum(report['output_tokens'] for report in ran)} output tokens "
+            f"({sum(report['output_tokens_saved'] for report in ran)} saved by compact CSV), "
+            f"{sum(report['status'] == 'failed' for report in ran)} failed, "
+            f"{sum(report.get('result') == 'changed' for report in ran)} changed"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sources-dir",
+        default="RestaurantSources",
+        help="Path to Restaurant Sources directory",
+    )
+    parser.add_argument(
+        "--fixtures-dir",
+        default="SCRIPTS/fixtures",
+        help="Folder with html/{restaurant_id}.html and images/{restaurant_id}.(jpg|png|pdf|...)",
+    )
+    parser.add_argument(
+        "--responses-dir",
+        default="SCRIPTS/fixtures/responses",
+        help="Recorded OpenAI CSV responses named {restaurant_id}.csv",
+    )
+    parser.add_argument("--out-dir", default=".pipeline-run", help="Local S3/DynamoDB stand-ins and logs")
+    parser.add_argument("--only", nargs="*", help="Only run these restaurant ids")
+    parser.add_argument("--live", action="store_true", help="Fetch pages that have no fixture")
+    parser.add_argument("--cache", action="store_true", help="Use a local parse cache under --out-dir")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip tracemalloc (faster timings)")
+    parser.add_argument("--json", help="Also write the report as JSON to this path")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if any output changed since the last run")
+    parser.add_argument("--verbose", action="store_true", help="Print Lambda logs instead of writing them to --out-dir")
+    args = parser.parse_args()
+
+    args.fixtures_dir = (ROOT / args.fixtures_dir).resolve()
+    responses_dir = (ROOT / args.responses_dir).resolve()
+    out_dir = (ROOT / args.out_dir).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    server = fake_openai_server.start_server(responses_dir=responses_dir if responses_dir.is_dir() else None)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["OPENAI_API_KEY"] = "dry-run"
+    os.environ["CACHE_BACKEND"] = "local" if args.cache else "none"
+    os.environ["CACHE_DIR"] = str(out_dir / "cache")
+
+    sources = load_sources((ROOT / args.sources_dir).resolve())
+    table = LocalTable(out_dir / "dynamodb")
+    bucket = LocalBucket(out_dir / "s3")
+    reports = []
+    with open(out_dir / "pipeline.log", "w", encoding="utf-8") as log:
+        for restaurant_id in list_restaurants(sources, args.fixtures_dir, set(args.only or []) or None):
+            with contextlib.ExitStack() as stack:
+                if not args.verbose:
+                    stack.enter_context(contextlib.redirect_stdout(log))
+                reports.append(run_restaurant(restaurant_id, sources.get(restaurant_id, {}), args, table, bucket))
+    server.shutdown()
+
+    print_report(reports)
+    print(f"Outputs and logs in {out_dir}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2), encoding="utf-8")
+    if any(report["status"] == "failed" for report in reports):
+        raise SystemExit(1)
+    if args.check and any(report.get("result") == "changed" for report in reports):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()